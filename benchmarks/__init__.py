@@ -0,0 +1 @@
+"""Offline benchmark suite for fetching, persistence, aggregation and rendering."""
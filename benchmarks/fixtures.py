@@ -0,0 +1,50 @@
+"""Benchmark datasets: the bundled JSON fixtures and synthetic copies scaled from them."""
+import os
+
+import numpy as np
+import pandas as pd
+
+from tariffline.storage import export_json, load_json, save_parquet
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIXTURES = {
+    'tariff_data': os.path.join(REPO_DIR, 'tariff_data.json'),
+    'tariff_data_310520': os.path.join(REPO_DIR, 'tariff_data_310520_20250402_171559.json'),
+}
+
+MEASURE_COLUMNS = ['qty', 'altQty', 'netWgt', 'grossWgt', 'cifvalue', 'fobvalue', 'primaryValue']
+
+
+def load_fixture(name):
+    """Rows and metadata of a bundled fixture."""
+    return load_json(FIXTURES[name])
+
+
+def synthesize(base_df, scale, seed=0):
+    """
+    ``base_df`` repeated ``scale`` times, as if ``scale`` reporters had published it.
+
+    Every copy gets its own reporter code and log-normally jittered measures, so
+    aggregations see more distinct cells and cannot be short-circuited by duplicates.
+    """
+    if scale == 1:
+        return base_df.copy()
+    rng = np.random.default_rng(seed)
+    data_df = pd.concat([base_df] * scale, ignore_index=True)
+    copy_index = np.repeat(np.arange(scale), len(base_df))
+    data_df['reporterCode'] = data_df['reporterCode'].to_numpy() + copy_index * 1000
+    for column in MEASURE_COLUMNS:
+        if column in data_df.columns:
+            data_df[column] = data_df[column] * rng.lognormal(0.0, 0.1, len(data_df))
+    return data_df
+
+
+def write_dataset(data_df, directory, name, metadata=None):
+    """Write ``data_df`` as both legacy JSON and Parquet; returns the two paths."""
+    json_path = os.path.join(directory, f'{name}.json')
+    parquet_path = os.path.join(directory, f'{name}.parquet')
+    export_json(data_df, json_path, metadata)
+    save_parquet(data_df, parquet_path, metadata)
+    return json_path, parquet_path
@@ -0,0 +1,281 @@
+"""
+Run the benchmark suite and write the timings to a JSON file.
+
+    python -m benchmarks.run --scales 1 10 100 --out benchmark_results.json
+    python -m benchmarks.run --compare baseline.json
+
+Everything runs offline: datasets come from the bundled fixtures (scaled
+synthetically) and fetches go to a local fake Comtrade endpoint.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow
+
+from benchmarks.fixtures import FIXTURES, REPO_DIR, load_fixture, synthesize, write_dataset
+from tariffline.aggregations import (commodity_rollup, monthly_average, partner_yearly_weight, value_over_time,
+                                    yearly_value)
+from tariffline.charts import EXPORT_DPI, SCREEN_DPI, render_png
+from tariffline.analytics import PartnerAnalytics
+from tariffline.client import ComtradeClient
+from tariffline.cube import CUBE_COLUMNS, TariffCube
+from tariffline.downsample import DEFAULT_POINT_BUDGET, downsample
+from tariffline.exports import available_formats, write_export
+from tariffline.fakeapi import FakeComtradeServer
+from tariffline.fetch import AUTO_CHUNK, fetch_tariff_lines
+from tariffline.periods import period_range
+from tariffline.replay import ReplayClient, replay_scheduler
+from tariffline.schema import memory_per_row
+from tariffline.scheduler import RequestScheduler
+from tariffline.storage import build_arrow_file, dataset_head, load_dataset, load_mapped
+
+
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_REPEAT = 5
+DEFAULT_LATENCY = 0.05
+DEFAULT_WORKERS = (1, 4, 8)
+FETCH_PERIODS = period_range(202201, 202312)
+FETCH_CHUNKS = ('month', AUTO_CHUNK)
+
+# Benchmarks slower than baseline by more than this factor are reported as regressions
+DEFAULT_THRESHOLD = 1.25
+
+BASE_FIXTURE = 'tariff_data_310520'
+
+
+def measure(fn, repeat):
+    """Run ``fn`` once untimed, then ``repeat`` times; returns timing statistics and the last result."""
+    times = []
+    result = fn()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    stats = {
+        'repeat': repeat,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.mean(times),
+    }
+    return stats, result
+
+
+class Suite:
+    def __init__(self, repeat=DEFAULT_REPEAT, verbose=True):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = []
+
+    def run(self, group, name, fn, repeat=None, **fields):
+        stats, result = measure(fn, repeat or self.repeat)
+        record = {'group': group, 'name': name, **fields, **stats}
+        self.results.append(record)
+        if self.verbose:
+            params = ' '.join(f'{k}={v}' for k, v in fields.items())
+            print(f"{group:<10} {name:<28} {params:<40} median {stats['median_s'] * 1000:10.2f} ms", flush=True)
+        return result
+
+
+def bench_load(suite, directory, scale, data_df):
+    json_path, parquet_path = write_dataset(data_df, directory, f'scale_{scale}')
+    fields = {'scale': scale, 'rows': len(data_df)}
+    loaded, _ = suite.run('load', 'json', lambda: load_dataset(json_path), json_bytes=os.path.getsize(json_path),
+                          **fields)
+    suite.results[-1]['bytes_per_row'] = memory_per_row(loaded)
+    loaded, _ = suite.run('load', 'parquet', lambda: load_dataset(parquet_path),
+                          parquet_bytes=os.path.getsize(parquet_path), **fields)
+    suite.results[-1]['bytes_per_row'] = memory_per_row(loaded)
+    suite.run('load', 'parquet_cube_columns', lambda: load_dataset(parquet_path, columns=CUBE_COLUMNS), **fields)
+    arrow_bytes = os.path.getsize(build_arrow_file(parquet_path))
+    suite.run('load', 'arrow_mapped', lambda: load_mapped(parquet_path), arrow_bytes=arrow_bytes, **fields)
+    suite.run('load', 'head_10', lambda: dataset_head(parquet_path, 10), **fields)
+
+
+def bench_aggregate(suite, scale, data_df):
+    fields = {'scale': scale, 'rows': len(data_df)}
+
+    # The per-view pandas groupby the app ran on every rerun before the cube existed
+    def groupby_year_partner():
+        years = pd.to_datetime(data_df['period'].astype(str), format='%Y%m').dt.year
+        return data_df.assign(year=years).groupby(['year', 'partnerDesc'])['netWgt'].sum()
+
+    suite.run('aggregate', 'groupby_year_partner', groupby_year_partner, **fields)
+    cube = suite.run('aggregate', 'cube_build', lambda: TariffCube.build(data_df), **fields)
+    suite.run('aggregate', 'partner_yearly_weight', lambda: partner_yearly_weight(cube), cells=len(cube), **fields)
+    suite.run('aggregate', 'yearly_value', lambda: yearly_value(cube), cells=len(cube), **fields)
+    suite.run('aggregate', 'monthly_average', lambda: monthly_average(cube), cells=len(cube), **fields)
+    suite.run('aggregate', 'value_over_time', lambda: value_over_time(cube, by='partner'), cells=len(cube),
+              **fields)
+    suite.run('aggregate', 'commodity_rollup', lambda: commodity_rollup(cube, level='heading'), cells=len(cube),
+              **fields)
+    analytics = suite.run('aggregate', 'partner_analytics_build', lambda: PartnerAnalytics.build(cube),
+                          cells=len(cube), **fields)
+    suite.run('aggregate', 'partner_summary', lambda: analytics.partner_summary(n=10), **fields)
+    suite.run('aggregate', 'concentration', lambda: analytics.concentration(grain='period'), **fields)
+    # Worst case for the chart: one point per raw row
+    series = pd.Series(data_df['primaryValue'].to_numpy(dtype=float))
+    suite.run('aggregate', 'downsample_rows', lambda: downsample(series, DEFAULT_POINT_BUDGET), **fields)
+
+
+def bench_export(suite, directory, scale, data_df):
+    fields = {'scale': scale, 'rows': len(data_df)}
+    # What the download buttons built on every rerun before exports were streamed
+    suite.run('export', 'to_csv_bytes', lambda: data_df.to_csv(index=False).encode('utf-8'), **fields)
+    for fmt in available_formats():
+        path = os.path.join(directory, f'export_{scale}.{fmt}')
+        suite.run('export', fmt, lambda: write_export(data_df, path, fmt), **fields)
+        suite.results[-1]['file_bytes'] = os.path.getsize(path)
+
+
+def bench_render(suite, data_df):
+    cube = TariffCube.build(data_df)
+    charts = {
+        'phosphate_imports': partner_yearly_weight(cube),
+        'npk_yearly_trend': yearly_value(cube),
+        'monthly_average': monthly_average(cube),
+        'value_over_time': value_over_time(cube, by='partner'),
+    }
+    for chart, data in charts.items():
+        suite.run('render', chart, lambda: render_png(chart, data, dpi=SCREEN_DPI), dpi=SCREEN_DPI)
+    export_data = charts['phosphate_imports']
+    png = suite.run('render', 'phosphate_imports', lambda: render_png('phosphate_imports', export_data, dpi=EXPORT_DPI),
+                    dpi=EXPORT_DPI)
+    suite.results[-1]['png_bytes'] = len(png)
+
+
+def bench_fetch(suite, data_df, latency, workers, repeat):
+    with FakeComtradeServer(data_df, latency=latency) as server:
+        api = ComtradeClient(base_url=server.url)
+        for chunk in FETCH_CHUNKS:
+            for max_workers in workers:
+                scheduler = RequestScheduler(rate=1000, capacity=1000, max_retries=0)
+                fetched, _ = suite.run(
+                    'fetch', 'fetch_tariff_lines',
+                    lambda: fetch_tariff_lines(api, 'benchmark', FETCH_PERIODS, '310520', chunk=chunk,
+                                               max_workers=max_workers, scheduler=scheduler),
+                    repeat=repeat, chunk=chunk, workers=max_workers, latency_s=latency, periods=len(FETCH_PERIODS)
+                )
+                record = suite.results[-1]
+                record['rows'] = len(fetched)
+                record['rows_per_s'] = len(fetched) / record['median_s']
+
+    # The same requests answered in-process by the replay client, without HTTP
+    replay = ReplayClient(seeds=[data_df], latency=latency)
+    for max_workers in workers:
+        fetched, _ = suite.run(
+            'fetch', 'replay_fetch',
+            lambda: fetch_tariff_lines(replay, 'benchmark', FETCH_PERIODS, '310520', max_workers=max_workers,
+                                       scheduler=replay_scheduler()),
+            repeat=repeat, workers=max_workers, latency_s=latency, periods=len(FETCH_PERIODS)
+        )
+        suite.results[-1]['rows_per_s'] = len(fetched) / suite.results[-1]['median_s']
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pyarrow.__version__,
+    }
+
+
+def result_key(record):
+    return tuple(sorted((k, v) for k, v in record.items()
+                        if k in ('group', 'name', 'fixture', 'scale', 'dpi', 'chunk', 'workers', 'latency_s')))
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Print median ratios against ``baseline``; returns the records slower than ``threshold``."""
+    previous = {result_key(record): record for record in baseline['results']}
+    regressions = []
+    for record in results:
+        old = previous.get(result_key(record))
+        if old is None:
+            continue
+        ratio = record['median_s'] / old['median_s'] if old['median_s'] else float('inf')
+        flag = ' REGRESSION' if ratio > threshold else ''
+        params = ' '.join(f'{k}={v}' for k, v in result_key(record) if k not in ('group', 'name'))
+        print(f"{record['group']:<10} {record['name']:<28} {params:<30} {ratio:6.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(record)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the tariff-line pipeline")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help="synthetic dataset sizes as multiples of the bundled fixture (e.g. 1 10 100 1000)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed runs per benchmark")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help="fake endpoint latency, seconds")
+    parser.add_argument('--workers', type=int, nargs='+', default=list(DEFAULT_WORKERS),
+                        help="concurrency levels for the fetch benchmark")
+    parser.add_argument('--groups', nargs='+', choices=('load', 'aggregate', 'export', 'render', 'fetch'),
+                        default=['load', 'aggregate', 'export', 'render', 'fetch'])
+    parser.add_argument('--out', default='benchmark_results.json', help="results file")
+    parser.add_argument('--compare', metavar='BASELINE', help="results file of a previous run to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown factor reported as a regression")
+    args = parser.parse_args(argv)
+
+    suite = Suite(repeat=args.repeat)
+    base_df, _ = load_fixture(BASE_FIXTURE)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if 'load' in args.groups:
+            # The bundled files exactly as shipped
+            for name, path in FIXTURES.items():
+                suite.run('load', 'json_fixture', lambda: load_dataset(path), fixture=name,
+                          json_bytes=os.path.getsize(path))
+        for scale in args.scales:
+            data_df = synthesize(base_df, scale)
+            if 'load' in args.groups:
+                bench_load(suite, directory, scale, data_df)
+            if 'aggregate' in args.groups:
+                bench_aggregate(suite, scale, data_df)
+            if 'export' in args.groups:
+                bench_export(suite, directory, scale, data_df)
+            del data_df
+    if 'render' in args.groups:
+        bench_render(suite, base_df)
+    if 'fetch' in args.groups:
+        bench_fetch(suite, base_df, args.latency, args.workers, repeat=max(1, min(args.repeat, 3)))
+
+    output = {
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'environment': environment(),
+        'parameters': {k: getattr(args, k) for k in ('scales', 'repeat', 'latency', 'workers', 'groups')},
+        'results': suite.results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=4)
+    print(f"Results saved: {args.out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(suite.results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
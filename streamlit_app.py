@@ -1,50 +1,79 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-import comtradeapicall
 import time
 import json
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import io
+import os
+import threading
+
+from tariffline.aggregations import aggregate, dataset_fingerprint, value_summary, yearly_value
+from tariffline.analytics import PartnerAnalytics
+from tariffline.cache import DEFAULT_RECENT_TTL, PeriodCache
+from tariffline.client import ComtradeClient
+from tariffline.cube import TariffCube, load_cube
+from tariffline.charts import EXPORT_DPI, SCREEN_DPI, render_png
+from tariffline.downsample import downsample
+from tariffline.exports import FORMATS, available_formats, export_file
+from tariffline.hs import LEVELS, HSIndex
+from tariffline.fetch import AUTO_CHUNK, CHUNK_SIZES, DEFAULT_MAX_WORKERS, DEFAULT_QUERY, size_periods
+from tariffline.jobs import JobManager
+from tariffline.pipeline import fetch_to_file, publish_dataset, run_plan_to_file
+from tariffline.planner import plan_batch, plan_summary, size_plan, sized_calls
+from tariffline.profiling import Profiler, activate
+from tariffline.replay import (API_MODES, DEFAULT_ARCHIVE_DIR, RecordingClient, ReplayClient, ResponseArchive,
+                               replay_scheduler)
+from tariffline.schema import PERIOD_DATE, period_dates
+from tariffline.snapshots import SnapshotStore, fetch_query
+from tariffline.scheduler import SUBSCRIPTION_TIERS, RequestScheduler
+from tariffline.sizing import ProbeCache
+from tariffline.storage import dataset_head, export_json, load_dataset, load_mapped, read_metadata
+from tariffline.sync import DEFAULT_REVISION_MONTHS, WATERMARKS_KEY, incremental_sync, synced_periods
 
 
 # Встановлення фіксованої назви файлу
+DATA_FILENAME = 'tariff_data.parquet'
+# JSON залишається як формат експорту та для старих збережених даних
 JSON_FILENAME = 'tariff_data.json'
+# Результати пакетних запитів зберігаються окремо від основного набору даних
+BATCH_FILENAME = 'batch_data.parquet'
+
+# Максимальна кількість збережених результатів агрегацій
+AGGREGATION_CACHE_ENTRIES = 128
+# Максимальна кількість збережених зображень графіків
+FIGURE_CACHE_ENTRIES = 32
+# Максимальна кількість кубів агрегацій у пам'яті
+CUBE_CACHE_ENTRIES = 8
+# Як часто (у секундах) сторінка перевіряє стан фонового завдання
+JOB_POLL_SECONDS = 1.0
+# Скільки останніх знімків даних показувати у списку збережених даних
+SNAPSHOT_PICKER_ENTRIES = 50
+# Значення у списку збережених даних, що означає основний збережений набір
+SAVED_DATASET = 'saved'
+# Максимальна кількість відкритих (відображених у пам'ять) наборів даних
+MAPPED_DATASET_ENTRIES = 8
+# Максимальна кількість точок на лінію графіка; довші ряди проріджуються (LTTB)
+CHART_POINT_BUDGET = 500
+# Кількість країн-партнерів, що показуються окремими лініями
+TOP_SERIES = 5
+# Максимальна кількість результатів пошуку товарних кодів HS
+HS_SEARCH_RESULTS = 20
+# Як довго (у секундах) знімок отримання даних використовується замість нового запиту до API;
+# як і в кеші періодів, недавні місяці можуть бути переглянуті
+SNAPSHOT_REUSE_SECONDS = DEFAULT_RECENT_TTL
+# Набір даних, з якого режим відтворення відповідає на запити, що не були записані
+REPLAY_SEED = 'tariff_data_310520_20250402_171559.json'
 
 
-def display_phosphate_imports(data_df):
+def display_phosphate_imports(data_df, dataset_key):
     st.subheader("Щомісячна візуалізація даних")
     
-    # Перетворення періоду в дату та додавання колонки року
-    data_df['date'] = pd.to_datetime(data_df['period'].astype(str), format='%Y%m')
-    data_df['year'] = data_df['date'].dt.year
-    
-    # Визначаємо топ-3 країни-партнерів за вартістю імпорту
-    partner_value = data_df.groupby('partnerDesc')['primaryValue'].sum().sort_values(ascending=False)
-    top3_countries = partner_value.head(3).index.tolist()
-    
-    # Створюємо новий DataFrame для аналізу за роками
-    yearly_data = data_df.groupby(['year', 'partnerDesc'])['netWgt'].sum().reset_index()
-    
-    # Конвертуємо кг в тис. тонн
-    yearly_data['netWgt_thousand_tons'] = yearly_data['netWgt'] / 1000
-    
-    # Фільтруємо дані лише для топ-3 країн
-    yearly_data_filtered = yearly_data[yearly_data['partnerDesc'].isin(top3_countries)]
-    
-    # Отримуємо унікальні роки для осі X
-    years = sorted(data_df['year'].unique())
-    
-    # Створюємо фігуру для графіка
-    fig, ax = plt.subplots(figsize=(10, 6), facecolor='white')
-    
-    # Налаштування фону графіка
-    ax.set_facecolor('white')
-    
-    # Параметри сітки
-    ax.grid(True, linestyle='--', alpha=0.3, axis='y')
+    # Річна вага імпорту (тис. тонн) для топ-3 країн-партнерів за вартістю,
+    # з аналітики набору даних, що рахується один раз і спільна для всіх вкладок
+    analytics = dataset_analytics(dataset_key, data_df)
+    top3_countries = analytics.top_partners(n=3)
+    yearly_weights = analytics.totals('netWgt', grain='year')[top3_countries] / 1000
     
     # Створюємо мапінг для типів НПК (замість країн)
     npk_types = {
@@ -53,146 +82,227 @@ def display_phosphate_imports(data_df):
         top3_countries[2]: 'NP'    # Третя країна відповідає NP
     }
     
-  
-    # Створюємо словник з кольорами для країн
-    colors = {
-        top3_countries[0]: 'red',
-        top3_countries[1]: 'blue',
-        top3_countries[2]: 'green'
-    }
+    # Показ графіка у Streamlit (зображення рендериться один раз і береться з кешу)
+    st.image(render_chart('phosphate_imports', yearly_weights))
     
+    # Додаємо опцію завантаження графіка; PNG у 300 dpi створюється лише під час завантаження
+    st.download_button(
+        label="Завантажити графік",
+        data=lambda: render_chart('phosphate_imports', yearly_weights, dpi=EXPORT_DPI),
+        file_name="імпорт_фосфатних_добрив_за_типами.png",
+        mime="image/png"
+    )
+
+    # Відображення таблиці з даними
+    if st.checkbox("Показати дані у табличному форматі"):
+        st.write("Дані про імпорт фосфатних добрив (тис. тонн):")
+        # Перейменовуємо колонки з назв країн на типи добрив
+        pivot_table = yearly_weights.rename(columns=npk_types)
+        st.dataframe(pivot_table)
+
+
+# Function to compare commodities rolled up to a level of the HS hierarchy (chapter, heading or subheading)
+def display_commodity_rollup(data_df, dataset_key, key):
+    col1, col2 = st.columns(2)
+    level = col1.radio("HS level", list(LEVELS), index=1, horizontal=True, key=f'{key}_hs_level',
+                       format_func=lambda x: x.capitalize())
+    measure = col2.radio("Measure", ['primaryValue', 'netWgt'], horizontal=True, key=f'{key}_hs_measure',
+                         format_func=lambda x: "Value (USD)" if x == 'primaryValue' else "Net weight (kg)")
     
-    # Налаштування осей
-    max_value = yearly_data_filtered['netWgt_thousand_tons'].max() * 1.2
-    ax.set_ylim(0, max_value)
+    # Rolled up from the dataset cube by code prefix, without further API calls
+    table = cached_aggregate(dataset_key, 'commodity_rollup', data_df, level=level)
+    if table.empty:
+        st.info("No commodity data to roll up")
+        return
+    yearly = table[measure].unstack('year').fillna(0)
+    yearly.index = [get_hs_index().label(code) for code in yearly.index]
+    st.dataframe(yearly)
+    st.bar_chart(yearly.T)
+
+# Function to show top partners, market shares, growth, unit values and concentration of a dataset
+def display_partner_analytics(analytics, key):
+    if not len(analytics.partners):
+        st.info("No partner data to analyze")
+        return
     
-   
-    # Додаємо лінії для кожної країни
-    for country in top3_countries:
-        country_data = yearly_data_filtered[yearly_data_filtered['partnerDesc'] == country]
-        data_by_year = country_data.set_index('year')['netWgt_thousand_tons']
-        
-        # Додаємо дані для всіх років (навіть тих, де немає імпорту)
-        all_years_data = pd.Series(index=years, dtype=float)
-        all_years_data.update(data_by_year)
-        all_years_data = all_years_data.fillna(0)
-        
-        # Побудова лінії
-        ax.plot(
-            years, 
-            all_years_data.values, 
-            color=colors[country], 
-            linewidth=2, 
-            marker='o',
-            markersize=6,
-            label=country  # Використовуємо назви країни
-        )
+    col1, col2 = st.columns(2)
+    n = col1.slider("Top partners", min_value=3, max_value=15, value=TOP_SERIES, key=f'{key}_top_partners')
+    measure = col2.radio("Rank by", ['primaryValue', 'netWgt'], horizontal=True, key=f'{key}_rank_by',
+                         format_func=lambda x: "Value" if x == 'primaryValue' else "Weight")
+    percent = st.column_config.NumberColumn(format='percent')
     
-    # Налаштування розмітки осі X (роки)
-    ax.set_xticks(years)
+    st.subheader("Top Partners")
+    st.dataframe(analytics.partner_summary(n=n, measure=measure), column_config={
+        'primaryValue': st.column_config.NumberColumn("Value (USD)", format='dollar'),
+        'netWgt': st.column_config.NumberColumn("Net weight (kg)", format='localized'),
+        'share': st.column_config.NumberColumn("Share", format='percent'),
+        'unitValue': st.column_config.NumberColumn("Unit value (USD/kg)", format='%.3f'),
+        'growthLastYear': st.column_config.NumberColumn("Growth, last year", format='percent'),
+    })
     
-    # Додавання заголовка українською
-    ax.set_title('ІМПОРТ ФОСФАТНИХ ДОБРИВ ДО  УКРАЇНА', fontsize=14, fontweight='bold', color='black')
+    # Shares of the partners that are in the top of any group
+    top = analytics.top_partners(n=n, measure=measure)
+    if analytics.by is not None:
+        top = list(dict.fromkeys(partner for partners in top.values() for partner in partners))
+    st.subheader("Market Shares by Year")
+    st.dataframe(analytics.shares(measure, grain='year')[top],
+                 column_config={partner: percent for partner in top})
     
-    # Додавання підписів осей українською
-    ax.set_ylabel('тис. тонн', fontsize=12, color='black')
-    ax.set_xlabel('Рік', fontsize=12, color='black')
+    st.subheader("Growth and Concentration by Year")
+    yearly = pd.DataFrame({
+        'Value (USD)': analytics.totals(grain='year', by_partner=False)['Total'],
+        'YoY growth': analytics.growth(grain='year')['Total'],
+        'Unit value (USD/kg)': analytics.unit_values(grain='year', by_partner=False)['Total'],
+        'HHI': analytics.concentration(measure, grain='year'),
+    })
+    st.dataframe(yearly, column_config={'YoY growth': percent, 'HHI': st.column_config.NumberColumn(format='%.0f')})
     
-    # Прибираємо рамку навколо графіка для мінімалістичного дизайну
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
+    # Herfindahl-Hirschman index per month: above 2500 the imports are highly concentrated
+    hhi = analytics.concentration(measure, grain='period')
+    if analytics.by is not None:
+        hhi = hhi.unstack(analytics.by)
+    st.line_chart(hhi.set_axis(period_dates(hhi.index)), x_label='Date', y_label='HHI')
     
-    # Додавання легенди
-    ax.legend(loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=3, frameon=False)
+    st.subheader("Last 12 Months")
+    monthly = pd.DataFrame({
+        'Value (USD)': analytics.totals(by_partner=False)['Total'],
+        'MoM growth': analytics.growth(grain='period', lag=1)['Total'],
+        'YoY growth': analytics.growth(grain='period')['Total'],
+    })
+    st.dataframe(monthly[monthly.index.get_level_values('period') >= analytics.periods[-12:].min()],
+                 column_config={'MoM growth': percent, 'YoY growth': percent})
+
+
+# Function to offer a dataset for download. The file is written in chunks on the first click and
+# kept in the export cache, so reruns cost nothing and repeated downloads are served from disk.
+def display_export_download(data_df, dataset_key, file_stem, key):
+    formats = available_formats()
+    col1, col2 = st.columns([1, 3])
+    export_format = col1.selectbox("Export format", formats, format_func=lambda name: FORMATS[name].label,
+                                   key=f'{key}_export_format', label_visibility='collapsed')
     
-    # Налаштування макету для кращого відображення
-    plt.tight_layout()
+    def read_export():
+        with open(export_file(data_df, dataset_key, export_format), 'rb') as f:
+            return f.read()
     
-    # Показ графіка у Streamlit
-    st.pyplot(fig)
+    col2.download_button(
+        label=f"Download data as {FORMATS[export_format].label}",
+        data=read_export,
+        file_name=f'{file_stem}{FORMATS[export_format].suffix}',
+        mime=FORMATS[export_format].mime,
+        key=f'{key}_download',
+    )
+    if len(formats) < len(FORMATS):
+        missing = [fmt.label for fmt in FORMATS.values() if not fmt.available]
+        st.caption(f"Not available (optional packages missing): {', '.join(missing)}")
+
+
+# Function to show the timing spans and memory peak of a profiled run
+def display_performance(profile, key):
+    memory = profile['memory']
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Wall time", f"{profile['wall_s']:.2f} s")
+    col2.metric("Spans", len(profile['spans']))
+    if memory.get('peak_rss_bytes'):
+        col3.metric("Peak memory (RSS)", f"{memory['peak_rss_bytes'] / 2**20:.0f} MB")
     
-    # Додаємо опцію завантаження графіка
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=300, bbox_inches='tight', facecolor='white')
-    buf.seek(0)
+    if profile['summary']:
+        summary = pd.DataFrame.from_dict(profile['summary'], orient='index')
+        summary = summary[['count', 'total_s', 'mean_s', 'max_s']].sort_values('total_s', ascending=False)
+        st.dataframe(summary.rename_axis('span'))
+    else:
+        st.info("No instrumented work ran.")
     
     st.download_button(
-        label="Завантажити графік",
-        data=buf,
-        file_name="імпорт_фосфатних_добрив_за_типами.png",
-        mime="image/png"
+        label="Download profile as JSON",
+        data=json.dumps(profile, indent=4, default=str),
+        file_name='performance_profile.json',
+        mime='application/json',
+        key=f'{key}_json'
     )
 
-    # Відображення таблиці з даними
-    if st.checkbox("Показати дані у табличному форматі"):
-        st.write("Дані про імпорт фосфатних добрив (тис. тонн):")
-        pivot_table = yearly_data_filtered.pivot(index='year', columns='partnerDesc', values='netWgt_thousand_tons').fillna(0)
-        # Перейменовуємо колонки з назв країн на типи добрив
-        pivot_table = pivot_table.rename(columns=npk_types)
-        st.dataframe(pivot_table)
-
 
 # Set page title and configure layout
 st.set_page_config(page_title="UN Comtrade Data Retrieval", layout="wide")
 
+# Timing spans of this script run are collected only while the Performance panel is enabled
+profiler = Profiler() if st.session_state.get('show_performance') else None
+activate(profiler)
+
 # Add a title and description
 st.title("UN Comtrade Tariff Line Data Retriever")
 st.markdown("This app allows you to retrieve tariff line data from the UN Comtrade API for Ukraine imports.")
 
-# Function to get tariff line data with error handling
-def get_tariff_line_data(comtradeapicall, subscription_key, period_string, commodity_code):
-    try:
-        # Start measuring time
+# Function to get tariff line data in a background job; returns the job, which outlives this script run
+def get_tariff_line_data(comtradeapicall, subscription_key, period_string, commodity_code,
+                         chunk='month', max_workers=DEFAULT_MAX_WORKERS, cache=None, json_export=False,
+                         scheduler=None):
+    periods = period_string.split(",")
+    
+    # Cached resources are looked up here: the job runs outside the script thread
+    store = get_snapshot_store()
+    probes = get_probe_cache()
+    # Requests for the same data share one job, whichever session submitted them
+    params = {'commodity_code': commodity_code, 'periods': periods, 'chunk': chunk,
+              'cache': cache is not None, 'json_export': json_export,
+              'api': getattr(comtradeapicall, 'mode', 'live')}
+    query = fetch_query(commodity_code, periods)
+    
+    def work(job):
         start_time = time.time()
+        # A recent complete fetch of the same query by any user is reused without calling the API;
+        # replayed data is never passed off as a live download
+        snapshot = None if params['api'] == 'replay' else store.latest('fetch', query, max_age=SNAPSHOT_REUSE_SECONDS)
+        if (snapshot is not None and snapshot.metadata.get('api') != 'replay'
+                and not snapshot.metadata.get('failed_periods')):
+            publish_dataset(snapshot.path, job.output)
+            if json_export:
+                export_json(load_dataset(job.output)[0], JSON_FILENAME, snapshot.metadata)
+            return {**snapshot.metadata, 'execution_time': time.time() - start_time, 'snapshot_id': snapshot.id,
+                    'reused_snapshot': snapshot.label}
         
-        with st.spinner(f'Fetching data for commodity code {commodity_code}...'):
-            # Execute query
-            panDForig = comtradeapicall._getTarifflineData(
-                subscription_key, 
-                typeCode='C',           # data type 
-                freqCode='M',           # monthly data
-                clCode='HS',            # Harmonized System classification
-                period=period_string,   # time period
-                reporterCode=804,       # Ukraine code in UN Comtrade (804)
-                cmdCode=commodity_code, # specific commodity code
-                flowCode='M',           # trade flow direction (Import)
-                partnerCode=None, 
-                partner2Code=None, 
-                customsCode=None, 
-                motCode=None, 
-                maxRecords=None,
-                format_output='JSON',   # JSON format
-                countOnly=None, 
-                includeDesc=True        # include descriptions
-            )
-        
-        # End time measurement
-        end_time = time.time()
-        execution_time = end_time - start_time
-        
-        # Prepare results
-        results = {
-            'commodity_code': commodity_code,
-            'total_rows': len(panDForig),
-            'execution_time': execution_time,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        def on_progress(done, total, chunk_result):
+            status = "done" if chunk_result.ok else "failed"
+            job.progress(done, total, f"Chunk {chunk_result.period_string} {status} ({done}/{total})")
         
-        # Convert DataFrame to list of dictionaries for serialization
-        data_for_json = panDForig.to_dict(orient='records')
+        # Chunks are appended to the job's own file as they arrive instead of being held in memory
+        results, _ = fetch_to_file(
+            comtradeapicall, subscription_key, periods, commodity_code, job.output, cache=cache,
+            json_path=JSON_FILENAME if json_export else None, chunk=chunk, max_workers=max_workers,
+            on_progress=on_progress, on_rows=job.rows, scheduler=scheduler, probes=probes
+        )
+        # Kept as an immutable snapshot that every user can open later. The saved dataset, which
+        # sync works on, is only replaced when the user asks for it (publish_fetched_dataset)
+        snapshot = store.add(job.output, 'fetch', query, {**results, 'api': params['api']})
+        return {**results, 'snapshot_id': snapshot.id}
+    
+    return get_job_manager().submit('fetch', params, work)
+
+# Function to attach to a finished fetch job: load its dataset and report how the fetch went
+def attach_fetch_job(job):
+    try:
+        if job.error:
+            raise RuntimeError(job.error)
+        results = job.result
+        failed_periods = results['failed_periods']
         
-        # Save to JSON file
-        with open(JSON_FILENAME, 'w', encoding='utf-8') as f:
-            json.dump({
-                'metadata': results,
-                'data': data_for_json
-            }, f, ensure_ascii=False, indent=4)
+        # Build the display DataFrame from the job's file
+        panDForig = load_job_dataset(job.output)
         
         # Show success message
-        st.success(f"Data retrieved successfully for commodity code {commodity_code}")
+        st.success(f"Data retrieved successfully for commodity code {results['commodity_code']}")
+        if results.get('reused_snapshot'):
+            st.info(f"Reused a recent download of the same data, without API calls: {results['reused_snapshot']}")
         st.info(f"Rows retrieved: {results['total_rows']}")
-        st.info(f"Execution time: {execution_time:.2f} seconds")
-        st.info(f"File saved: {JSON_FILENAME}")
+        st.info(f"Execution time: {results['execution_time']:.2f} seconds")
+        if results['cached_periods']:
+            st.info(f"Periods served from local cache: {results['cached_periods']} of {len(job.params['periods'])}")
+        if failed_periods:
+            st.warning(f"Could not retrieve periods: {', '.join(failed_periods)}")
+        st.info(f"Saved as snapshot {results['snapshot_id']}")
+        if job.params['json_export']:
+            st.info(f"JSON export saved: {JSON_FILENAME}")
+        publish_fetched_dataset(job)
         
         return panDForig, results
     
@@ -200,70 +310,321 @@ def get_tariff_line_data(comtradeapicall, subscription_key, period_string, commo
         st.error(f"Error retrieving data: {str(e)}")
         return pd.DataFrame(), {'error': str(e)}
 
-# Function to analyze NPK fertilizer data by year
-def analyze_npk_import_by_year(data_df):
-    # Check if we have the required columns
-    if 'statPeriod' in data_df.columns and 'primaryValue' in data_df.columns:
-        # Convert statPeriod to datetime
-        data_df['date'] = pd.to_datetime(data_df['statPeriod'], format='%Y%m')
-        
-        # Extract year
-        data_df['year'] = data_df['date'].dt.year
-        
-        # Group by year and sum the primaryValue
-        yearly_data = data_df.groupby('year')['primaryValue'].sum().reset_index()
-        
-        return yearly_data
+# Function to offer replacing the saved dataset, which Load Saved Data and Sync New Months use,
+# with the dataset of a finished fetch job
+def publish_fetched_dataset(job):
+    if st.button(f"Use as {DATA_FILENAME}", key=f"publish_{job.id}",
+                 help="Replace the saved dataset, shared by all users, with this result"):
+        with saved_dataset_lock():
+            publish_dataset(job.output, DATA_FILENAME)
+        st.success(f"File saved: {DATA_FILENAME}")
+
+# Function to show the progress and first rows of a running job. The fragment polls on its own,
+# without rerunning the page, and reruns the page once the job has finished so it can attach.
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def display_job_progress(job_id):
+    jobs = get_job_manager()
+    job = jobs.get(job_id)
+    if job is None or not job.active:
+        st.rerun()
+    
+    st.progress(job.progress, text=job.message or f"Job {job.id} is {job.state}...")
+    st.caption(f"Job {job.id}: {job.state}, {job.rows} rows so far, {job.elapsed:.0f} s elapsed. "
+               f"You can keep using the app; the results will appear here when the job is done.")
+    totals = jobs.partial_totals(job_id)
+    if totals is not None and len(totals) > 1:
+        st.line_chart(pd.Series(totals.to_numpy(), index=period_dates(totals.index), name='primaryValue'),
+                      x_label='Date', y_label='Value (USD)')
+    preview = jobs.preview(job_id)
+    if preview is not None:
+        st.dataframe(preview)
+
+# Background job pool shared by all sessions, so identical requests from several users run once
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+# Jobs and sessions that replace the saved dataset take turns
+@st.cache_resource
+def saved_dataset_lock():
+    return threading.Lock()
+
+# Row counts of recent countOnly probes, so a fetch right after its size estimate does not probe again
+@st.cache_resource
+def get_probe_cache():
+    return ProbeCache()
+
+# Store of immutable dataset snapshots shared by all sessions
+@st.cache_resource
+def get_snapshot_store():
+    return SnapshotStore()
+
+# Stored datasets opened through their memory-mapped Arrow copy, one per file version, shared by all
+# sessions without copying. The frames are shared, so views must not modify them in place.
+@st.cache_resource(max_entries=MAPPED_DATASET_ENTRIES, show_spinner=False)
+def mapped_dataset(path, mtime_ns, size):
+    return load_mapped(path)
+
+def open_stored_dataset(path):
+    stat = os.stat(path)
+    return mapped_dataset(path, stat.st_mtime_ns, stat.st_size)
+
+# Job outputs never change once written
+def load_job_dataset(path):
+    return open_stored_dataset(path)[0]
+
+# Function to make this session follow a job across reruns (and page reloads, via the URL)
+def follow_job(job):
+    if job is None:
+        st.session_state.pop('job_id', None)
+        st.query_params.pop('job', None)
     else:
-        return pd.DataFrame()
+        st.session_state['job_id'] = job.id
+        st.query_params['job'] = job.id
 
-# Function to create NPK import trend line chart by year
-def plot_npk_yearly_trend(yearly_data):
-    if not yearly_data.empty:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        
-        # Plot the line
-        ax.plot(yearly_data['year'], yearly_data['primaryValue'], marker='o', linestyle='-', linewidth=2, color='#3366cc')
-        
-        # Add data points and values
-        for x, y in zip(yearly_data['year'], yearly_data['primaryValue']):
-            ax.annotate(f"{y/1000000:.1f}M", 
-                        (x, y),
-                        textcoords="offset points", 
-                        xytext=(0, 10), 
-                        ha='center')
+# Function to get the job this session follows, if any
+def followed_job():
+    job_id = st.session_state.get('job_id') or st.query_params.get('job')
+    return get_job_manager().get(job_id) if job_id else None
+
+# Shared per-period cache of API results, reused across reruns and sessions
+@st.cache_resource
+def get_period_cache():
+    return PeriodCache()
+
+# Aggregation cube of a dataset, built once per dataset content hash and shared across sessions
+@st.cache_resource(max_entries=CUBE_CACHE_ENTRIES, show_spinner=False)
+def dataset_cube(dataset_key, _data_df):
+    return TariffCube.build(_data_df)
+
+# Partner analytics of a dataset (optionally per commodity), built once from its cube and used by every tab
+@st.cache_resource(max_entries=CUBE_CACHE_ENTRIES, show_spinner=False)
+def dataset_analytics(dataset_key, _data_df, by=None):
+    return PartnerAnalytics.build(dataset_cube(dataset_key, _data_df), by=by)
+
+# Cached aggregations keyed on the dataset content hash and the aggregation parameters.
+# The DataFrame argument is not hashed (leading underscore); views are answered from the cube, not the raw rows.
+@st.cache_data(max_entries=AGGREGATION_CACHE_ENTRIES, show_spinner=False)
+def cached_aggregate(dataset_key, name, _data_df, **params):
+    return aggregate(name, dataset_cube(dataset_key, _data_df), **params)
+
+# Descriptive statistics need the raw values, so they are cached separately
+@st.cache_data(max_entries=AGGREGATION_CACHE_ENTRIES, show_spinner=False)
+def cached_value_summary(dataset_key, _data_df):
+    return value_summary(_data_df)
+
+# Content hash of the saved dataset, recomputed only when the file changes
+@st.cache_data(max_entries=8, show_spinner=False)
+def stored_dataset_key(path, mtime_ns, size):
+    return dataset_fingerprint(mapped_dataset(path, mtime_ns, size)[0])
+
+def stored_data_key(path):
+    stat = os.stat(path)
+    return stored_dataset_key(path, stat.st_mtime_ns, stat.st_size)
+
+# Shared request scheduler per subscription tier, so all sessions respect one rate limit and quota
+@st.cache_resource
+def get_scheduler(tier):
+    return RequestScheduler.for_tier(tier)
+
+# HS nomenclature index, loaded once and shared by all sessions
+@st.cache_resource
+def get_hs_index():
+    return HSIndex.load()
+
+# Scheduler for replayed requests, which use neither a tier's rate limit nor the daily quota
+@st.cache_resource
+def get_replay_scheduler():
+    return replay_scheduler()
+
+# The live API, the live API with its responses recorded, or a replay of recorded responses.
+# Live requests go through ComtradeClient, whose errors keep the HTTP status, so throttled and
+# failed requests are retried by the scheduler
+@st.cache_resource
+def get_api(mode, sources=(), latency=0.0, rate=0.0):
+    if mode == 'replay':
+        return ReplayClient.open(sources, latency=latency, rate=rate or None)
+    if mode == 'record':
+        return RecordingClient(ComtradeClient(), ResponseArchive())
+    return ComtradeClient()
+
+# Function to analyze NPK fertilizer data by year
+def analyze_npk_import_by_year(data_df, dataset_key=None):
+    # Group by year and sum the primaryValue, answered from the dataset cube
+    if dataset_key is None:
+        return yearly_value(TariffCube.build(data_df))
+    return cached_aggregate(dataset_key, 'yearly_value', data_df)
+
+# Rendered charts as PNG bytes, keyed on the aggregated data and chart parameters.
+# Figures are closed right after rendering, so reruns do not accumulate them.
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def render_chart(chart, data, dpi=SCREEN_DPI, **params):
+    return render_png(chart, data, dpi=dpi, **params)
+
+# Function to pull only newly published months into the saved dataset in a background job
+def sync_new_months(comtradeapicall, subscription_key, commodity_code, start_period, revision_months,
+                    max_workers=DEFAULT_MAX_WORKERS, scheduler=None):
+    lock = saved_dataset_lock()
+    store = get_snapshot_store()
+    
+    def work(job):
+        start_time = time.time()
         
-        # Set title and labels
-        ax.set_title('Річний імпорт НПК добрив в Україну', fontsize=16)
-        ax.set_xlabel('Рік', fontsize=12)
-        ax.set_ylabel('Вартість (USD)', fontsize=12)
+        def on_progress(done, total, chunk_result):
+            status = "done" if chunk_result.ok else "failed"
+            job.progress(done, total, f"Chunk {chunk_result.period_string} {status} ({done}/{total})")
         
-        # Format y-axis to show in millions
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'{x/1000000:.1f}M'))
+        with lock:
+            # The saved dataset must hold the same commodity; otherwise a full fetch is needed first.
+            # Checked under the lock, so another job can not replace the dataset in between
+            if os.path.exists(DATA_FILENAME):
+                stored_code = read_metadata(DATA_FILENAME).get('commodity_code')
+                if stored_code != commodity_code:
+                    raise ValueError(f"Saved data is for commodity code {stored_code}. "
+                                     f"Fetch data for {commodity_code} first.")
+            data_df, metadata, chunk_results = incremental_sync(
+                comtradeapicall, subscription_key, DATA_FILENAME, commodity_code,
+                start_period=start_period, revision_months=revision_months,
+                metadata={'commodity_code': commodity_code},
+                max_workers=max_workers, scheduler=scheduler, on_progress=on_progress
+            )
+            # All synced periods, so the snapshot key matches a fetch of the same range
+            periods = synced_periods(metadata)
+            snapshot = store.add(DATA_FILENAME, 'sync', fetch_query(commodity_code, periods))
+        return {
+            **metadata,
+            'snapshot_id': snapshot.id,
+            'api_calls': len(chunk_results),
+            'stored_rows': len(data_df),
+            'execution_time': time.time() - start_time,
+        }
+    
+    params = {'commodity_code': commodity_code, 'start_period': start_period, 'revision_months': revision_months,
+              'api': getattr(comtradeapicall, 'mode', 'live')}
+    return get_job_manager().submit('sync', params, work, output_suffix=None)
+
+# Function to report the outcome of a finished sync job
+def display_sync_result(job):
+    if job.error:
+        st.error(f"Error syncing data: {job.error}")
+        return
+    
+    metadata = job.result
+    last_sync = metadata['last_sync']
+    watermark = metadata[WATERMARKS_KEY].get(last_sync['key'], {})
+    st.success(f"Synced periods {' - '.join(last_sync['requested_periods'])} for commodity code {metadata['commodity_code']}")
+    st.info(f"API calls: {metadata['api_calls']}, rows received: {last_sync['new_rows']}, rows stored: {metadata['stored_rows']}")
+    st.info(f"Latest stored period: {watermark.get('period', 'none')} (snapshot {metadata['snapshot_id']})")
+    st.info(f"Execution time: {metadata['execution_time']:.2f} seconds")
+    if last_sync['failed_periods']:
+        st.warning(f"Could not retrieve periods: {', '.join(last_sync['failed_periods'])}")
+
+# Function to estimate the size and duration of a download from countOnly probes, before fetching anything
+def estimate_download(comtradeapicall, subscription_key, periods, commodity_code=None, batch=None,
+                      max_workers=DEFAULT_MAX_WORKERS, scheduler=None):
+    try:
+        with st.spinner("Checking row counts..."):
+            if batch is None:
+                plan = size_periods(comtradeapicall, subscription_key, periods, commodity_code,
+                                    max_workers=max_workers, scheduler=scheduler, probes=get_probe_cache())
+            else:
+                plan = size_plan(comtradeapicall, subscription_key, plan_batch(*batch, periods),
+                                 max_workers=max_workers, scheduler=scheduler, probes=get_probe_cache())
+    except Exception as e:
+        st.sidebar.error(f"Could not estimate the download: {str(e)}")
+        return
+    
+    estimate = plan.estimate(rate=scheduler.limiter.rate if scheduler else None, max_workers=max_workers)
+    st.sidebar.info(f"About {estimate['rows']:,} rows ({estimate['bytes'] / 2**20:.1f} MB) in "
+                    f"{estimate['calls']} requests, roughly {estimate['seconds']:.0f} s "
+                    f"(from {estimate['probes']} row counts)")
+    if plan.empty:
+        st.sidebar.caption(f"{len(plan.empty)} requests skipped: no rows for those periods")
+    if plan.unknown:
+        st.sidebar.warning(f"{len(plan.unknown)} requests could not be sized; their rows are not included")
+    if plan.oversized:
+        st.sidebar.warning(f"{len(plan.oversized)} single-period requests are still at the record limit "
+                           "and may be truncated")
+
+# Function to split a comma/whitespace separated list of codes
+def parse_codes(text):
+    return [code for code in text.replace(",", " ").split() if code]
+
+# Function to run a batch query over reporters × flows × commodity codes × periods in a background job
+def run_batch_query(comtradeapicall, subscription_key, reporter_codes, flow_codes, cmd_codes, periods,
+                    max_workers=DEFAULT_MAX_WORKERS, scheduler=None, chunk='month'):
+    lock = saved_dataset_lock()
+    store = get_snapshot_store()
+    probes = get_probe_cache()
+    params = {'reporter_codes': reporter_codes, 'flow_codes': flow_codes, 'commodity_codes': cmd_codes,
+              'periods': periods, 'api': getattr(comtradeapicall, 'mode', 'live')}
+    
+    def work(job):
+        # Pack the query matrix into as few API calls as the endpoint allows
+        calls = plan_batch(reporter_codes, flow_codes, cmd_codes, periods)
+        if chunk == AUTO_CHUNK:
+            # Calls are sized from row counts first, so none of them reaches the record limit
+            job.progress(0, len(calls), f"Checking the size of {len(calls)} calls...")
+            calls = sized_calls(size_plan(comtradeapicall, subscription_key, calls, max_workers=max_workers,
+                                          scheduler=scheduler, probes=probes))
         
-        # Set grid
-        ax.grid(True, linestyle='--', alpha=0.7)
+        def on_progress(done, total, call_result):
+            status = "failed" if not call_result.ok else "truncated" if call_result.truncated else "done"
+            job.progress(done, total, f"Call {call_result.call.label} {status} ({done}/{total})")
         
-        # Make sure years are integers on x-axis
-        ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
+        # Each call's rows are appended to the job's file as soon as the call completes
+        results, _ = run_plan_to_file(
+            comtradeapicall, subscription_key, calls, job.output,
+            metadata={'reporter_codes': reporter_codes, 'flow_codes': flow_codes, 'commodity_codes': cmd_codes},
+            max_workers=max_workers, scheduler=scheduler, on_progress=on_progress, on_rows=job.rows
+        )
+        snapshot = store.add(job.output, 'batch', params, results)
+        with lock:
+            publish_dataset(job.output, BATCH_FILENAME)
+        return {**results, 'plan': plan_summary(calls), 'snapshot_id': snapshot.id}
+    
+    return get_job_manager().submit('batch', params, work)
+
+# Function to attach to a finished batch job
+def attach_batch_job(job):
+    try:
+        if job.error:
+            raise RuntimeError(job.error)
+        results = job.result
+        batch_df = load_job_dataset(job.output)
         
-        # Tight layout
-        plt.tight_layout()
+        st.info(f"Batch plan: {results['plan']['calls']} API calls instead of {results['plan']['naive_calls']} single-period requests")
+        st.success(f"Batch query finished: {results['total_rows']} rows from {results['api_calls']} API calls "
+                   f"(snapshot {results['snapshot_id']})")
+        st.info(f"Execution time: {results['execution_time']:.2f} seconds")
+        if results['failed_calls']:
+            st.warning(f"Failed calls: {', '.join(results['failed_calls'])}")
+        if results['truncated_calls']:
+            st.warning(f"Calls still at the record limit, their rows beyond it are missing: "
+                       f"{', '.join(results['truncated_calls'])}")
         
-        return fig
-    else:
-        return None
+        return batch_df, results
+    
+    except Exception as e:
+        st.error(f"Error running batch query: {str(e)}")
+        return pd.DataFrame(), {'error': str(e)}
+
+# Function to find the saved dataset, preferring the columnar file over legacy JSON
+def stored_data_path():
+    return DATA_FILENAME if os.path.exists(DATA_FILENAME) else JSON_FILENAME
 
-# Function to load existing data from JSON file
-def load_json_data():
+# Function to find the file behind a choice in the saved data picker
+def saved_choice_path(choice):
+    return stored_data_path() if choice == SAVED_DATASET else get_snapshot_store().object_path(choice)
+
+# Function to load existing data from the saved dataset or a snapshot
+def load_stored_data(choice=SAVED_DATASET):
+    path = saved_choice_path(choice)
     try:
-        with open(JSON_FILENAME, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
-            data_df = pd.DataFrame(json_data['data'])
-            return data_df
+        return open_stored_dataset(path)
     except Exception as e:
-        st.warning(f"Could not load data from {JSON_FILENAME}: {str(e)}")
-        return pd.DataFrame()
+        st.warning(f"Could not load data from {path}: {str(e)}")
+        return pd.DataFrame(), {}
 
 # Sidebar for input parameters
 st.sidebar.header("Parameters")
@@ -271,6 +632,26 @@ st.sidebar.header("Parameters")
 # API Key input
 subscription_key = "ede51c36a7db4b639bf9f220416e0f1f"
 
+# Live API calls, or recording and offline replay of their responses
+api_mode = st.sidebar.selectbox("API mode", API_MODES, format_func=lambda x: x.capitalize(),
+                                help=f"Record saves every API response to {DEFAULT_ARCHIVE_DIR}; Replay answers "
+                                     "requests from recordings and seed datasets without network access or quota")
+if api_mode == 'replay':
+    replay_sources = st.sidebar.text_input("Replay sources", value=REPLAY_SEED,
+                                           help=f"Recording directories (e.g. {DEFAULT_ARCHIVE_DIR}) and dataset "
+                                                "files, separated by commas; the first one with a response wins")
+    replay_latency = st.sidebar.number_input("Simulated latency (s)", min_value=0.0, max_value=10.0, value=0.0,
+                                             step=0.1)
+    replay_rate = st.sidebar.number_input("Simulated rate limit (requests/s)", min_value=0.0, max_value=100.0,
+                                          value=0.0, help="0 means no limit; requests over it get HTTP 429")
+    try:
+        api = get_api(api_mode, tuple(parse_codes(replay_sources)), replay_latency, replay_rate)
+    except Exception as e:
+        st.sidebar.error(f"Could not open replay sources: {str(e)}")
+        st.stop()
+else:
+    api = get_api(api_mode)
+
 # Commodity code input with examples
 commodity_code_examples = {
     '310520': 'Mineral or chemical fertilizers containing N, P and K',
@@ -279,13 +660,28 @@ commodity_code_examples = {
     '851712': 'Telephones for cellular networks or other wireless networks'
 }
 
+# Search over the HS nomenclature replaces the examples with the best matching codes
+hs_index = get_hs_index()
+hs_search = st.sidebar.text_input("Search HS codes", help="A code prefix or words from the description, "
+                                                          "e.g. 3105 or potassium chloride")
+hs_matches = [code for code, _ in hs_index.search(hs_search, limit=HS_SEARCH_RESULTS)] if hs_search else []
+if hs_search and not hs_matches:
+    st.sidebar.caption("No matching HS codes")
+
 selected_example = st.sidebar.selectbox(
-    "Select example commodity code",
-    list(commodity_code_examples.keys()),
-    format_func=lambda x: f"{x} - {commodity_code_examples[x]}"
+    "Select commodity code" if hs_matches else "Select example commodity code",
+    hs_matches or list(commodity_code_examples.keys()),
+    format_func=lambda x: f"{x} - {commodity_code_examples.get(x) or hs_index.describe(x)}"
 )
 
 commodity_code = st.sidebar.text_input("Commodity Code (HS Code)", value=selected_example)
+if commodity_code.isdigit() and len(commodity_code) < LEVELS['subheading']:
+    if hs_index.covers(commodity_code):
+        st.sidebar.caption(f"{hs_index.label(commodity_code)}: run a Batch Query to fetch its "
+                           f"{len(hs_index.expand([commodity_code]))} subheadings")
+    else:
+        st.sidebar.caption(f"{hs_index.label(commodity_code)}: its subheadings are not all in the local "
+                           "nomenclature, enter them as 6-digit codes")
 
 # Date range selection
 st.sidebar.subheader("Time Period Selection")
@@ -304,6 +700,56 @@ if start_date >= end_date:
 periods = pd.date_range(start=start_date, end=end_date, freq='MS').strftime("%Y%m").tolist()
 period_string = ",".join(periods)
 
+# Fetch settings
+st.sidebar.subheader("Fetch Settings")
+fetch_chunk = st.sidebar.selectbox("Request chunk", (AUTO_CHUNK,) + CHUNK_SIZES,
+                                   format_func=lambda x: "Auto (sized from row counts)" if x == AUTO_CHUNK else f"Per {x}",
+                                   help="Auto first asks the API how many rows each part of the query has, then "
+                                        "requests as few parts as fit under the record limit")
+fetch_workers = st.sidebar.slider("Parallel requests", min_value=1, max_value=8, value=DEFAULT_MAX_WORKERS)
+# Replayed rows are kept out of the cache of live API responses
+use_cache = st.sidebar.checkbox("Use local cache", value=True,
+                                help="Only download months that are not cached yet or have expired")
+use_cache = use_cache and api_mode != 'replay'
+subscription_tier = st.sidebar.selectbox("Subscription tier", list(SUBSCRIPTION_TIERS),
+                                         format_func=lambda x: x.capitalize())
+if api_mode == 'replay':
+    scheduler = get_replay_scheduler()
+    st.sidebar.caption("Replay mode: no API calls are made")
+else:
+    scheduler = get_scheduler(subscription_tier)
+    st.sidebar.caption(f"API calls left today: {scheduler.ledger.remaining()} of {scheduler.ledger.daily_calls}")
+json_export = st.sidebar.checkbox("Also save JSON export", value=False,
+                                  help=f"Write {JSON_FILENAME} in addition to {DATA_FILENAME}")
+interactive_charts = st.sidebar.checkbox("Interactive charts", value=False,
+                                         help="Draw time series in the browser, with zoom and tooltips, instead of as images")
+
+# Incremental refresh of the saved dataset
+st.sidebar.subheader("Incremental Sync")
+revision_months = st.sidebar.number_input("Revision window (months)", min_value=0, max_value=24,
+                                          value=DEFAULT_REVISION_MONTHS,
+                                          help="Already stored recent months to request again, as they may be revised")
+sync_clicked = st.sidebar.button("Sync New Months")
+
+# Batch query over several reporters, flows and commodity codes
+with st.sidebar.expander("Batch Query"):
+    batch_reporters = st.text_input("Reporter codes", value="804", help="Comma-separated UN Comtrade reporter codes")
+    batch_flows = st.multiselect("Trade flows", ['M', 'X'], default=['M'],
+                                 format_func=lambda x: {'M': 'Import', 'X': 'Export'}[x])
+    batch_codes = st.text_area("Commodity codes (HS)", value=commodity_code,
+                               help="Separated by commas or new lines; chapters and headings (e.g. 31 or 3105) "
+                                    "are expanded to their subheadings")
+    # Chapters and headings are fetched as all their subheadings, if the nomenclature lists them all
+    try:
+        batch_cmd_codes = hs_index.expand(parse_codes(batch_codes))
+    except ValueError as e:
+        st.error(str(e))
+        batch_cmd_codes = []
+    if batch_cmd_codes and len(batch_cmd_codes) != len(parse_codes(batch_codes)):
+        st.caption(f"{len(batch_cmd_codes)} subheadings: {', '.join(batch_cmd_codes)}")
+    run_batch_clicked = st.button("Run Batch")
+    estimate_batch_clicked = st.button("Estimate Batch Size")
+
 # Button to fetch data
 if st.sidebar.button("Fetch Data"):
     if not subscription_key:
@@ -311,12 +757,90 @@ if st.sidebar.button("Fetch Data"):
     elif not commodity_code:
         st.sidebar.error("Please enter a valid Commodity Code")
     else:
+        st.session_state['show_saved_data'] = False
+        # The fetch runs in a background job, which this session follows across reruns
+        follow_job(get_tariff_line_data(api, subscription_key, period_string, commodity_code,
+                                        chunk=fetch_chunk, max_workers=fetch_workers,
+                                        cache=get_period_cache() if use_cache else None,
+                                        json_export=json_export, scheduler=scheduler))
+
+# Button to estimate the download before fetching it
+if st.sidebar.button("Estimate Size", help="Ask the API for row counts only, without downloading any data"):
+    if not commodity_code:
+        st.sidebar.error("Please enter a valid Commodity Code")
+    else:
+        # Cached months are not downloaded again, so they are left out of the estimate
+        if use_cache:
+            missing = get_period_cache().missing(DEFAULT_QUERY['reporterCode'], DEFAULT_QUERY['flowCode'],
+                                                 commodity_code, periods)
+        else:
+            missing = periods
+        if not missing:
+            st.sidebar.info("All selected months are cached, nothing to download")
+        else:
+            estimate_download(api, subscription_key, missing, commodity_code,
+                              max_workers=fetch_workers, scheduler=scheduler)
+
+if sync_clicked:
+    st.session_state['show_saved_data'] = False
+    follow_job(sync_new_months(api, subscription_key, commodity_code, periods[0], revision_months,
+                               max_workers=fetch_workers, scheduler=scheduler))
+
+if run_batch_clicked:
+    reporter_codes = [int(code) for code in parse_codes(batch_reporters) if code.isdigit()]
+    cmd_codes = batch_cmd_codes
+    if not reporter_codes or not cmd_codes or not batch_flows:
+        st.sidebar.error("Please enter reporter codes, trade flows and commodity codes for the batch")
+    else:
+        st.session_state['show_saved_data'] = False
+        follow_job(run_batch_query(api, subscription_key, reporter_codes, batch_flows,
+                                   cmd_codes, periods, max_workers=fetch_workers, scheduler=scheduler,
+                                   chunk=fetch_chunk))
+
+if estimate_batch_clicked:
+    reporter_codes = [int(code) for code in parse_codes(batch_reporters) if code.isdigit()]
+    cmd_codes = batch_cmd_codes
+    if not reporter_codes or not cmd_codes or not batch_flows:
+        st.sidebar.error("Please enter reporter codes, trade flows and commodity codes for the batch")
+    else:
+        estimate_download(api, subscription_key, periods, batch=(reporter_codes, batch_flows, cmd_codes),
+                          max_workers=fetch_workers, scheduler=scheduler)
+
+# Picker over the saved dataset and the stored snapshots, including downloads made by other users
+snapshot_labels = {snapshot.id: snapshot.label for snapshot in get_snapshot_store().list(limit=SNAPSHOT_PICKER_ENTRIES)}
+saved_choice = st.sidebar.selectbox(
+    "Saved data", [SAVED_DATASET] + list(snapshot_labels),
+    format_func=lambda x: "Saved dataset" if x == SAVED_DATASET else snapshot_labels[x], key='saved_choice'
+)
+
+# Add button to load existing data from the saved dataset without API call
+if st.sidebar.button("Load Saved Data"):
+    st.session_state['show_saved_data'] = True
+    follow_job(None)
+
+# The job this session follows: its progress while it runs, its results once it is done
+job = followed_job()
+if job is not None and profiler is not None and not job.active:
+    job_profile = get_job_manager().profile(job.id)
+    if job_profile is not None:
+        st.session_state['fetch_profile'] = job_profile
+
+if job is not None and job.kind == 'fetch':
+    if job.active:
+        display_job_progress(job.id)
+    else:
+        fetched_code = job.params['commodity_code']
+        
         # Create tabs for different views
-        tab1, tab2, tab3, tab4 = st.tabs(["Data", "Monthly Visualization", "Yearly NPK Import", "JSON"])
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(["Data", "Monthly Visualization", "Yearly NPK Import", "JSON",
+                                                 "Partner Analytics"])
         
         with tab1:
-            # Fetch data
-            panDForig, results = get_tariff_line_data(comtradeapicall, subscription_key, period_string, commodity_code)
+            # Attach to the fetched data
+            panDForig, results = attach_fetch_job(job)
+            # The snapshot id identifies this dataset in the aggregation cache without hashing its rows
+            # on every rerun; other results are hashed once per file
+            dataset_key = results.get('snapshot_id') or (stored_data_key(job.output) if not panDForig.empty else None)
             
             if not panDForig.empty:
                 # Show data
@@ -324,56 +848,43 @@ if st.sidebar.button("Fetch Data"):
                 st.dataframe(panDForig)
                 
                 # Download options
-                csv = panDForig.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="Download data as CSV",
-                    data=csv,
-                    file_name=f'tariff_data_{commodity_code}.csv',
-                    mime='text/csv',
-                )
+                display_export_download(panDForig, dataset_key, f'tariff_data_{fetched_code}', 'fetch')
         
         with tab2:
             if not panDForig.empty:
                 st.subheader("Monthly Data Visualization")
                 
                 # Check if we have time period and trade value columns
-                if 'statPeriod' in panDForig.columns and 'primaryValue' in panDForig.columns:
-                    # Data preparation
-                    viz_data = panDForig.copy()
-                    viz_data['date'] = pd.to_datetime(viz_data['statPeriod'], format='%Y%m')
-                    viz_data = viz_data.sort_values('date')
-                    
-                    # Create a time series plot
-                    fig, ax = plt.subplots(figsize=(12, 6))
-                    ax.plot(viz_data['date'], viz_data['primaryValue'], marker='o', linestyle='-')
-                    ax.set_title(f'Import Value Over Time for Commodity Code {commodity_code}')
-                    ax.set_xlabel('Date')
-                    ax.set_ylabel('Value (USD)')
-                    ax.grid(True)
-                    
-                    # Format x-axis to show dates nicely
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
+                if PERIOD_DATE in panDForig.columns and 'primaryValue' in panDForig.columns:
+                    # Monthly totals from the cube rather than every tariff line, reduced to the point budget,
+                    # so the chart costs the same for thousands or millions of rows
+                    series_by = st.radio("Series", ['total', 'partner'], horizontal=True,
+                                         format_func=lambda x: "Total" if x == 'total' else f"Top {TOP_SERIES} partners")
+                    over_time = downsample(
+                        cached_aggregate(dataset_key, 'value_over_time', panDForig,
+                                         by=None if series_by == 'total' else series_by, n=TOP_SERIES),
+                        budget=CHART_POINT_BUDGET
+                    )
+                    title = f'Import Value Over Time for Commodity Code {fetched_code}'
                     
-                    # Display plot
-                    st.pyplot(fig)
+                    if interactive_charts:
+                        # Drawn in the browser, with zoom and tooltips
+                        st.markdown(f"**{title}**")
+                        st.line_chart(over_time, x_label='Date', y_label='Value (USD)')
+                    else:
+                        # Display plot (rendered once per aggregate)
+                        st.image(render_chart('value_over_time', over_time, title=title))
                     
                     # Summary statistics
                     st.subheader("Summary Statistics")
-                    st.write(viz_data['primaryValue'].describe())
+                    st.write(cached_value_summary(dataset_key, panDForig))
                     
                     # Monthly average
-                    monthly_avg = viz_data.groupby(viz_data['date'].dt.strftime('%B'))['primaryValue'].mean()
+                    monthly_avg = cached_aggregate(dataset_key, 'monthly_average', panDForig)
                     st.subheader("Monthly Average Import Value")
                     
-                    # Create a bar chart for monthly average
-                    fig2, ax2 = plt.subplots(figsize=(10, 5))
-                    monthly_avg.plot(kind='bar', ax=ax2)
-                    ax2.set_title('Average Import Value by Month')
-                    ax2.set_ylabel('Average Value (USD)')
-                    plt.tight_layout()
-                    
-                    st.pyplot(fig2)
+                    # Show the bar chart for monthly average (rendered once per aggregate)
+                    st.image(render_chart('monthly_average', monthly_avg))
                 else:
                     st.warning("Data does not contain expected columns for visualization")
         
@@ -381,9 +892,9 @@ if st.sidebar.button("Fetch Data"):
             st.subheader("Річний розподіл імпорту НПК")
             
             # Check if we fetched NPK data (310520 code)
-            if commodity_code == '310520' and not panDForig.empty:
+            if fetched_code == '310520' and not panDForig.empty:
                 # Analyze NPK data by year
-                yearly_data = analyze_npk_import_by_year(panDForig)
+                yearly_data = analyze_npk_import_by_year(panDForig, dataset_key)
                 
                 if not yearly_data.empty:
                     # Display yearly data table
@@ -397,57 +908,51 @@ if st.sidebar.button("Fetch Data"):
                     
                     st.dataframe(display_data[['Рік', 'primaryValue (USD)', 'primaryValue (Million USD)']])
                     
-                    # Create and display yearly trend plot
-                    fig_yearly = plot_npk_yearly_trend(yearly_data)
-                    if fig_yearly:
-                        st.pyplot(fig_yearly)
+                    # Display yearly trend plot (rendered once per aggregate)
+                    st.image(render_chart('npk_yearly_trend', yearly_data))
                     
-                    # Download yearly data as CSV
-                    csv_yearly = yearly_data.to_csv(index=False).encode('utf-8')
+                    # Download yearly data as CSV (generated only when clicked)
                     st.download_button(
                         label="Download yearly NPK data as CSV",
-                        data=csv_yearly,
+                        data=lambda: yearly_data.to_csv(index=False),
                         file_name='npk_yearly_import_data.csv',
                         mime='text/csv',
                     )
                 else:
                     st.warning("Could not process yearly NPK import data")
             else:
-                # Try to load existing NPK data from JSON file
-                if commodity_code != '310520':
+                # Try to load existing NPK data from the saved dataset
+                if fetched_code != '310520':
                     st.info("This tab shows yearly NPK fertilizer import data. Please select commodity code 310520 and fetch data to see NPK analysis.")
                     
-                    # Try to load existing NPK data from JSON file
+                    # Try to load existing NPK data from the saved dataset
                     try:
-                        with open(JSON_FILENAME, 'r', encoding='utf-8') as f:
-                            json_data = json.load(f)
-                            # Check if the loaded data is for NPK fertilizers
-                            if json_data.get('metadata', {}).get('commodity_code') == '310520':
-                                data_df = pd.DataFrame(json_data['data'])
-                                yearly_data = analyze_npk_import_by_year(data_df)
+                        stored_path = stored_data_path()
+                        # Check if the saved data is for NPK fertilizers before reading any rows
+                        if read_metadata(stored_path).get('commodity_code') == '310520':
+                            # Answered from the cube stored next to the dataset, without reading any rows
+                            yearly_data = yearly_value(load_cube(stored_path))
+                            
+                            if not yearly_data.empty:
+                                st.success(f"Showing previously loaded NPK data from {stored_path}")
+                                
+                                # Display yearly data table
+                                st.subheader("Річні дані імпорту НПК")
                                 
-                                if not yearly_data.empty:
-                                    st.success("Showing previously loaded NPK data from JSON file")
-                                    
-                                    # Display yearly data table
-                                    st.subheader("Річні дані імпорту НПК")
-                                    
-                                    # Format yearly data for display
-                                    display_data = yearly_data.copy()
-                                    display_data['primaryValue (USD)'] = display_data['primaryValue'].apply(lambda x: f"${x:,.2f}")
-                                    display_data['primaryValue (Million USD)'] = display_data['primaryValue'].apply(lambda x: f"${x/1000000:.2f}M")
-                                    display_data = display_data.rename(columns={'year': 'Рік', 'primaryValue': 'Вартість (USD)'})
-                                    
-                                    st.dataframe(display_data[['Рік', 'primaryValue (USD)', 'primaryValue (Million USD)']])
-                                    
-                                    # Create and display yearly trend plot
-                                    fig_yearly = plot_npk_yearly_trend(yearly_data)
-                                    if fig_yearly:
-                                        st.pyplot(fig_yearly)
-                            else:
-                                st.warning("No NPK data found in the JSON file. Please fetch data for commodity code 310520.")
+                                # Format yearly data for display
+                                display_data = yearly_data.copy()
+                                display_data['primaryValue (USD)'] = display_data['primaryValue'].apply(lambda x: f"${x:,.2f}")
+                                display_data['primaryValue (Million USD)'] = display_data['primaryValue'].apply(lambda x: f"${x/1000000:.2f}M")
+                                display_data = display_data.rename(columns={'year': 'Рік', 'primaryValue': 'Вартість (USD)'})
+                                
+                                st.dataframe(display_data[['Рік', 'primaryValue (USD)', 'primaryValue (Million USD)']])
+                                
+                                # Display yearly trend plot (rendered once per aggregate)
+                                st.image(render_chart('npk_yearly_trend', yearly_data))
+                        else:
+                            st.warning("No NPK data found in the saved dataset. Please fetch data for commodity code 310520.")
                     except Exception as e:
-                        st.warning(f"Could not load NPK data from JSON file: {str(e)}")
+                        st.warning(f"Could not load NPK data from saved dataset: {str(e)}")
         
         with tab4:
             if not panDForig.empty:
@@ -457,26 +962,56 @@ if st.sidebar.button("Fetch Data"):
                     'data': panDForig.head(10).to_dict(orient='records')  # Show only first 10 records to keep it manageable
                 })
             else:
-                # Try to load existing data from JSON file
+                # Try to show existing data from the saved dataset, reading only the first records
                 try:
-                    with open(JSON_FILENAME, 'r', encoding='utf-8') as f:
-                        json_data = json.load(f)
-                        st.json({
-                            'metadata': json_data.get('metadata', {}),
-                            'data': json_data.get('data', [])[:10]  # Show only first 10 records
-                        })
+                    stored_path = stored_data_path()
+                    st.json({
+                        'metadata': read_metadata(stored_path),
+                        'data': dataset_head(stored_path, 10).to_dict(orient='records')  # Show only first 10 records
+                    })
                 except Exception as e:
-                    st.warning(f"Could not load data from JSON file: {str(e)}")
+                    st.warning(f"Could not load data from saved dataset: {str(e)}")
+        
+        with tab5:
+            if not panDForig.empty:
+                display_partner_analytics(dataset_analytics(dataset_key, panDForig), 'fetch')
+
+if job is not None and job.kind == 'sync':
+    st.subheader("Incremental Sync")
+    if job.active:
+        display_job_progress(job.id)
+    else:
+        display_sync_result(job)
 
-# Add button to load existing data from JSON without API call
-if st.sidebar.button("Load Data From JSON"):
+if job is not None and job.kind == 'batch':
+    st.subheader("Batch Query")
+    if job.active:
+        display_job_progress(job.id)
+    else:
+        batch_df, batch_results = attach_batch_job(job)
+        if not batch_df.empty:
+            st.dataframe(batch_df)
+            display_export_download(batch_df, batch_results['snapshot_id'], 'batch_tariff_data', 'batch')
+            
+            # All commodities of the batch are analyzed in one pass, side by side
+            with st.expander("Partner analytics by commodity"):
+                display_partner_analytics(dataset_analytics(batch_results['snapshot_id'], batch_df, by='cmd'),
+                                          'batch')
+            with st.expander("Commodity hierarchy"):
+                display_commodity_rollup(batch_df, batch_results['snapshot_id'], 'batch')
+
+# The saved data view stays open across reruns, so widgets inside it keep working
+if st.session_state.get('show_saved_data'):
     # Create tabs for different views
-    tab1, tab2, tab3, tab4 = st.tabs(["Data", "Monthly Visualization", "Yearly NPK Import", "JSON"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Data", "Monthly Visualization", "Yearly NPK Import", "JSON",
+                                             "Partner Analytics"])
     
-    # Load data from JSON file
-    data_df = load_json_data()
+    # Load data from the saved dataset or the chosen snapshot
+    data_df, stored_metadata = load_stored_data(saved_choice)
     
     if not data_df.empty:
+        # A snapshot id already identifies its content
+        dataset_key = stored_data_key(stored_data_path()) if saved_choice == SAVED_DATASET else saved_choice
         # Get commodity code from loaded data
         loaded_commodity_code = data_df['cmdCode'].iloc[0] if 'cmdCode' in data_df.columns else "Unknown"
         
@@ -486,19 +1021,13 @@ if st.sidebar.button("Load Data From JSON"):
             st.dataframe(data_df)
             
             # Download options
-            csv = data_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="Download data as CSV",
-                data=csv,
-                file_name=f'tariff_data_{loaded_commodity_code}.csv',
-                mime='text/csv',
-            )
+            display_export_download(data_df, dataset_key, f'tariff_data_{loaded_commodity_code}', 'saved')
         
         with tab2:
             st.subheader("Monthly Data Visualization")
 
             # Відображаємо візуалізацію
-            display_phosphate_imports(data_df)
+            display_phosphate_imports(data_df, dataset_key)
 
             
              
@@ -513,7 +1042,7 @@ if st.sidebar.button("Load Data From JSON"):
             # Check if loaded data is NPK data (310520 code)
             if loaded_commodity_code == '310520':
                 # Analyze NPK data by year
-                yearly_data = analyze_npk_import_by_year(data_df)
+                yearly_data = analyze_npk_import_by_year(data_df, dataset_key)
                 
                 if not yearly_data.empty:
                     # Display yearly data table
@@ -527,16 +1056,13 @@ if st.sidebar.button("Load Data From JSON"):
                     
                     st.dataframe(display_data[['Рік', 'primaryValue (USD)', 'primaryValue (Million USD)']])
                     
-                    # Create and display yearly trend plot
-                    fig_yearly = plot_npk_yearly_trend(yearly_data)
-                    if fig_yearly:
-                        st.pyplot(fig_yearly)
+                    # Display yearly trend plot (rendered once per aggregate)
+                    st.image(render_chart('npk_yearly_trend', yearly_data))
                     
-                    # Download yearly data as CSV
-                    csv_yearly = yearly_data.to_csv(index=False).encode('utf-8')
+                    # Download yearly data as CSV (generated only when clicked)
                     st.download_button(
                         label="Download yearly NPK data as CSV",
-                        data=csv_yearly,
+                        data=lambda: yearly_data.to_csv(index=False),
                         file_name='npk_yearly_import_data.csv',
                         mime='text/csv',
                     )
@@ -548,17 +1074,36 @@ if st.sidebar.button("Load Data From JSON"):
         with tab4:
             st.subheader("JSON Data")
             
-            try:
-                with open(JSON_FILENAME, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                    st.json({
-                        'metadata': json_data.get('metadata', {}),
-                        'data': json_data.get('data', [])[:10]  # Show only first 10 records
-                    })
-            except Exception as e:
-                st.warning(f"Could not load JSON data: {str(e)}")
+            st.json({
+                'metadata': stored_metadata,
+                'data': data_df.head(10).to_dict(orient='records')  # Show only first 10 records
+            })
+        
+        with tab5:
+            display_partner_analytics(dataset_analytics(dataset_key, data_df), 'saved')
     else:
-        st.warning(f"No data found in {JSON_FILENAME}")
+        st.warning(f"No data found in {saved_choice_path(saved_choice)}")
+
+# Performance panel: where the time of this run (and of the last fetch) went
+st.sidebar.checkbox("Show performance panel", key='show_performance',
+                    help="Time API calls, deserialization, persistence, aggregations and chart rendering")
+if profiler is not None:
+    profile = profiler.to_dict()
+    
+    with st.expander("Performance", expanded=True):
+        st.subheader("This run")
+        display_performance(profile, 'run')
+        st.download_button(
+            label="Download as OpenMetrics",
+            data=profiler.to_openmetrics(),
+            file_name='performance_profile.txt',
+            mime='text/plain'
+        )
+        
+        fetch_profile = st.session_state.get('fetch_profile')
+        if fetch_profile is not None and fetch_profile is not profile:
+            st.subheader(f"Last fetch ({fetch_profile['started_at']})")
+            display_performance(fetch_profile, 'fetch')
 
 # Add information about the app
 st.sidebar.markdown("---")
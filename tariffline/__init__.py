@@ -0,0 +1 @@
+"""Fetch, storage and analysis engine for UN Comtrade tariff-line data."""
@@ -0,0 +1,6 @@
+import sys
+
+from tariffline.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,110 @@
+"""Aggregations used by the app views, answered from the dataset cube, plus dataset fingerprinting."""
+import calendar
+import hashlib
+
+import pandas as pd
+
+from tariffline.cube import COUNT
+from tariffline.hs import truncate
+from tariffline.periods import period_range
+from tariffline.profiling import span
+from tariffline.schema import period_dates
+
+
+def dataset_fingerprint(data_df):
+    """Content hash of a DataFrame, stable across reruns, sessions and processes."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(data_df, index=False).values.tobytes())
+    digest.update(",".join(map(str, data_df.columns)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def top_partners(cube, value='primaryValue', n=3):
+    """Partners with the largest total ``value``, in descending order."""
+    return cube.top('partner', value, n=n)
+
+
+def partner_yearly_weight(cube, n=3):
+    """
+    Net weight in thousand tons per year for the top-``n`` partners by value.
+
+    Returns a years × partners table with every year of the dataset present,
+    filled with 0 where a partner had no imports that year.
+    """
+    partners = top_partners(cube, n=n)
+    table = (
+        cube.rollup(['year', 'partner'], ['netWgt'], partner=partners)['netWgt']
+        .unstack('partner')
+        .reindex(index=pd.Index(cube.labels['year'], name='year'), columns=partners)
+        .fillna(0) / 1000
+    )
+    table.columns = list(partners)
+    return table
+
+
+def yearly_value(cube):
+    """Total ``primaryValue`` per year, or an empty frame for an empty cube."""
+    if not len(cube) or 'year' not in cube.dims:
+        return pd.DataFrame()
+    return cube.rollup('year', ['primaryValue']).reset_index()
+
+
+def monthly_average(cube):
+    """Mean ``primaryValue`` per calendar month name."""
+    monthly = cube.rollup('period', ['primaryValue', COUNT])
+    months = pd.Index([calendar.month_name[period % 100] for period in monthly.index], name='date')
+    totals = monthly.groupby(months).sum()
+    return (totals['primaryValue'] / totals[COUNT]).rename('primaryValue')
+
+
+def value_over_time(cube, measure='primaryValue', by=None, n=5):
+    """
+    ``measure`` summed per month, as a table indexed by the first day of each month
+    with one column per series: the total, or the top-``n`` values of dimension ``by``
+    (e.g. ``'partner'``). Months without rows are present with 0.
+    """
+    if not len(cube):
+        return pd.DataFrame()
+    if by is None:
+        table = cube.rollup('period', [measure]).rename(columns={measure: 'Total'})
+    else:
+        top = cube.top(by, measure, n=n)
+        table = cube.rollup(['period', by], [measure], **{by: top})[measure].unstack(by).reindex(columns=top)
+        table.columns = list(top)
+    periods = period_range(table.index.min(), table.index.max())
+    table = table.reindex([int(period) for period in periods]).fillna(0)
+    table.index = period_dates(table.index).rename('date')
+    return table
+
+
+def commodity_rollup(cube, level='heading', by='year', measures=('primaryValue', 'netWgt')):
+    """
+    ``measures`` summed per commodity code cut to ``level`` of the HS hierarchy
+    (``'chapter'``, ``'heading'`` or ``'subheading'``), and per label of ``by`` unless it is None.
+    """
+    if not len(cube) or 'cmd' not in cube.dims:
+        return pd.DataFrame()
+    dims = ['cmd'] if by is None else ['cmd', by]
+    table = cube.rollup(dims, list(measures)).reset_index()
+    table['cmd'] = truncate(table['cmd'], level)
+    return table.groupby(dims, sort=True)[list(measures)].sum()
+
+
+def value_summary(data_df):
+    """Descriptive statistics of ``primaryValue``."""
+    return data_df['primaryValue'].describe()
+
+
+# Aggregations answered from a ``TariffCube``
+AGGREGATIONS = {
+    'partner_yearly_weight': partner_yearly_weight,
+    'yearly_value': yearly_value,
+    'monthly_average': monthly_average,
+    'value_over_time': value_over_time,
+    'commodity_rollup': commodity_rollup,
+}
+
+
+def aggregate(name, cube, **params):
+    """Run the aggregation registered as ``name`` on ``cube``."""
+    with span(f'aggregate.{name}', cells=len(cube)):
+        return AGGREGATIONS[name](cube, **params)
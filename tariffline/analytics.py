@@ -0,0 +1,165 @@
+"""
+Partner-share and trend analytics over a dense (period × partner) matrix.
+
+The matrix is filled from the dataset cube in one pass (one ``bincount`` per
+measure) with every month between the first and last period present, so
+top-N partners, market shares, growth rates, unit values and concentration
+indices are array operations on it instead of a groupby and a loop per partner.
+An optional leading dimension (e.g. ``by='cmd'``) computes the same figures for
+several commodities at once; results are then indexed by that dimension first.
+"""
+import numpy as np
+import pandas as pd
+
+from tariffline.periods import period_range
+from tariffline.profiling import span
+
+
+DEFAULT_MEASURES = ('primaryValue', 'netWgt')
+
+# Growth is measured against the same month of the previous year, or the previous year
+YOY_LAG = {'period': 12, 'year': 1}
+
+TOTAL = 'Total'
+
+
+def _ratio(numerator, denominator):
+    """``numerator / denominator``, NaN where the denominator is not positive."""
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+class PartnerAnalytics:
+    """``values[measure][g, t, p]`` is the sum of ``measure`` for group ``g``, month ``t`` and partner ``p``."""
+
+    def __init__(self, groups, periods, partners, values, by=None):
+        self.groups = groups
+        self.periods = periods
+        self.partners = partners
+        self.values = values
+        self.by = by
+        self.years, self._year_starts = np.unique(periods // 100, return_index=True)
+
+    @classmethod
+    def build(cls, cube, by=None, measures=DEFAULT_MEASURES):
+        """Fill the matrix from ``cube``, one group per label of dimension ``by``."""
+        with span('analytics.build', cells=len(cube), by=by):
+            return cls._build(cube, by, list(measures))
+
+    @classmethod
+    def _build(cls, cube, by, measures):
+        groups = cube.labels[by] if by is not None else np.array([TOTAL], dtype=object)
+        if not len(cube) or 'period' not in cube.dims or 'partner' not in cube.dims:
+            empty = np.zeros((len(groups), 0, 0))
+            return cls(groups, np.array([], dtype=np.int64), np.array([], dtype=object),
+                       {measure: empty for measure in measures}, by)
+
+        period_labels = cube.labels['period'].astype(np.int64)
+        periods = np.array(period_range(period_labels.min(), period_labels.max()), dtype=np.int64)
+        partners = cube.labels['partner']
+
+        # Cell coordinates on the complete monthly axis
+        months = np.searchsorted(periods, period_labels)[cube.codes[:, cube.dims.index('period')]]
+        group_codes = cube.codes[:, cube.dims.index(by)] if by is not None else np.zeros(len(cube), dtype=np.int64)
+        shape = (len(groups), len(periods), len(partners))
+        flat = np.ravel_multi_index((group_codes, months, cube.codes[:, cube.dims.index('partner')]), shape)
+        values = {
+            measure: np.bincount(flat, weights=cube.values[:, cube.measures.index(measure)],
+                                 minlength=int(np.prod(shape))).reshape(shape)
+            for measure in measures
+        }
+        return cls(groups, periods, partners, values, by)
+
+    def _matrix(self, measure, grain, by_partner=True):
+        matrix = self.values[measure]
+        if grain == 'year' and matrix.shape[1]:
+            matrix = np.add.reduceat(matrix, self._year_starts, axis=1)
+        return matrix if by_partner else matrix.sum(axis=2, keepdims=True)
+
+    def _frame(self, array, grain, columns):
+        time = pd.Index(self.years if grain == 'year' else self.periods, name=grain)
+        if self.by is None:
+            index = time
+        else:
+            index = pd.MultiIndex.from_product([self.groups, time], names=[self.by, grain])
+        columns = pd.Index(columns, name='partner' if len(columns) != 1 or columns[0] != TOTAL else None)
+        return pd.DataFrame(array.reshape(-1, array.shape[2]), index=index, columns=columns)
+
+    def _columns(self, by_partner):
+        return list(self.partners) if by_partner else [TOTAL]
+
+    def totals(self, measure='primaryValue', grain='period', by_partner=True):
+        """``measure`` per month (or year) and partner; a single ``Total`` column unless ``by_partner``."""
+        return self._frame(self._matrix(measure, grain, by_partner), grain, self._columns(by_partner))
+
+    def _top_positions(self, n, measure):
+        # Per group, positions of the partners with the largest non-zero totals, in descending order
+        sums = self.values[measure].sum(axis=1)
+        order = np.argsort(-sums, axis=1, kind='stable')[:, :n]
+        return [row[sums[g, row] > 0] for g, row in enumerate(order)]
+
+    def top_partners(self, n=3, measure='primaryValue'):
+        """
+        Partners with the largest total ``measure``, in descending order: a list, or
+        a dict of lists per group when the analytics are grouped.
+        """
+        top = [self.partners[positions].tolist() for positions in self._top_positions(n, measure)]
+        return top[0] if self.by is None else dict(zip(self.groups, top))
+
+    def shares(self, measure='primaryValue', grain='year'):
+        """Share of each partner in the total ``measure`` of each month (or year), 0 to 1."""
+        matrix = self._matrix(measure, grain)
+        return self._frame(_ratio(matrix, matrix.sum(axis=2, keepdims=True)), grain, self._columns(True))
+
+    def growth(self, measure='primaryValue', grain='year', lag=None, by_partner=False):
+        """
+        Relative change of ``measure`` against ``lag`` steps earlier: year over year by
+        default, month over month with ``grain='period', lag=1``. NaN where the earlier
+        value is 0 or missing.
+        """
+        lag = YOY_LAG[grain] if lag is None else lag
+        matrix = self._matrix(measure, grain, by_partner)
+        change = np.full(matrix.shape, np.nan)
+        change[:, lag:] = _ratio(matrix[:, lag:], matrix[:, :-lag]) - 1
+        return self._frame(change, grain, self._columns(by_partner))
+
+    def unit_values(self, grain='year', by_partner=True, value='primaryValue', weight='netWgt'):
+        """``value`` per unit of ``weight`` (USD per kg by default), NaN where nothing was weighed."""
+        return self._frame(_ratio(self._matrix(value, grain, by_partner), self._matrix(weight, grain, by_partner)),
+                           grain, self._columns(by_partner))
+
+    def concentration(self, measure='primaryValue', grain='year'):
+        """Herfindahl-Hirschman index of partner shares per month (or year), 0 to 10000."""
+        matrix = self._matrix(measure, grain)
+        shares = _ratio(matrix, matrix.sum(axis=2, keepdims=True))
+        hhi = np.where(np.isnan(shares), 0, shares ** 2).sum(axis=2, keepdims=True) * 10000
+        hhi[matrix.sum(axis=2, keepdims=True) == 0] = np.nan
+        return self._frame(hhi, grain, ['HHI'])['HHI']
+
+    def partner_summary(self, n=5, measure='primaryValue', value='primaryValue', weight='netWgt'):
+        """
+        The top-``n`` partners by ``measure`` over the whole dataset with their totals,
+        share of the total, unit value and growth in the last year against the one before.
+        """
+        totals = {name: self.values[name].sum(axis=1) for name in (value, weight)}
+        yearly = self._matrix(value, 'year')
+        if yearly.shape[1] > 1:
+            latest = _ratio(yearly[:, -1], yearly[:, -2]) - 1
+        else:
+            latest = np.full(totals[value].shape, np.nan)
+        shares = _ratio(self.values[measure].sum(axis=1), self.values[measure].sum(axis=(1, 2))[:, None])
+        unit_values = _ratio(totals[value], totals[weight])
+
+        rows = []
+        for g, positions in enumerate(self._top_positions(n, measure)):
+            rows.append(pd.DataFrame({
+                'partner': self.partners[positions],
+                value: totals[value][g, positions],
+                weight: totals[weight][g, positions],
+                'share': shares[g, positions],
+                'unitValue': unit_values[g, positions],
+                'growthLastYear': latest[g, positions],
+            }).assign(**({self.by: self.groups[g]} if self.by is not None else {})))
+        summary = pd.concat(rows, ignore_index=True)
+        return summary.set_index(['partner'] if self.by is None else [self.by, 'partner'])
@@ -0,0 +1,181 @@
+"""Persistent per-period cache of tariff-line query results backed by SQLite."""
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+from tariffline.profiling import span
+from tariffline.schema import concat_frames, normalize, to_wire
+
+
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'tariffline.sqlite')
+
+DAY = 24 * 60 * 60
+
+# Recent months may still be revised by the reporter, so they expire quickly;
+# months older than this many months are treated as final and kept longer.
+# (Not the sync revision window: a sync re-requests fewer months, cached or not.)
+RECENT_PERIOD_MONTHS = 12
+DEFAULT_RECENT_TTL = 7 * DAY
+DEFAULT_FINAL_TTL = 180 * DAY
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS periods (
+    reporter_code INTEGER NOT NULL,
+    flow_code TEXT NOT NULL,
+    cmd_code TEXT NOT NULL,
+    period TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (reporter_code, flow_code, cmd_code, period)
+)
+"""
+
+
+def months_between(period, now=None):
+    """Number of whole months between a YYYYMM period and ``now``."""
+    now = now or datetime.now()
+    period = str(period)
+    return (now.year - int(period[:4])) * 12 + now.month - int(period[4:6])
+
+
+class PeriodCache:
+    """
+    Cache of tariff lines keyed by (reporterCode, flowCode, cmdCode, period).
+
+    Every period is stored separately, including periods that returned no rows,
+    so a wider date range only needs the periods that are missing or expired.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 recent_ttl=DEFAULT_RECENT_TTL, final_ttl=DEFAULT_FINAL_TTL,
+                 recent_months=RECENT_PERIOD_MONTHS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.recent_ttl = recent_ttl
+        self.final_ttl = final_ttl
+        self.recent_months = recent_months
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self):
+        # A fresh connection per call keeps the cache usable from fetch worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def ttl_for(self, period, now=None):
+        if months_between(period, now) > self.recent_months:
+            return self.final_ttl
+        return self.recent_ttl
+
+    def is_expired(self, period, fetched_at, now=None):
+        return time.time() - fetched_at > self.ttl_for(period, now)
+
+    def _fresh_periods(self, conn, reporter_code, flow_code, cmd_code, periods):
+        placeholders = ",".join("?" * len(periods))
+        rows = conn.execute(
+            f"SELECT period, fetched_at FROM periods "
+            f"WHERE reporter_code = ? AND flow_code = ? AND cmd_code = ? AND period IN ({placeholders})",
+            (reporter_code, flow_code, cmd_code, *periods)
+        ).fetchall() if periods else []
+        now = datetime.now()
+        return {period for period, fetched_at in rows if not self.is_expired(period, fetched_at, now)}
+
+    def missing(self, reporter_code, flow_code, cmd_code, periods):
+        """Periods that are not cached or have expired, in the given order."""
+        periods = [str(p) for p in periods]
+        with closing(self._connect()) as conn:
+            fresh = self._fresh_periods(conn, reporter_code, flow_code, cmd_code, periods)
+        return [period for period in periods if period not in fresh]
+
+    def iter_periods(self, reporter_code, flow_code, cmd_code, periods):
+        """Yield ``(period, DataFrame)`` for every fresh cached period in the given order, one at a time."""
+        periods = [str(p) for p in periods]
+        with closing(self._connect()) as conn:
+            with conn:
+                fresh = self._fresh_periods(conn, reporter_code, flow_code, cmd_code, periods)
+                if fresh:
+                    conn.execute(
+                        f"UPDATE periods SET accessed_at = ? "
+                        f"WHERE reporter_code = ? AND flow_code = ? AND cmd_code = ? "
+                        f"AND period IN ({','.join('?' * len(fresh))})",
+                        (time.time(), reporter_code, flow_code, cmd_code, *fresh)
+                    )
+            for period in periods:
+                if period in fresh:
+                    payload, = conn.execute(
+                        "SELECT payload FROM periods "
+                        "WHERE reporter_code = ? AND flow_code = ? AND cmd_code = ? AND period = ?",
+                        (reporter_code, flow_code, cmd_code, period)
+                    ).fetchone()
+                    with span('cache.read', period=period):
+                        data_df = normalize(pd.DataFrame(json.loads(payload)))
+                    yield period, data_df
+
+    def get(self, reporter_code, flow_code, cmd_code, periods):
+        """Return the cached rows for ``periods`` and the list of periods that must be fetched."""
+        periods = [str(p) for p in periods]
+        cached = dict(self.iter_periods(reporter_code, flow_code, cmd_code, periods))
+        missing = [period for period in periods if period not in cached]
+        return concat_frames(cached.values()), missing
+
+    def put(self, reporter_code, flow_code, cmd_code, period, data_df):
+        """Store the rows of one period, replacing any previous entry."""
+        now = time.time()
+        with span('cache.write', period=str(period)), closing(self._connect()) as conn, conn:
+            payload = (to_wire(data_df).to_json(orient='records', force_ascii=False, double_precision=15)
+                       if not data_df.empty else '[]')
+            conn.execute(
+                "INSERT OR REPLACE INTO periods VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (reporter_code, flow_code, cmd_code, str(period), len(data_df), payload, len(payload), now, now)
+            )
+
+    def put_many(self, reporter_code, flow_code, cmd_code, periods, data_df):
+        """Split a multi-period result by its ``period`` column and store every period, even empty ones."""
+        if 'period' in data_df.columns:
+            by_period = {str(p): group for p, group in data_df.groupby(data_df['period'].astype(str))}
+        else:
+            by_period = {}
+        for period in map(str, periods):
+            self.put(reporter_code, flow_code, cmd_code, period, by_period.get(period, pd.DataFrame()))
+
+    def evict(self):
+        """Drop expired periods, then the least recently used ones until the cache fits ``max_bytes``."""
+        now = datetime.now()
+        with closing(self._connect()) as conn, conn:
+            entries = conn.execute(
+                "SELECT reporter_code, flow_code, cmd_code, period, fetched_at, size "
+                "FROM periods ORDER BY accessed_at DESC"
+            ).fetchall()
+
+            total = 0
+            stale = []
+            for reporter_code, flow_code, cmd_code, period, fetched_at, size in entries:
+                if self.is_expired(period, fetched_at, now) or total + size > self.max_bytes:
+                    stale.append((reporter_code, flow_code, cmd_code, period))
+                else:
+                    total += size
+            conn.executemany(
+                "DELETE FROM periods WHERE reporter_code = ? AND flow_code = ? AND cmd_code = ? AND period = ?",
+                stale
+            )
+        return len(stale)
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM periods")
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM periods").fetchone()
+        return {'periods': count, 'bytes': size}
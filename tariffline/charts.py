@@ -0,0 +1,181 @@
+"""Matplotlib chart builders and rendering helpers.
+
+matplotlib is imported inside the functions, so importing this module (and the
+rest of the library) stays cheap for headless jobs that never draw a chart.
+"""
+import io
+
+from tariffline.profiling import span
+
+
+# Resolution of charts shown on the page and of the downloadable PNG
+SCREEN_DPI = 100
+EXPORT_DPI = 300
+
+# Line charts with more points than this are drawn without point markers
+MARKER_POINTS = 120
+
+
+def figure_to_png(fig, dpi=SCREEN_DPI):
+    """Render a figure to PNG bytes and close it, so pyplot does not keep it alive."""
+    import matplotlib.pyplot as plt
+    
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight', facecolor=fig.get_facecolor())
+    finally:
+        plt.close(fig)
+    return buf.getvalue()
+
+
+# Function to create the yearly import chart of the top-3 partners
+def build_phosphate_imports_figure(yearly_weights):
+    import matplotlib.pyplot as plt
+    
+    top3_countries = list(yearly_weights.columns)
+    
+    # Отримуємо роки для осі X
+    years = yearly_weights.index.tolist()
+    
+    # Створюємо фігуру для графіка
+    fig, ax = plt.subplots(figsize=(10, 6), facecolor='white')
+    
+    # Налаштування фону графіка
+    ax.set_facecolor('white')
+    
+    # Параметри сітки
+    ax.grid(True, linestyle='--', alpha=0.3, axis='y')
+    
+    # Створюємо словник з кольорами для країн
+    colors = {
+        top3_countries[0]: 'red',
+        top3_countries[1]: 'blue',
+        top3_countries[2]: 'green'
+    }
+    
+    
+    # Налаштування осей
+    max_value = yearly_weights.values.max() * 1.2
+    ax.set_ylim(0, max_value)
+    
+   
+    # Додаємо лінії для кожної країни
+    for country in top3_countries:
+        # Побудова лінії (роки без імпорту вже заповнені нулями)
+        ax.plot(
+            years, 
+            yearly_weights[country].values, 
+            color=colors[country], 
+            linewidth=2, 
+            marker='o',
+            markersize=6,
+            label=country  # Використовуємо назви країни
+        )
+    
+    # Налаштування розмітки осі X (роки)
+    ax.set_xticks(years)
+    
+    # Додавання заголовка українською
+    ax.set_title('ІМПОРТ ФОСФАТНИХ ДОБРИВ ДО  УКРАЇНА', fontsize=14, fontweight='bold', color='black')
+    
+    # Додавання підписів осей українською
+    ax.set_ylabel('тис. тонн', fontsize=12, color='black')
+    ax.set_xlabel('Рік', fontsize=12, color='black')
+    
+    # Прибираємо рамку навколо графіка для мінімалістичного дизайну
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    
+    # Додавання легенди
+    ax.legend(loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=3, frameon=False)
+    
+    # Налаштування макету для кращого відображення
+    plt.tight_layout()
+    
+    return fig
+
+
+# Function to create NPK import trend line chart by year
+def plot_npk_yearly_trend(yearly_data):
+    import matplotlib.pyplot as plt
+    
+    if not yearly_data.empty:
+        fig, ax = plt.subplots(figsize=(12, 6))
+        
+        # Plot the line
+        ax.plot(yearly_data['year'], yearly_data['primaryValue'], marker='o', linestyle='-', linewidth=2, color='#3366cc')
+        
+        # Add data points and values
+        for x, y in zip(yearly_data['year'], yearly_data['primaryValue']):
+            ax.annotate(f"{y/1000000:.1f}M", 
+                        (x, y),
+                        textcoords="offset points", 
+                        xytext=(0, 10), 
+                        ha='center')
+        
+        # Set title and labels
+        ax.set_title('Річний імпорт НПК добрив в Україну', fontsize=16)
+        ax.set_xlabel('Рік', fontsize=12)
+        ax.set_ylabel('Вартість (USD)', fontsize=12)
+        
+        # Format y-axis to show in millions
+        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'{x/1000000:.1f}M'))
+        
+        # Set grid
+        ax.grid(True, linestyle='--', alpha=0.7)
+        
+        # Make sure years are integers on x-axis
+        ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
+        
+        # Tight layout
+        plt.tight_layout()
+        
+        return fig
+    else:
+        return None
+
+# Function to create the monthly average bar chart
+def plot_monthly_average(monthly_avg):
+    import matplotlib.pyplot as plt
+    
+    fig, ax = plt.subplots(figsize=(10, 5))
+    monthly_avg.plot(kind='bar', ax=ax)
+    ax.set_title('Average Import Value by Month')
+    ax.set_ylabel('Average Value (USD)')
+    plt.tight_layout()
+    return fig
+
+# Function to create the value-over-time line chart, one line per column of an already downsampled table
+def plot_value_over_time(table, title='Import Value Over Time'):
+    import matplotlib.pyplot as plt
+    
+    fig, ax = plt.subplots(figsize=(12, 6))
+    # Markers only while the individual points can still be told apart
+    marker = 'o' if len(table) <= MARKER_POINTS else None
+    for column in table.columns:
+        ax.plot(table.index, table[column], marker=marker, linestyle='-', label=str(column))
+    ax.set_title(title)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Value (USD)')
+    ax.grid(True)
+    if len(table.columns) > 1:
+        ax.legend()
+    
+    # Format x-axis to show dates nicely
+    plt.setp(ax.get_xticklabels(), rotation=45)
+    plt.tight_layout()
+    return fig
+
+# Chart builders by name, used by the figure cache and the CLI
+CHARTS = {
+    'phosphate_imports': build_phosphate_imports_figure,
+    'npk_yearly_trend': plot_npk_yearly_trend,
+    'monthly_average': plot_monthly_average,
+    'value_over_time': plot_value_over_time,
+}
+
+
+def render_png(chart, data, dpi=SCREEN_DPI, **params):
+    """Build the chart registered as ``chart`` from aggregated ``data`` and render it to PNG bytes."""
+    with span(f'render.{chart}', dpi=dpi):
+        return figure_to_png(CHARTS[chart](data, **params), dpi=dpi)
@@ -0,0 +1,227 @@
+"""
+Headless batch runner: ``comtrade-fetch --cmd 310520 --from 2019-01 --to 2025-03 --out data.parquet``.
+
+Uses the same fetch, cache, scheduling and storage code as the Streamlit app.
+Heavy dependencies are imported only once the arguments have been parsed.
+"""
+import argparse
+import json
+import os
+import sys
+
+
+KEY_ENVIRONMENT_VARIABLE = 'COMTRADE_SUBSCRIPTION_KEY'
+
+
+def parse_period(value):
+    """Accept YYYY-MM or YYYYMM and return YYYYMM as a string."""
+    period = value.replace('-', '')
+    if len(period) != 6 or not period.isdigit() or not 1 <= int(period[4:]) <= 12:
+        raise argparse.ArgumentTypeError(f"invalid period {value!r}, expected YYYY-MM or YYYYMM")
+    return period
+
+
+def build_parser():
+    from tariffline.defaults import (AUTO_CHUNK, CHUNK_SIZES, DEFAULT_BASE_URL, DEFAULT_MAX_WORKERS,
+                                     DEFAULT_REVISION_MONTHS, DEFAULT_TIER, SUBSCRIPTION_TIERS)
+
+    parser = argparse.ArgumentParser(prog='comtrade-fetch', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cmd', nargs='+', required=True,
+                        help="HS commodity code(s); chapters and headings (e.g. 31, 3105) are expanded to subheadings "
+                             "when the HS nomenclature lists all of them")
+    parser.add_argument('--from', dest='start', type=parse_period, help="first period, YYYY-MM")
+    parser.add_argument('--to', dest='end', type=parse_period, help="last period, YYYY-MM (default: current month)")
+    parser.add_argument('--out', required=True, help="output file, .parquet or .json")
+    parser.add_argument('--key', default=os.environ.get(KEY_ENVIRONMENT_VARIABLE),
+                        help=f"subscription key (default: ${KEY_ENVIRONMENT_VARIABLE})")
+    parser.add_argument('--reporter', nargs='+', default=['804'], help="reporter code(s), default 804 (Ukraine)")
+    parser.add_argument('--flow', nargs='+', default=['M'], help="flow code(s), default M")
+    parser.add_argument('--chunk', choices=CHUNK_SIZES + (AUTO_CHUNK,), default='month',
+                        help=f"periods per request; {AUTO_CHUNK} sizes requests from countOnly probes")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help="parallel requests")
+    parser.add_argument('--tier', choices=sorted(SUBSCRIPTION_TIERS), default=DEFAULT_TIER,
+                        help="subscription tier, sets rate limit and daily quota")
+    parser.add_argument('--no-cache', action='store_true', help="do not use the local period cache")
+    parser.add_argument('--sync', action='store_true',
+                        help="only fetch months after the watermark stored in --out (plus the revision window)")
+    parser.add_argument('--revision-months', type=int, default=DEFAULT_REVISION_MONTHS,
+                        help="stored months re-requested by --sync")
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL, help="API endpoint, e.g. a local fake server")
+    replay = parser.add_mutually_exclusive_group()
+    replay.add_argument('--record', metavar='DIR', help="also record every API response in this archive directory")
+    replay.add_argument('--replay', metavar='SOURCE', nargs='+',
+                        help="answer requests from recorded archive directories and seed dataset files "
+                             "instead of the API; no network access, key or quota needed")
+    parser.add_argument('--replay-latency', type=float, default=0.0, help="seconds added to every replayed response")
+    parser.add_argument('--replay-rate', type=float,
+                        help="replayed requests per second before simulated 429 responses")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="also keep the result in the snapshot store shared with the app")
+    parser.add_argument('--estimate', action='store_true',
+                        help="only probe row counts and print the estimated download size and time")
+    parser.add_argument('--chart', metavar='PATH', help="also save the phosphate imports chart as PNG")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="save timing spans and peak memory; OpenMetrics text for .prom/.txt, JSON otherwise")
+    return parser
+
+
+def single_query(args):
+    return len(args.cmd) == 1 and len(args.reporter) == 1 and len(args.flow) == 1
+
+
+def make_api(args):
+    if args.replay:
+        from tariffline.replay import ReplayClient
+        return ReplayClient.open(args.replay, latency=args.replay_latency, rate=args.replay_rate)
+    from tariffline.client import ComtradeClient
+
+    api = ComtradeClient(base_url=args.base_url)
+    if args.record:
+        from tariffline.replay import RecordingClient, ResponseArchive
+        return RecordingClient(api, ResponseArchive(args.record))
+    return api
+
+
+def save_snapshot(data_path, kind, query, metadata):
+    from tariffline.snapshots import SnapshotStore
+
+    metadata['snapshot_id'] = SnapshotStore().add(data_path, kind, query, metadata).id
+
+
+def estimate(api, args, periods, scheduler, query):
+    from tariffline.fetch import size_periods
+    from tariffline.planner import plan_batch, size_plan
+
+    if single_query(args):
+        plan = size_periods(api, args.key, periods, args.cmd[0], max_workers=args.workers, scheduler=scheduler,
+                            **query)
+    else:
+        calls = plan_batch(args.reporter, args.flow, args.cmd, periods)
+        plan = size_plan(api, args.key, calls, max_workers=args.workers, scheduler=scheduler)
+    return {**plan.estimate(rate=scheduler.limiter.rate, max_workers=args.workers),
+            'oversized_parts': len(plan.oversized)}
+
+
+def run(args):
+    from tariffline.cache import PeriodCache
+    from tariffline.defaults import AUTO_CHUNK
+    from tariffline.periods import current_period, period_range
+    from tariffline.planner import plan_batch, size_plan, sized_calls
+    from tariffline.pipeline import fetch_to_file, run_plan_to_file
+    from tariffline.scheduler import RequestScheduler
+    from tariffline.snapshots import fetch_query
+    from tariffline.storage import export_json, load_dataset
+    from tariffline.sync import incremental_sync, synced_periods
+
+    api = make_api(args)
+    if args.replay:
+        from tariffline.replay import replay_scheduler
+        # Replayed requests use neither the tier's rate limit nor its daily quota
+        scheduler = replay_scheduler()
+    else:
+        scheduler = RequestScheduler.for_tier(args.tier)
+    end = args.end or str(current_period())
+    json_out = args.out.lower().endswith('.json')
+    query = {'reporterCode': args.reporter[0], 'flowCode': args.flow[0]}
+
+    if args.sync:
+        _, metadata, _ = incremental_sync(api, args.key, args.out, args.cmd[0], start_period=args.start,
+                                          until_period=end, revision_months=args.revision_months,
+                                          metadata={'commodity_code': args.cmd[0]}, chunk=args.chunk,
+                                          max_workers=args.workers, scheduler=scheduler, **query)
+        if args.snapshot:
+            periods = synced_periods(metadata)
+            save_snapshot(args.out, 'sync', fetch_query(args.cmd[0], periods, **query), metadata)
+        return metadata
+
+    periods = period_range(args.start, end)
+    if args.estimate:
+        return estimate(api, args, periods, scheduler, query)
+    data_path = args.out + '.parquet' if json_out else args.out
+    if single_query(args):
+        # Replayed rows are kept out of the cache of live API responses
+        cache = None if args.no_cache or args.replay else PeriodCache()
+        metadata, _ = fetch_to_file(
+            api, args.key, periods, args.cmd[0], data_path, cache=cache, build_cube=not json_out,
+            chunk=args.chunk, max_workers=args.workers, scheduler=scheduler, **query
+        )
+    else:
+        calls = plan_batch(args.reporter, args.flow, args.cmd, periods)
+        if args.chunk == AUTO_CHUNK:
+            calls = sized_calls(size_plan(api, args.key, calls, max_workers=args.workers, scheduler=scheduler))
+        metadata, _ = run_plan_to_file(
+            api, args.key, calls, data_path,
+            metadata={'reporter_codes': args.reporter, 'flow_codes': args.flow, 'commodity_codes': args.cmd},
+            build_cube=not json_out, max_workers=args.workers, scheduler=scheduler
+        )
+
+    if args.snapshot:
+        if single_query(args):
+            save_snapshot(data_path, 'fetch', fetch_query(args.cmd[0], periods, **query), metadata)
+        else:
+            save_snapshot(data_path, 'batch', {'reporter_codes': args.reporter, 'flow_codes': args.flow,
+                                               'commodity_codes': args.cmd, 'periods': periods}, metadata)
+
+    if json_out:
+        export_json(load_dataset(data_path)[0], args.out, metadata)
+        os.remove(data_path)
+    return metadata
+
+
+def save_chart(data_path, chart_path):
+    from tariffline.aggregations import partner_yearly_weight
+    from tariffline.charts import EXPORT_DPI, render_png
+    from tariffline.cube import load_cube
+
+    cube = load_cube(data_path)
+    if not len(cube):
+        raise ValueError("no rows retrieved, chart not saved")
+    png = render_png('phosphate_imports', partner_yearly_weight(cube), dpi=EXPORT_DPI)
+    with open(chart_path, 'wb') as f:
+        f.write(png)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if any(len(code) < 6 for code in args.cmd):
+        from tariffline.hs import HSIndex
+        try:
+            args.cmd = HSIndex.load().expand(args.cmd)
+        except ValueError as e:
+            parser.error(str(e))
+    if not args.key and not args.replay:
+        parser.error(f"a subscription key is required (--key or ${KEY_ENVIRONMENT_VARIABLE})")
+    if args.sync:
+        if args.out.lower().endswith('.json') or not single_query(args):
+            parser.error("--sync needs a single reporter, flow and commodity code and a Parquet --out")
+        if args.estimate:
+            parser.error("--estimate cannot be combined with --sync")
+    elif not args.start:
+        parser.error("--from is required unless --sync is given")
+
+    from tariffline.profiling import Profiler, activate
+
+    profiler = Profiler() if args.profile else None
+    activate(profiler)
+    try:
+        metadata = run(args)
+        if args.chart and not args.estimate:
+            save_chart(args.out, args.chart)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if profiler is not None:
+            profiler.save(args.profile)
+
+    if metadata.get('truncated_calls'):
+        print(f"Warning: calls still at the record limit, their rows beyond it are missing: "
+              f"{', '.join(metadata['truncated_calls'])}", file=sys.stderr)
+    json.dump(metadata, sys.stdout, indent=4, default=str)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
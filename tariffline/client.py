@@ -0,0 +1,92 @@
+"""Minimal HTTP client for the tariff-line endpoint that reports HTTP errors instead of swallowing them."""
+import json
+
+import pandas as pd
+import urllib3
+
+from tariffline.defaults import DEFAULT_BASE_URL
+from tariffline.profiling import span
+
+
+DEFAULT_TIMEOUT = 120
+
+
+class ApiError(Exception):
+    """
+    A failed API request. ``status`` is None when the HTTP status is unknown;
+    ``transient`` marks failures without a response, such as timeouts and dropped connections.
+    """
+
+    def __init__(self, message, status=None, retry_after=None, transient=False):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.transient = transient
+
+    @property
+    def retryable(self):
+        # Throttling, server errors and network failures are worth another try. An unknown
+        # status may be a rejected key or a bad request, which would fail the same way again
+        if self.status is None:
+            return self.transient
+        return self.status == 429 or self.status >= 500
+
+
+def request_fields(reporterCode, flowCode, period, cmdCode, partnerCode, partner2Code, motCode, customsCode,
+                   maxRecords=None, format_output=None, countOnly=None, includeDesc=None):
+    """Query string fields of a tariff-line request (without the subscription key), all as strings."""
+    params = dict(reportercode=reporterCode, flowCode=flowCode, period=period, cmdCode=cmdCode,
+                  partnerCode=partnerCode, partner2Code=partner2Code, motCode=motCode,
+                  customsCode=customsCode, maxRecords=maxRecords, format=format_output,
+                  countOnly=countOnly, includeDesc=includeDesc)
+    return {k: str(v) for k, v in params.items() if v is not None}
+
+
+def response_frame(body, count_only=False):
+    """DataFrame of a decoded tariff-line response body, as ``comtradeapicall`` returns it."""
+    if count_only:
+        return pd.DataFrame([{'count': body['count']}])
+    return pd.json_normalize(body.get('data') or [])
+
+
+class ComtradeClient:
+    """
+    Drop-in replacement for the ``comtradeapicall`` functions used by the fetcher.
+
+    ``getTarifflineData`` takes the same arguments as ``comtradeapicall.getTarifflineData``
+    but raises ``ApiError`` with the HTTP status (and ``Retry-After``) on failure, so
+    throttling can be told apart from bad requests and retried. This is the live API
+    of the app and the CLI; ``base_url`` can point at a local fake server for tests
+    and benchmarks.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT, proxy_url=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.http = urllib3.ProxyManager(proxy_url) if proxy_url else urllib3.PoolManager(maxsize=16)
+
+    def getTarifflineData(self, subscription_key, typeCode, freqCode, clCode, period, reporterCode, cmdCode,
+                          flowCode, partnerCode, partner2Code, customsCode, motCode, maxRecords=None,
+                          format_output=None, countOnly=None, includeDesc=None, proxy_url=None):
+        url = f"{self.base_url}/data/v1/getTariffline/{typeCode}/{freqCode}/{clCode}"
+        fields = request_fields(reporterCode, flowCode, period, cmdCode, partnerCode, partner2Code, motCode,
+                                customsCode, maxRecords, format_output, countOnly, includeDesc)
+        if subscription_key is not None:
+            fields['subscription-key'] = str(subscription_key)
+
+        try:
+            with span('api.http'):
+                resp = self.http.request('GET', url, fields=fields, timeout=self.timeout, retries=False)
+        except urllib3.exceptions.HTTPError as e:
+            raise ApiError(f"Request error: {e}", transient=True) from e
+
+        if resp.status != 200:
+            retry_after = resp.headers.get('Retry-After')
+            raise ApiError(
+                f"HTTP {resp.status}: {resp.data.decode('utf-8', errors='replace')[:200]}",
+                status=resp.status,
+                retry_after=float(retry_after) if retry_after else None
+            )
+
+        with span('api.deserialize', bytes=len(resp.data)):
+            return response_frame(json.loads(resp.data), count_only=countOnly)
@@ -0,0 +1,204 @@
+"""
+Pre-aggregated cube of tariff-line measures for fast roll-ups, slices and drill-downs.
+
+The cube is built once per dataset: rows are collapsed to one cell per distinct
+combination of the dimensions below, with measure sums and the row count per
+cell. Dimension values are stored as integer codes into per-dimension label
+arrays, so every query is a NumPy mask plus a ``bincount`` over the cells
+instead of a pandas groupby over the raw rows.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from tariffline.profiling import span
+from tariffline.storage import load_dataset
+
+
+# Cube dimension -> source column. ``year`` is derived from ``period``.
+DIMENSIONS = {
+    'reporter': 'reporterCode',
+    'flow': 'flowCode',
+    'cmd': 'cmdCode',
+    'period': 'period',
+    'partner': 'partnerDesc',
+    'partner2': 'partner2Desc',
+    'customs': 'customsCode',
+    'mot': 'motCode',
+}
+
+MEASURES = ('primaryValue', 'netWgt', 'qty', 'cifvalue', 'fobvalue')
+
+# Number of source rows per cell, kept alongside the sums so means can be computed
+COUNT = 'count'
+
+# Columns needed to build a cube, for column projection when reading a stored dataset
+CUBE_COLUMNS = list(DIMENSIONS.values()) + list(MEASURES)
+
+CUBE_SUFFIX = '.cube.npz'
+
+
+def _factorize(column):
+    if isinstance(column.dtype, pd.CategoricalDtype) and not column.isna().any():
+        # Categoricals already carry integer codes; only unused categories are dropped
+        column = column.cat.remove_unused_categories()
+        categories = column.cat.categories
+        order = np.argsort(categories.to_numpy())
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order))
+        return ranks[column.cat.codes.to_numpy()], np.asarray(categories[order], dtype=object)
+    if isinstance(column.dtype, pd.CategoricalDtype) or column.dtype == object:
+        column = column.astype(object).fillna('')
+    codes, labels = pd.factorize(column, sort=True, use_na_sentinel=False)
+    return codes, np.asarray(labels)
+
+
+class TariffCube:
+    """Measure sums per cell; ``codes[i, j]`` indexes ``labels[dims[j]]`` for cell ``i``."""
+
+    def __init__(self, dims, labels, codes, measures, values):
+        self.dims = list(dims)
+        self.labels = labels
+        self.codes = codes
+        self.measures = list(measures)
+        self.values = values
+
+    @classmethod
+    def build(cls, data_df):
+        """Collapse the rows of ``data_df`` into cube cells."""
+        with span('cube.build', rows=len(data_df)):
+            return cls._build(data_df)
+
+    @classmethod
+    def _build(cls, data_df):
+        dims = [dim for dim, column in DIMENSIONS.items() if column in data_df.columns]
+        labels, row_codes = {}, []
+        for dim in dims:
+            codes, labels[dim] = _factorize(data_df[DIMENSIONS[dim]])
+            row_codes.append(codes)
+
+        sizes = [max(len(labels[dim]), 1) for dim in dims]
+        keys = np.ravel_multi_index(row_codes, sizes) if dims else np.zeros(len(data_df), dtype=np.int64)
+        cells, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+
+        # Sums skip missing values, as pandas does; absent measure columns sum to 0
+        values = np.empty((len(cells), len(MEASURES) + 1))
+        for j, measure in enumerate(MEASURES):
+            if measure in data_df.columns:
+                weights = np.nan_to_num(pd.to_numeric(data_df[measure], errors='coerce').to_numpy(float))
+                values[:, j] = np.bincount(inverse, weights=weights, minlength=len(cells))
+            else:
+                values[:, j] = 0.0
+        values[:, -1] = np.bincount(inverse, minlength=len(cells))
+
+        codes = np.column_stack(np.unravel_index(cells, sizes)) if dims else np.empty((len(cells), 0))
+        codes = codes.astype(np.int32)
+
+        if 'period' in labels:
+            # Year is a function of period, so it adds a dimension without adding cells
+            period_years = labels['period'].astype(np.int64) // 100
+            labels['year'], year_of_period = np.unique(period_years, return_inverse=True)
+            year_codes = year_of_period.ravel()[codes[:, dims.index('period')]]
+            dims.append('year')
+            codes = np.column_stack([codes, year_codes]).astype(np.int32)
+
+        return cls(dims, labels, codes, list(MEASURES) + [COUNT], values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.values.nbytes + sum(labels.nbytes for labels in self.labels.values())
+
+    def _mask(self, filters):
+        mask = np.ones(len(self), dtype=bool)
+        for dim, selected in filters.items():
+            if not isinstance(selected, (list, tuple, set, np.ndarray, pd.Index)):
+                selected = [selected]
+            allowed = np.flatnonzero(np.isin(self.labels[dim], list(selected)))
+            mask &= np.isin(self.codes[:, self.dims.index(dim)], allowed)
+        return mask
+
+    def slice(self, **filters):
+        """Sub-cube restricted to the given dimension values, e.g. ``slice(year=2023, partner=['Poland'])``."""
+        mask = self._mask(filters)
+        return TariffCube(self.dims, self.labels, self.codes[mask], self.measures, self.values[mask])
+
+    def rollup(self, dims=(), measures=None, **filters):
+        """
+        Measure sums grouped by ``dims`` (a dimension name or a list of them).
+
+        Returns a DataFrame indexed by the dimension labels, or a Series of grand
+        totals when no dimensions are given. Keyword filters are applied first,
+        as in ``slice``.
+        """
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        measures = self.measures if measures is None else list(measures)
+        columns = [self.measures.index(measure) for measure in measures]
+        mask = self._mask(filters) if filters else slice(None)
+        values = self.values[mask][:, columns]
+        if not dims:
+            return pd.Series(values.sum(axis=0), index=measures)
+
+        sizes = [len(self.labels[dim]) for dim in dims]
+        codes = self.codes[mask][:, [self.dims.index(dim) for dim in dims]]
+        cells, inverse = np.unique(np.ravel_multi_index(codes.T, sizes), return_inverse=True)
+        inverse = inverse.ravel()
+        sums = np.column_stack([np.bincount(inverse, weights=values[:, j], minlength=len(cells))
+                                for j in range(len(measures))])
+
+        cell_codes = np.unravel_index(cells, sizes)
+        index = [self.labels[dim][cell_codes[i]] for i, dim in enumerate(dims)]
+        if len(dims) == 1:
+            index = pd.Index(index[0], name=dims[0])
+        else:
+            index = pd.MultiIndex.from_arrays(index, names=dims)
+        return pd.DataFrame(sums.reshape(len(cells), len(measures)), index=index, columns=measures)
+
+    def top(self, dim, measure='primaryValue', n=3, **filters):
+        """Labels of ``dim`` with the largest ``measure`` totals, in descending order."""
+        totals = self.rollup(dim, [measure], **filters)[measure]
+        return totals.sort_values(ascending=False, kind='stable').head(n).index.tolist()
+
+    def save(self, path):
+        """Write the cube to a compressed ``.npz`` file (no pickled objects)."""
+        arrays = {f'labels_{dim}': self._storable(labels) for dim, labels in self.labels.items()}
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, dims=np.array(self.dims), measures=np.array(self.measures),
+                            codes=self.codes, values=self.values, **arrays)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _storable(labels):
+        return labels.astype(str) if labels.dtype == object else labels
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            dims = npz['dims'].tolist()
+            labels = {dim: npz[f'labels_{dim}'] for dim in dims}
+            return cls(dims, labels, npz['codes'], npz['measures'].tolist(), npz['values'])
+
+
+def cube_path(data_path):
+    """Location of the cube stored next to the dataset at ``data_path``."""
+    return data_path + CUBE_SUFFIX
+
+
+def build_cube_file(data_path):
+    """Build the cube for the dataset at ``data_path`` and store it next to the dataset."""
+    data_df, _ = load_dataset(data_path, columns=CUBE_COLUMNS)
+    cube = TariffCube.build(data_df)
+    cube.save(cube_path(data_path))
+    return cube
+
+
+def load_cube(data_path):
+    """Stored cube for the dataset at ``data_path``, rebuilt if missing or older than the dataset."""
+    path = cube_path(data_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(data_path):
+        return TariffCube.load(path)
+    return build_cube_file(data_path)
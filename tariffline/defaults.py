@@ -0,0 +1,19 @@
+"""Defaults and choices shared by the engine and the CLI, kept free of heavy imports."""
+
+DEFAULT_BASE_URL = 'https://comtradeapi.un.org'
+
+CHUNK_SIZES = ('month', 'quarter')
+DEFAULT_MAX_WORKERS = 4
+
+# Chunks sized from ``countOnly`` probes instead of a fixed number of months
+AUTO_CHUNK = 'auto'
+
+# Request rate and daily call quota per subscription tier
+SUBSCRIPTION_TIERS = {
+    'free': {'rate': 1.0, 'capacity': 1, 'daily_calls': 500},
+    'premium': {'rate': 5.0, 'capacity': 5, 'daily_calls': 10000},
+}
+DEFAULT_TIER = 'free'
+
+# Recent months are re-requested on every sync because reporters revise them
+DEFAULT_REVISION_MONTHS = 3
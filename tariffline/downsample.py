@@ -0,0 +1,77 @@
+"""
+Visual downsampling of time series to a point budget before they are drawn.
+
+A chart cannot show more points than it has pixels, so series longer than the
+budget are reduced to the points that keep their shape: Largest-Triangle-Three-
+Buckets (``lttb``) for line charts, or the minimum and maximum of each bucket
+(``minmax``) where every peak must survive.
+"""
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_POINT_BUDGET = 500
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype('datetime64[ns]').astype(np.int64)
+    return values.astype(np.float64)
+
+
+def lttb(x, y, n):
+    """Indices of the ``n`` points of (x, y) kept by Largest-Triangle-Three-Buckets."""
+    length = len(y)
+    if n >= length or n < 3:
+        return np.arange(length)
+    x, y = _as_float(x), _as_float(y)
+
+    # The first and last points are always kept; the rest is split into n - 2 buckets
+    edges = np.linspace(1, length - 1, n - 1).astype(np.int64)
+    selected = np.empty(n, dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+    previous = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (length - 1, length)
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # Keep the point forming the largest triangle with the previous pick and the next bucket's mean
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax(x, y, n):
+    """Indices of the minimum and maximum of ``y`` in each of ``n // 2`` buckets, in order."""
+    length = len(y)
+    if n >= length or n < 2:
+        return np.arange(length)
+    y = _as_float(y)
+    edges = np.linspace(0, length, n // 2 + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            bucket = y[start:end]
+            selected += [start + int(np.argmin(bucket)), start + int(np.argmax(bucket))]
+    return np.unique(selected)
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(table, budget=DEFAULT_POINT_BUDGET, method='lttb'):
+    """
+    Rows of ``table`` (indexed by the x values, one column per series) reduced to
+    about ``budget`` points per series. Rows picked for any series are kept for
+    all of them, so the series stay aligned. Shorter tables are returned as is.
+    """
+    if len(table) <= budget:
+        return table
+    frame = table.to_frame() if isinstance(table, pd.Series) else table
+    x = frame.index.to_numpy()
+    keep = np.unique(np.concatenate([METHODS[method](x, frame[column].to_numpy(), budget)
+                                     for column in frame.columns]))
+    return table.iloc[keep]
@@ -0,0 +1,163 @@
+"""
+Streamed exports of tariff-line frames to CSV, gzip-compressed CSV, Parquet and Excel.
+
+Exports are written chunk by chunk, so memory is bounded by one chunk rather
+than by a full copy of the dataset as text, into ``.cache/exports`` under a name
+derived from the dataset key: an unchanged dataset is exported once per format
+however often it is downloaded. Files are written under a temporary name and
+moved into place. Excel needs the optional ``openpyxl`` package.
+"""
+import glob
+import importlib.util
+import os
+import threading
+import zlib
+from dataclasses import dataclass
+
+from tariffline.profiling import span
+from tariffline.storage import ParquetAppender
+
+
+DEFAULT_EXPORT_DIR = os.path.join('.cache', 'exports')
+
+# Rows converted to text (or Arrow) at a time
+EXPORT_CHUNK_ROWS = 50_000
+
+# Export files kept on disk; the least recently written are removed first
+DEFAULT_KEEP_EXPORTS = 20
+
+# Worksheet rows available for data below the header row
+EXCEL_MAX_ROWS = 1_048_575
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    name: str
+    suffix: str
+    mime: str
+    label: str
+    requires: str = None
+
+    @property
+    def available(self):
+        return self.requires is None or importlib.util.find_spec(self.requires) is not None
+
+
+FORMATS = {fmt.name: fmt for fmt in (
+    ExportFormat('csv', '.csv', 'text/csv', "CSV"),
+    ExportFormat('csv.gz', '.csv.gz', 'application/gzip', "CSV (gzip)"),
+    ExportFormat('parquet', '.parquet', 'application/vnd.apache.parquet', "Parquet"),
+    ExportFormat('xlsx', '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', "Excel",
+                 requires='openpyxl'),
+)}
+
+
+def available_formats():
+    """Names of the export formats whose dependencies are installed."""
+    return [name for name, fmt in FORMATS.items() if fmt.available]
+
+
+def _chunks(data_df, chunk_rows):
+    for start in range(0, len(data_df), chunk_rows):
+        yield data_df.iloc[start:start + chunk_rows]
+
+
+def iter_csv(data_df, chunk_rows=EXPORT_CHUNK_ROWS, compress=False):
+    """CSV of ``data_df`` (UTF-8, no index) as a sequence of byte chunks, gzip-compressed if ``compress``."""
+    def encoded():
+        yield data_df.head(0).to_csv(index=False).encode('utf-8')
+        for chunk in _chunks(data_df, chunk_rows):
+            yield chunk.to_csv(index=False, header=False).encode('utf-8')
+
+    if not compress:
+        yield from encoded()
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in encoded():
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _write_csv(data_df, path, chunk_rows, compress):
+    with open(path, 'wb') as f:
+        for data in iter_csv(data_df, chunk_rows, compress=compress):
+            f.write(data)
+
+
+def _write_parquet(data_df, path, chunk_rows):
+    with ParquetAppender(path) as appender:
+        for chunk in _chunks(data_df, chunk_rows):
+            appender.write(chunk)
+        appender.close()
+
+
+def _write_excel(data_df, path, chunk_rows):
+    from openpyxl import Workbook
+
+    if len(data_df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(data_df)} rows do not fit in an Excel worksheet ({EXCEL_MAX_ROWS} max)")
+    # Write-only workbooks stream rows to the file instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('data')
+    sheet.append([str(column) for column in data_df.columns])
+    for chunk in _chunks(data_df, chunk_rows):
+        chunk = chunk.astype(object)
+        for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def write_export(data_df, path, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write ``data_df`` to ``path`` in export format ``fmt``, one chunk of rows at a time."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if not FORMATS[fmt].available:
+        raise RuntimeError(f"{FORMATS[fmt].label} export needs the {FORMATS[fmt].requires} package")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with span(f'export.{fmt}', rows=len(data_df)):
+        try:
+            if fmt == 'parquet':
+                _write_parquet(data_df, tmp_path, chunk_rows)
+            elif fmt == 'xlsx':
+                _write_excel(data_df, tmp_path, chunk_rows)
+            else:
+                _write_csv(data_df, tmp_path, chunk_rows, compress=fmt == 'csv.gz')
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+    return path
+
+
+def export_path(dataset_key, fmt, directory=DEFAULT_EXPORT_DIR):
+    return os.path.join(directory, f'{dataset_key}{FORMATS[fmt].suffix}')
+
+
+def export_file(data_df, dataset_key, fmt, directory=DEFAULT_EXPORT_DIR, keep=DEFAULT_KEEP_EXPORTS):
+    """
+    Path of the ``fmt`` export of the dataset identified by ``dataset_key``.
+
+    The file is written on first use and reused afterwards; ``dataset_key`` must
+    change whenever the data does (a content hash or a snapshot id).
+    """
+    path = export_path(dataset_key, fmt, directory)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_export(data_df, path, fmt)
+        prune_exports(directory, keep)
+    return path
+
+
+def prune_exports(directory=DEFAULT_EXPORT_DIR, keep=DEFAULT_KEEP_EXPORTS):
+    """Delete all but the ``keep`` most recently written export files. Returns how many were deleted."""
+    paths = [path for path in glob.glob(os.path.join(directory, '*')) if not path.endswith('.tmp')]
+    stale = sorted(paths, key=os.path.getmtime, reverse=True)[keep:]
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return len(stale)
@@ -0,0 +1,150 @@
+"""Local fake of the Comtrade tariff-line endpoint for tests, benchmarks and offline development."""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from tariffline.ratelimit import TokenBucket
+from tariffline.schema import to_wire
+
+
+# Query parameters that filter rows, mapped to the data column they match
+FILTER_COLUMNS = {
+    'reportercode': 'reporterCode',
+    'flowCode': 'flowCode',
+    'cmdCode': 'cmdCode',
+    'period': 'period',
+    'partnerCode': 'partnerCode',
+    'partner2Code': 'partner2Code',
+    'customsCode': 'customsCode',
+    'motCode': 'motCode',
+}
+
+
+class FixtureRows:
+    """Answers tariff-line query parameters from a DataFrame, like the real endpoint."""
+
+    def __init__(self, data_df, max_records=250000):
+        self.data = data_df.reset_index(drop=True)
+        # Filter values arrive as strings, so match against string copies of the key columns
+        self._keys = pd.DataFrame({
+            column: self.data[column].astype(str)
+            for column in FILTER_COLUMNS.values() if column in self.data.columns
+        })
+        self.max_records = max_records
+
+    def query(self, params):
+        """Rows matching the request parameters, and the total count before truncation."""
+        mask = pd.Series(True, index=self.data.index)
+        for param, column in FILTER_COLUMNS.items():
+            if param in params and column in self._keys.columns:
+                mask &= self._keys[column].isin(params[param].split(','))
+        rows = self.data[mask]
+        max_records = int(params.get('maxRecords', self.max_records))
+        return rows.head(min(max_records, self.max_records)), len(rows)
+
+    def body(self, params):
+        """JSON body of the response to a request with ``params``."""
+        rows, count = self.query(params)
+        if params.get('countOnly', '').lower() == 'true':
+            return {'count': count}
+        data = json.loads(to_wire(rows).to_json(orient='records', double_precision=15))
+        return {'elements': len(data), 'count': len(data), 'data': data, 'error': ''}
+
+
+class FakeComtradeServer:
+    """
+    Serve ``/data/v1/getTariffline/...`` requests from a DataFrame on a local port.
+
+    ``latency`` seconds are added to every response. With ``rate`` set, requests over
+    that many per second get ``429`` with a ``Retry-After`` header; ``error_rate`` is
+    the share of requests that fail with ``500``. Responses are truncated at
+    ``max_records`` rows like the real API. Use as a context manager, and point
+    ``ComtradeClient(base_url=server.url)`` at it.
+    """
+
+    def __init__(self, data_df, latency=0.0, rate=None, error_rate=0.0, max_records=250000,
+                 host='127.0.0.1', port=0, seed=None):
+        self.rows = FixtureRows(data_df, max_records=max_records)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.limiter = TokenBucket(rate, capacity=max(1, int(rate))) if rate else None
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.status_counts = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def data(self):
+        return self.rows.data
+
+    def query(self, params):
+        """Rows matching the request parameters, and the total count before truncation."""
+        return self.rows.query(params)
+
+    def respond(self, path, params):
+        """Return ``(status, headers, body)`` for one request."""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if not path.startswith('/data/v1/getTariffline/'):
+            return 404, {}, {'error': 'Not found'}
+        if self.limiter is not None and not self.limiter.try_acquire():
+            return 429, {'Retry-After': '1'}, {'statusCode': 429, 'message': 'Rate limit is exceeded.'}
+        with self._lock:
+            failed = self.random.random() < self.error_rate
+        if failed:
+            return 500, {}, {'statusCode': 500, 'message': 'Internal server error'}
+
+        return 200, {}, self.rows.body(params)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                status, headers, body = server.respond(url.path, params)
+                with server._lock:
+                    server.status_counts[status] = server.status_counts.get(status, 0) + 1
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
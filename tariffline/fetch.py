@@ -0,0 +1,273 @@
+"""Chunked, concurrent fetching of tariff-line data from the UN Comtrade API."""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from tariffline.client import ApiError
+from tariffline.defaults import AUTO_CHUNK, CHUNK_SIZES, DEFAULT_MAX_WORKERS
+from tariffline.profiling import span, submit_in_context
+from tariffline.schema import concat_frames, normalize
+from tariffline.sizing import probe_parts
+
+
+# Query defaults used by the app: monthly HS tariff lines for Ukraine imports
+DEFAULT_QUERY = {
+    'typeCode': 'C',        # data type
+    'freqCode': 'M',        # monthly data
+    'clCode': 'HS',         # Harmonized System classification
+    'reporterCode': 804,    # Ukraine code in UN Comtrade (804)
+    'flowCode': 'M',        # trade flow direction (Import)
+}
+
+# Limits of one tariff-line request: the API truncates a response at ``maxRecords``
+# rows, and long comma lists are rejected
+MAX_RECORDS = 250000
+MAX_PERIODS_PER_CALL = 12
+
+
+@dataclass
+class ChunkResult:
+    index: int
+    periods: list
+    data: pd.DataFrame = field(default=None, repr=False)
+    error: str = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def period_string(self):
+        return ",".join(self.periods)
+
+
+def split_periods(periods, chunk='month'):
+    """Group YYYYMM period strings into per-month or per-quarter chunks, keeping order."""
+    if chunk not in CHUNK_SIZES:
+        raise ValueError(f"Unknown chunk size {chunk!r}, expected one of {CHUNK_SIZES}")
+    if chunk == 'month':
+        return [[str(p)] for p in periods]
+
+    groups = {}
+    for p in map(str, periods):
+        groups.setdefault((p[:4], (int(p[4:6]) - 1) // 3), []).append(p)
+    return list(groups.values())
+
+
+def _request(api, subscription_key, periods, commodity_code, count_only, **query):
+    params = {**DEFAULT_QUERY, **query}
+    df = api.getTarifflineData(
+        subscription_key,
+        typeCode=params['typeCode'],
+        freqCode=params['freqCode'],
+        clCode=params['clCode'],
+        period=",".join(periods),
+        reporterCode=params['reporterCode'],
+        cmdCode=commodity_code,
+        flowCode=params['flowCode'],
+        partnerCode=params.get('partnerCode'),
+        partner2Code=params.get('partner2Code'),
+        customsCode=params.get('customsCode'),
+        motCode=params.get('motCode'),
+        maxRecords=params.get('maxRecords'),
+        format_output='JSON',
+        countOnly=True if count_only else None,
+        includeDesc=None if count_only else True
+    )
+    # comtradeapicall prints the server message and returns None on a non-200 response; the
+    # status is lost, so the failure is not retried. ``ComtradeClient`` raises with the status instead
+    if df is None:
+        raise ApiError(f"No response from API for period {','.join(periods)}")
+    return df
+
+
+def fetch_chunk(api, subscription_key, periods, commodity_code, **query):
+    """Run one tariff-line request for a list of periods and return its DataFrame."""
+    with span('api.request', periods=",".join(periods), cmd=commodity_code):
+        df = _request(api, subscription_key, periods, commodity_code, False, **query)
+    return normalize(df)
+
+
+def count_chunk(api, subscription_key, periods, commodity_code, **query):
+    """Number of rows the request for ``periods`` would return, from a ``countOnly`` probe."""
+    with span('api.count', periods=",".join(periods), cmd=commodity_code):
+        df = _request(api, subscription_key, periods, commodity_code, True, **query)
+    if 'count' not in df.columns or df.empty:
+        raise ApiError(f"No row count returned for period {','.join(periods)}")
+    return int(df['count'].iloc[0])
+
+
+def _halve(periods):
+    mid = len(periods) // 2
+    return [periods[:mid], periods[mid:]] if mid else [periods]
+
+
+def size_periods(api, subscription_key, periods, commodity_code, max_records=MAX_RECORDS,
+                 max_periods=MAX_PERIODS_PER_CALL, max_workers=DEFAULT_MAX_WORKERS, scheduler=None, probes=None,
+                 **query):
+    """
+    Split ``periods`` into requests that stay under the record limit, sized from
+    ``countOnly`` probes (see ``tariffline.sizing``). Probes go through ``scheduler``
+    when given, and are looked up in and added to the ``ProbeCache`` ``probes``.
+
+    Returns a ``SizingPlan`` whose units are lists of period strings.
+    """
+    params = {**DEFAULT_QUERY, **query}
+    periods = [str(p) for p in periods]
+
+    def count(unit):
+        key = (str(params['reporterCode']), params['flowCode'], commodity_code, tuple(unit))
+        rows = probes.get(key) if probes is not None else None
+        if rows is None:
+            if scheduler is not None:
+                rows = scheduler.call(commodity_code, count_chunk, api, subscription_key, unit, commodity_code,
+                                      **query)
+            else:
+                rows = count_chunk(api, subscription_key, unit, commodity_code, **query)
+            if probes is not None:
+                probes.put(key, rows)
+        return rows
+
+    groups = [periods[i:i + max_periods] for i in range(0, len(periods), max_periods)]
+    if scheduler is not None:
+        scheduler.ledger.ensure_available(len(groups))
+    rate = scheduler.limiter.rate if scheduler is not None else None
+    return probe_parts(groups, count, _halve, max_records, max_workers=max_workers, rate=rate)
+
+
+def _run_chunk(api, subscription_key, index, periods, commodity_code, query, scheduler):
+    start_time = time.time()
+    try:
+        if scheduler is not None:
+            # Rate limited, retried with backoff and counted against the quota; only this chunk is retried
+            df = scheduler.call(commodity_code, fetch_chunk, api, subscription_key, periods, commodity_code, **query)
+        else:
+            df = fetch_chunk(api, subscription_key, periods, commodity_code, **query)
+        return ChunkResult(index, periods, data=df, elapsed=time.time() - start_time)
+    except Exception as e:
+        return ChunkResult(index, periods, error=str(e), elapsed=time.time() - start_time)
+
+
+class _OrderedSink:
+    # Hands chunks to ``sink`` in chunk order, holding back the ones that finish early
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.next_index = 0
+        self.waiting = {}
+
+    def push(self, result):
+        self.waiting[result.index] = result
+        while self.next_index in self.waiting:
+            ready = self.waiting.pop(self.next_index)
+            if ready.ok:
+                self.sink(ready)
+            # Release the rows once they have been written out
+            ready.data = None
+            self.next_index += 1
+
+
+def fetch_tariff_lines(api, subscription_key, periods, commodity_code, chunk='month',
+                       max_workers=DEFAULT_MAX_WORKERS, on_progress=None, sink=None, scheduler=None, probes=None,
+                       max_records=MAX_RECORDS, **query):
+    """
+    Fetch tariff lines for ``periods`` split into chunks on a bounded thread pool.
+
+    ``chunk`` is one of ``CHUNK_SIZES``, or ``AUTO_CHUNK`` to size the chunks from
+    ``countOnly`` probes first (``size_periods``): every chunk then stays under the
+    record limit ``max_records``, and periods without rows are not requested at all
+    (they are reported as empty chunks).
+
+    ``on_progress(done, total, chunk_result)`` is called from the calling thread as each
+    chunk finishes, so it is safe to update Streamlit elements from it. A failed chunk
+    does not abort the others; it is returned with its ``error`` set.
+
+    Without a ``sink``, returns the chunks reassembled in period order as one DataFrame,
+    and the list of ``ChunkResult`` objects. With a ``sink``, every successful chunk is
+    passed to ``sink(chunk_result)`` in period order and its rows are released right
+    after, so memory is bounded by the chunks in flight; the returned DataFrame is empty.
+
+    With a ``RequestScheduler``, requests are rate limited and retried, and the fetch
+    is refused up front with ``QuotaExceeded`` if it needs more calls than remain today.
+    """
+    empty = []
+    if chunk == AUTO_CHUNK:
+        sizing = size_periods(api, subscription_key, periods, commodity_code, max_records=max_records,
+                              max_workers=max_workers, scheduler=scheduler, probes=probes, **query)
+        chunks = sorted(sizing.units + sizing.empty, key=lambda chunk_periods: chunk_periods[0])
+        empty = sizing.empty
+        query = {**query, 'maxRecords': max_records}
+    else:
+        chunks = split_periods(periods, chunk)
+    if scheduler is not None:
+        scheduler.ledger.ensure_available(len(chunks) - len(empty))
+    ordered = _OrderedSink(sink) if sink is not None else None
+    results = []
+
+    def finish(result):
+        results.append(result)
+        if ordered is not None:
+            ordered.push(result)
+        if on_progress is not None:
+            on_progress(len(results), len(chunks), result)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks) or 1))) as pool:
+        futures = [
+            submit_in_context(pool, _run_chunk, api, subscription_key, i, chunk_periods, commodity_code, query,
+                              scheduler)
+            for i, chunk_periods in enumerate(chunks) if chunk_periods not in empty
+        ]
+        # Chunks the probes found empty are complete without a request
+        for i, chunk_periods in enumerate(chunks):
+            if chunk_periods in empty:
+                finish(ChunkResult(i, chunk_periods, data=pd.DataFrame()))
+        for future in as_completed(futures):
+            finish(future.result())
+
+    results.sort(key=lambda r: r.index)
+    return combine_chunks(results), results
+
+
+def combine_chunks(results):
+    """Concatenate the successful chunk frames in chunk order."""
+    return concat_frames(r.data for r in results if r.ok)
+
+
+def fetch_tariff_lines_cached(cache, api, subscription_key, periods, commodity_code, sink=None, **kwargs):
+    """
+    Like ``fetch_tariff_lines`` but serve periods from a ``PeriodCache`` and only request
+    the ones that are missing or expired. Fetched chunks are written to the cache as they
+    arrive, then the requested periods are read back from the cache in period order.
+
+    With a ``sink``, the periods are passed to ``sink(chunk_result)`` one at a time instead
+    of being combined, and the returned DataFrame is empty.
+
+    Returns the combined DataFrame, the fetched ``ChunkResult`` list and the list of
+    periods served from the cache.
+    """
+    query = {**DEFAULT_QUERY, **{k: v for k, v in kwargs.items() if k in DEFAULT_QUERY}}
+    key = (query['reporterCode'], query['flowCode'], commodity_code)
+
+    missing = cache.missing(*key, periods)
+    cached_periods = [str(p) for p in periods if str(p) not in missing]
+
+    results = []
+    if missing:
+        _, results = fetch_tariff_lines(
+            api, subscription_key, missing, commodity_code,
+            sink=lambda result: cache.put_many(*key, result.periods, result.data), **kwargs
+        )
+
+    combined = pd.DataFrame()
+    if sink is not None:
+        for index, (period, period_df) in enumerate(cache.iter_periods(*key, periods)):
+            sink(ChunkResult(index, [period], data=period_df))
+    else:
+        combined, _ = cache.get(*key, periods)
+
+    # Evict only after reading back, so a large fetch cannot push out its own periods
+    cache.evict()
+    return combined, results, cached_periods
@@ -0,0 +1,236 @@
+"""
+Harmonized System commodity hierarchy: code lookup, search and prefix expansion.
+
+The nomenclature is kept as a sorted array of codes, so the descendants of a
+chapter (2 digits) or heading (4 digits) are one contiguous slice found with two
+binary searches. Descriptions are indexed by word for autocomplete and fuzzy
+search. Tariff-line results are rolled up the hierarchy by code prefix
+(``truncate``, used by the ``commodity_rollup`` aggregation).
+
+The bundled ``data/hs_codes.tsv`` covers all chapters, plus the headings and
+subheadings of the fertiliser chain (chapter 31 and its raw materials) and of the
+app's example codes. Its ``complete`` column marks the codes whose children are all
+listed; only those are expanded, so a partly listed chapter such as 28 is never
+fetched as the few subheadings that happen to be bundled. A complete nomenclature
+can be built from the UN Comtrade classification reference with
+``HSIndex.from_reference`` and saved to ``.cache/hs_codes.tsv``, which is then preferred.
+"""
+import csv
+import difflib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+BUNDLED_HS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'hs_codes.tsv')
+# A full nomenclature saved here takes precedence over the bundled one
+HS_INDEX_PATHS = (os.path.join('.cache', 'hs_codes.tsv'), BUNDLED_HS_PATH)
+
+# Hierarchy level -> number of code digits
+LEVELS = {'chapter': 2, 'heading': 4, 'subheading': 6}
+
+# Similarity from which a misspelt word still matches a description word
+FUZZY_CUTOFF = 0.75
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def code_level(code):
+    """``'chapter'``, ``'heading'`` or ``'subheading'``; longer national tariff lines count as subheadings."""
+    digits = len(str(code))
+    return next((level for level, width in LEVELS.items() if digits <= width), 'subheading')
+
+
+def truncate(codes, level):
+    """``codes`` cut to the number of digits of ``level``, e.g. ``'310520'`` to heading ``'3105'``."""
+    return pd.Series(codes, dtype=object).astype(str).str[:LEVELS[level]].to_numpy()
+
+
+class HSIndex:
+    """
+    HS codes in sorted order with their descriptions, and a word index over the descriptions.
+
+    ``complete`` flags, per code, whether all of its children are listed; without it
+    the nomenclature is taken to be complete.
+    """
+
+    def __init__(self, codes, descriptions, complete=None):
+        order = np.argsort(np.asarray(codes, dtype=str), kind='stable')
+        self.codes = np.asarray(codes, dtype=str)[order]
+        self.descriptions = np.asarray(descriptions, dtype=object)[order]
+        if complete is None:
+            self.complete = np.ones(len(self.codes), dtype=bool)
+        else:
+            self.complete = np.asarray(complete, dtype=bool)[order]
+        # Description words in sorted order, each with the positions of the codes using it
+        words = {}
+        for position, description in enumerate(self.descriptions):
+            for word in set(_WORD.findall(description.lower())):
+                words.setdefault(word, []).append(position)
+        self._words = np.array(sorted(words), dtype=str)
+        self._postings = [words[word] for word in self._words]
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Index from a ``code<TAB>description[<TAB>complete]`` file: the first of
+        ``HS_INDEX_PATHS`` that exists by default. Without the ``complete`` column,
+        the file is taken to list the full nomenclature.
+        """
+        if path is None:
+            path = next(path for path in HS_INDEX_PATHS if os.path.exists(path))
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f, delimiter='\t'))
+        flagged = bool(rows) and rows[0][2:3] == ['complete']
+        rows = [row for row in rows if row and row[0].isdigit()]
+        return cls([row[0] for row in rows], [row[1] if len(row) > 1 else '' for row in rows],
+                   [len(row) > 2 and row[2] == '1' for row in rows] if flagged else None)
+
+    @classmethod
+    def from_reference(cls, reference_df):
+        """
+        Index from a UN Comtrade classification reference table, such as
+        ``comtradeapicall.getReference('cmd:HS')`` (columns ``id`` and ``text``).
+        """
+        rows = reference_df[reference_df['id'].astype(str).str.fullmatch(r'\d{2}|\d{4}|\d{6}')]
+        codes = rows['id'].astype(str)
+        # Reference texts repeat the code: "310520 - Fertilizers, mineral or chemical; ..."
+        descriptions = [text[len(code) + 3:] if text.startswith(f'{code} - ') else text
+                        for code, text in zip(codes, rows['text'].astype(str))]
+        return cls(codes.tolist(), descriptions)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerow(['code', 'description', 'complete'])
+            writer.writerows(zip(self.codes, self.descriptions, np.where(self.complete, '1', '')))
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        position = np.searchsorted(self.codes, str(code))
+        return position < len(self.codes) and self.codes[position] == str(code)
+
+    def _prefix_range(self, prefix):
+        # Codes starting with ``prefix`` form one slice of the sorted array
+        prefix = str(prefix)
+        return (int(np.searchsorted(self.codes, prefix, side='left')),
+                int(np.searchsorted(self.codes, prefix + '\uffff', side='left')))
+
+    def describe(self, code):
+        """Description of ``code``, or None if it is not in the nomenclature."""
+        position = np.searchsorted(self.codes, str(code))
+        if position < len(self.codes) and self.codes[position] == str(code):
+            return self.descriptions[position]
+        return None
+
+    def label(self, code):
+        """``code - description``, or the code alone when it is unknown."""
+        description = self.describe(code)
+        return f"{code} - {description}" if description else str(code)
+
+    def descendants(self, prefix, level=None):
+        """Codes under ``prefix`` (including it), in order; only those of ``level`` if given."""
+        start, end = self._prefix_range(prefix)
+        codes = self.codes[start:end]
+        if level is not None:
+            codes = codes[np.char.str_len(codes) == LEVELS[level]]
+        return codes.tolist()
+
+    def children(self, code):
+        """Codes one level below ``code``: headings of a chapter, subheadings of a heading."""
+        width = len(str(code)) + 2
+        return [child for child in self.descendants(code) if len(child) == width]
+
+    def ancestors(self, code):
+        """Chapter and heading codes above ``code`` that are in the nomenclature, from the top."""
+        code = str(code)
+        return [code[:width] for width in LEVELS.values() if width < len(code) and code[:width] in self]
+
+    def covers(self, prefix, level='subheading'):
+        """Whether every code of ``level`` under ``prefix`` is listed: it and all codes between are complete."""
+        start, end = self._prefix_range(prefix)
+        inner = np.char.str_len(self.codes[start:end]) < LEVELS[level]
+        return str(prefix) in self and bool(self.complete[start:end][inner].all())
+
+    def expand(self, prefixes, level='subheading'):
+        """
+        Codes of ``level`` under each of ``prefixes``, without duplicates and in order.
+
+        Prefixes at or below ``level`` are cut to it, e.g. ``['31', '870321']`` gives
+        every subheading of chapter 31 and 870321, so codes missing from the
+        nomenclature still work. Raises ``ValueError`` for shorter prefixes whose
+        codes of ``level`` are not all listed (see ``covers``), rather than return
+        only some of them.
+        """
+        width = LEVELS[level]
+        codes = []
+        partial = []
+        for prefix in prefixes:
+            prefix = str(prefix).strip()
+            if len(prefix) >= width:
+                codes.append(prefix[:width])
+            elif self.covers(prefix, level):
+                codes.extend(self.descendants(prefix, level))
+            else:
+                partial.append(prefix)
+        if partial:
+            raise ValueError(f"HS {', '.join(partial)} can not be expanded to {level}s: the nomenclature does not "
+                             f"list all of them. Give the {width}-digit codes, or save the complete nomenclature "
+                             f"to {HS_INDEX_PATHS[0]}")
+        return list(dict.fromkeys(codes))
+
+    def _word_matches(self, token):
+        # Positions of codes whose description has a word starting with ``token`` (score 1),
+        # or else a word similar to it (score = similarity)
+        start = int(np.searchsorted(self._words, token, side='left'))
+        end = int(np.searchsorted(self._words, token + '\uffff', side='left'))
+        matches = {}
+        for i in range(start, end):
+            for position in self._postings[i]:
+                matches[position] = 1.0
+        if not matches:
+            for word in difflib.get_close_matches(token, self._words.tolist(), n=5, cutoff=FUZZY_CUTOFF):
+                score = difflib.SequenceMatcher(None, token, word).ratio()
+                for position in self._postings[int(np.searchsorted(self._words, word))]:
+                    matches[position] = max(matches.get(position, 0.0), score)
+        return matches
+
+    def search(self, text, limit=10):
+        """
+        Codes best matching ``text``, for autocomplete: numbers are code prefixes,
+        words are matched against descriptions by prefix, or fuzzily when misspelt.
+        Returns ``(code, description)`` pairs, best first.
+        """
+        tokens = _WORD.findall(str(text).lower())
+        prefixes = [token for token in tokens if token.isdigit()]
+        words = [token for token in tokens if not token.isdigit()]
+        if not tokens:
+            return []
+
+        if prefixes:
+            candidates = set()
+            for prefix in prefixes:
+                candidates.update(range(*self._prefix_range(prefix)))
+        else:
+            candidates = None
+        scores = {}
+        for word in words:
+            for position, score in self._word_matches(word).items():
+                if candidates is None or position in candidates:
+                    scores[position] = scores.get(position, 0.0) + score
+        if not words:
+            scores = dict.fromkeys(candidates, 1.0)
+
+        # Better matches first; among equals, general codes before specific ones
+        ranked = sorted(scores, key=lambda position: (-scores[position], len(self.codes[position]),
+                                                      self.codes[position]))
+        return [(str(self.codes[position]), self.descriptions[position]) for position in ranked[:limit]]
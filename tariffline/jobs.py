@@ -0,0 +1,281 @@
+"""
+Background jobs that run fetches outside a Streamlit script run.
+
+A ``JobManager`` owns a small worker pool shared by every session of the
+process. Each job gets an id and a status file under ``.cache/jobs`` that is
+rewritten as it progresses, so a rerun (or a reloaded page) can poll it and
+attach to its output once it is done. Submitting a request identical to one
+that is still queued or running returns that job instead of starting another.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+
+import pandas as pd
+
+from tariffline.cube import cube_path
+from tariffline.profiling import Profiler, profiling
+from tariffline.storage import arrow_path
+
+
+DEFAULT_JOBS_DIR = os.path.join('.cache', 'jobs')
+
+# Fetches are I/O bound and rate limited by the shared scheduler, so a couple
+# of concurrent jobs is enough; each job runs its own request pool.
+DEFAULT_MAX_JOBS = 2
+
+# Finished jobs (status and output files) kept on disk
+DEFAULT_KEEP_JOBS = 20
+
+# Progress is written to the status file at most this often, in seconds
+STATUS_INTERVAL = 0.5
+
+# Rows of a running job held in memory for the partial-results preview
+PREVIEW_ROWS = 50
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def request_key(kind, params):
+    """Identity of a request: jobs with the same kind and parameters produce the same data."""
+    payload = json.dumps({'kind': kind, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    key: str
+    params: dict
+    output: str = None
+    state: str = QUEUED
+    done: int = 0
+    total: int = 0
+    rows: int = 0
+    message: str = ''
+    result: dict = None
+    error: str = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobReporter:
+    """Handed to the work function of a job to publish progress and partial rows."""
+
+    def __init__(self, manager, job):
+        self._manager = manager
+        self._job = job
+
+    @property
+    def job_id(self):
+        return self._job.id
+
+    @property
+    def output(self):
+        return self._job.output
+
+    def progress(self, done, total, message=''):
+        self._manager._update(self._job, done=done, total=total, message=message)
+
+    def rows(self, data_df):
+        """Count rows that reached the job output, keeping the first ones for the preview."""
+        self._manager._add_rows(self._job, data_df)
+
+
+class JobManager:
+    """
+    Runs ``work(reporter)`` callables on a worker pool and tracks them as ``Job`` records.
+
+    The return value of ``work`` (a JSON-serializable dict) is stored as the job
+    result; an exception marks the job failed with its message. Jobs found queued
+    or running in the status directory at start-up were cut off by a restart and
+    are marked failed.
+    """
+
+    def __init__(self, directory=DEFAULT_JOBS_DIR, max_workers=DEFAULT_MAX_JOBS, keep=DEFAULT_KEEP_JOBS):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tariffline-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}
+        self._previews = {}
+        self._totals = {}
+        self._saved_at = {}
+        self._profiles = {}
+        self._load()
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def output_path(self, job_id, suffix='.parquet'):
+        """Per-job output file inside the jobs directory, so concurrent jobs never share one."""
+        return os.path.join(self.directory, f'{job_id}{suffix}')
+
+    def _load(self):
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    job = Job(**json.load(f))
+            except (OSError, ValueError, TypeError):
+                continue
+            if job.active:
+                job.state = FAILED
+                job.error = "Interrupted by a restart"
+                job.finished_at = job.finished_at or time.time()
+                self._save(job)
+            self._jobs[job.id] = job
+
+    def _save(self, job):
+        # Written under a temporary name and moved into place, so pollers never read a partial file
+        path = self._status_path(job.id)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(job), f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        self._saved_at[job.id] = time.time()
+
+    def submit(self, kind, params, work, output_suffix='.parquet'):
+        """
+        Queue ``work`` as a job of ``kind`` described by ``params`` and return the ``Job``.
+
+        If a job with the same kind and ``params`` is still queued or running, it is
+        returned instead and ``work`` is not run. Unless ``output_suffix`` is None the
+        job gets its own output file in the jobs directory (``reporter.output``).
+        """
+        key = request_key(kind, params)
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id is not None:
+                return replace(self._jobs[job_id])
+            job_id = uuid.uuid4().hex[:12]
+            output = self.output_path(job_id, output_suffix) if output_suffix else None
+            job = Job(job_id, kind, key, params, output=output)
+            self._jobs[job_id] = job
+            self._active[key] = job_id
+            self._save(job)
+        self._executor.submit(self._run, job, work)
+        self.prune()
+        return replace(job)
+
+    def _run(self, job, work):
+        with self._lock:
+            job.state = RUNNING
+            job.started_at = time.time()
+            self._save(job)
+        profiler = Profiler()
+        try:
+            # Every job is profiled, so a session that attaches later can still see where its time went
+            with profiling(profiler):
+                result = work(JobReporter(self, job))
+        except Exception as e:
+            state, result, error = FAILED, None, str(e) or type(e).__name__
+        else:
+            state, error = DONE, None
+        with self._lock:
+            job.state = state
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            self._active.pop(job.key, None)
+            self._previews.pop(job.id, None)
+            self._totals.pop(job.id, None)
+            self._profiles[job.id] = profiler.to_dict()
+            self._save(job)
+
+    def _update(self, job, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if time.time() - self._saved_at.get(job.id, 0) >= STATUS_INTERVAL or job.done == job.total:
+                self._save(job)
+
+    def _add_rows(self, job, data_df):
+        with self._lock:
+            job.rows += len(data_df)
+            preview = self._previews.get(job.id)
+            if preview is None:
+                self._previews[job.id] = data_df.head(PREVIEW_ROWS).reset_index(drop=True)
+            elif len(preview) < PREVIEW_ROWS:
+                self._previews[job.id] = pd.concat([preview, data_df.head(PREVIEW_ROWS - len(preview))],
+                                                   ignore_index=True)
+            # Running per-month totals, so the chart of a running job grows with each chunk
+            if len(data_df) and {'period', 'primaryValue'} <= set(data_df.columns):
+                chunk = data_df.groupby(data_df['period'].astype(int))['primaryValue'].sum()
+                totals = self._totals.get(job.id)
+                self._totals[job.id] = chunk if totals is None else totals.add(chunk, fill_value=0)
+
+    def get(self, job_id):
+        """Snapshot of the job, or None for an unknown id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return replace(job) if job is not None else None
+
+    def preview(self, job_id):
+        """First rows a running job has written so far, or None."""
+        with self._lock:
+            return self._previews.get(job_id)
+
+    def partial_totals(self, job_id):
+        """``primaryValue`` per period of the rows a running job has written so far, or None."""
+        with self._lock:
+            return self._totals.get(job_id)
+
+    def profile(self, job_id):
+        """Timing profile of a job finished by this process, or None."""
+        with self._lock:
+            return self._profiles.get(job_id)
+
+    def jobs(self):
+        """Snapshots of all known jobs, newest first."""
+        with self._lock:
+            jobs = [replace(job) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def prune(self):
+        """Forget finished jobs beyond the newest ``keep``, deleting their status and output files."""
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if not job.active),
+                              key=lambda job: job.created_at, reverse=True)
+            stale = finished[self.keep:]
+            for job in stale:
+                del self._jobs[job.id]
+                self._saved_at.pop(job.id, None)
+                self._profiles.pop(job.id, None)
+        for job in stale:
+            paths = [self._status_path(job.id)]
+            if job.output and os.path.dirname(os.path.abspath(job.output)) == os.path.abspath(self.directory):
+                paths += [job.output, cube_path(job.output), arrow_path(job.output)]
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        return len(stale)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,24 @@
+"""YYYYMM period arithmetic, free of dependencies so aggregation code can use it without the fetch chain."""
+from datetime import datetime
+
+
+def shift_period(period, months):
+    """Add ``months`` to a YYYYMM period."""
+    period = int(period)
+    index = (period // 100) * 12 + period % 100 - 1 + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def period_range(start, end):
+    """YYYYMM period strings from ``start`` to ``end`` inclusive."""
+    periods = []
+    period = int(start)
+    while period <= int(end):
+        periods.append(str(period))
+        period = shift_period(period, 1)
+    return periods
+
+
+def current_period(now=None):
+    now = now or datetime.now()
+    return now.year * 100 + now.month
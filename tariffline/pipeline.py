@@ -0,0 +1,120 @@
+"""End-to-end fetch jobs shared by the Streamlit app and the command line."""
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from tariffline.cube import build_cube_file, cube_path
+from tariffline.fetch import fetch_tariff_lines, fetch_tariff_lines_cached
+from tariffline.planner import run_plan
+from tariffline.storage import ParquetAppender, export_json, load_dataset
+from tariffline.sync import WATERMARKS_KEY, WatermarkTracker
+
+
+def fetch_to_file(api, subscription_key, periods, commodity_code, path, cache=None, json_path=None, build_cube=True,
+                  on_rows=None, **fetch_kwargs):
+    """
+    Fetch tariff lines for ``periods`` and stream them into the Parquet file at ``path``.
+
+    Periods are served from ``cache`` when given. The metadata block (row count,
+    timing, failed periods, sync watermark) is stored with the file and returned
+    together with the ``ChunkResult`` list. ``json_path`` additionally writes the
+    legacy JSON export. Unless ``build_cube`` is false, the aggregation cube is
+    built once here and stored next to the dataset. ``on_rows(data_df)`` is called
+    with every chunk after it is written. Raises ``RuntimeError`` if every period
+    failed, leaving any existing file at ``path`` untouched.
+    """
+    start_time = time.time()
+    watermarks = WatermarkTracker()
+
+    with ParquetAppender(path) as appender:
+        def sink(chunk_result):
+            appender.write(chunk_result.data)
+            watermarks.update(chunk_result.data)
+            if on_rows is not None:
+                on_rows(chunk_result.data)
+
+        if cache is not None:
+            # Only periods missing from the local cache (or expired) are requested
+            _, chunk_results, cached_periods = fetch_tariff_lines_cached(
+                cache, api, subscription_key, periods, commodity_code, sink=sink, **fetch_kwargs
+            )
+        else:
+            _, chunk_results = fetch_tariff_lines(api, subscription_key, periods, commodity_code, sink=sink,
+                                                  **fetch_kwargs)
+            cached_periods = []
+
+        failed_periods = [p for r in chunk_results if not r.ok for p in r.periods]
+        if failed_periods and len(failed_periods) == len(periods):
+            raise RuntimeError(chunk_results[0].error if chunk_results else "No periods requested")
+
+        metadata = {
+            'commodity_code': commodity_code,
+            'total_rows': appender.rows,
+            'execution_time': time.time() - start_time,
+            'chunks': len(chunk_results),
+            'cached_periods': len(cached_periods),
+            'failed_periods': failed_periods,
+            WATERMARKS_KEY: watermarks.watermarks,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        appender.close(metadata)
+
+    if build_cube:
+        build_cube_file(path)
+    if json_path:
+        export_json(load_dataset(path)[0], json_path, metadata)
+    return metadata, chunk_results
+
+
+def run_plan_to_file(api, subscription_key, calls, path, metadata=None, build_cube=True, on_rows=None,
+                     **run_kwargs):
+    """
+    Execute planned batch calls and stream every result into the Parquet file at ``path``.
+
+    Returns the stored metadata and the ``CallResult`` list. The aggregation cube
+    is stored next to the dataset unless ``build_cube`` is false. ``on_rows(data_df)``
+    is called with every call result after it is written. The labels of failed calls
+    and of calls still truncated at the record limit are listed in the metadata.
+    """
+    start_time = time.time()
+    with ParquetAppender(path) as appender:
+        def sink(call_result):
+            appender.write(call_result.data)
+            if on_rows is not None:
+                on_rows(call_result.data)
+
+        _, call_results = run_plan(api, subscription_key, calls, sink=sink, **run_kwargs)
+        metadata = {
+            **(metadata or {}),
+            'total_rows': appender.rows,
+            'api_calls': len(call_results),
+            'failed_calls': [r.call.label for r in call_results if not r.ok],
+            'truncated_calls': [r.call.label for r in call_results if r.truncated],
+            'execution_time': time.time() - start_time,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        appender.close(metadata)
+
+    if build_cube:
+        build_cube_file(path)
+    return metadata, call_results
+
+
+def publish_dataset(path, target):
+    """
+    Copy the dataset at ``path`` (and its cube, if built) to ``target``.
+
+    Each file is copied under a temporary name and moved into place, so readers of
+    ``target`` see either the previous dataset or the new one. The cube is moved
+    last, so it is never older than the data it belongs to.
+    """
+    pairs = [(path, target)]
+    if os.path.exists(cube_path(path)):
+        pairs.append((cube_path(path), cube_path(target)))
+    for source, destination in pairs:
+        tmp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    return target
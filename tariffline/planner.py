@@ -0,0 +1,233 @@
+"""Batch query planning over reporters × flows × commodity codes × periods."""
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+
+import pandas as pd
+
+from tariffline.fetch import DEFAULT_MAX_WORKERS, MAX_PERIODS_PER_CALL, MAX_RECORDS, count_chunk, fetch_chunk
+from tariffline.profiling import submit_in_context
+from tariffline.schema import concat_frames
+from tariffline.scheduler import RequestScheduler
+from tariffline.sizing import probe_parts
+
+
+# Limits of one tariff-line request besides ``MAX_RECORDS`` and ``MAX_PERIODS_PER_CALL``:
+# long comma lists are rejected, so calls are packed within these bounds.
+MAX_CODES_PER_CALL = 20
+MAX_REPORTERS_PER_CALL = 5
+
+# Rough number of rows per (reporter, flow, commodity, period), used until real counts are known
+DEFAULT_ROWS_PER_UNIT = 200
+
+# Requests per second allowed by the subscription
+DEFAULT_RATE = 1.0
+
+# Dimensions in the order they are halved when a call is too large
+SPLIT_ORDER = ('periods', 'cmd_codes', 'reporter_codes', 'flow_codes')
+
+
+@dataclass(frozen=True)
+class PlannedCall:
+    reporter_codes: tuple
+    flow_codes: tuple
+    cmd_codes: tuple
+    periods: tuple
+    estimated_rows: int = 0
+
+    @property
+    def units(self):
+        """Number of (reporter, flow, commodity, period) combinations covered by the call."""
+        return len(self.reporter_codes) * len(self.flow_codes) * len(self.cmd_codes) * len(self.periods)
+
+    @property
+    def label(self):
+        return (f"{','.join(map(str, self.reporter_codes))}/{','.join(self.flow_codes)}/"
+                f"{','.join(self.cmd_codes)}/{self.periods[0]}-{self.periods[-1]}")
+
+    def query(self):
+        """Keyword arguments for ``fetch_chunk``."""
+        return {
+            'reporterCode': ",".join(map(str, self.reporter_codes)),
+            'flowCode': ",".join(self.flow_codes),
+        }
+
+    def split(self):
+        """Halve the first splittable dimension; an atomic call is returned unchanged."""
+        for name in SPLIT_ORDER:
+            values = getattr(self, name)
+            if len(values) > 1:
+                mid = len(values) // 2
+                return [
+                    replace(self, **{name: part}, estimated_rows=self.estimated_rows * len(part) // len(values))
+                    for part in (values[:mid], values[mid:])
+                ]
+        return [self]
+
+
+@dataclass
+class CallResult:
+    call: PlannedCall
+    data: pd.DataFrame = field(default=None, repr=False)
+    error: str = None
+    elapsed: float = 0.0
+    truncated: bool = False
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _batches(values, size):
+    values = list(values)
+    return [tuple(values[i:i + size]) for i in range(0, len(values), size)]
+
+
+def plan_batch(reporter_codes, flow_codes, cmd_codes, periods, max_records=MAX_RECORDS,
+               max_periods=MAX_PERIODS_PER_CALL, max_codes=MAX_CODES_PER_CALL,
+               max_reporters=MAX_REPORTERS_PER_CALL, rows_per_unit=DEFAULT_ROWS_PER_UNIT, estimate=None):
+    """
+    Pack the query matrix into as few calls as the endpoint limits allow.
+
+    All flows share a call; reporters, commodity codes and periods are packed into
+    comma lists of at most ``max_reporters``, ``max_codes`` and ``max_periods``
+    values. Calls whose estimated size reaches ``max_records`` are split further.
+    ``estimate(call)`` may return an expected row count to use instead of
+    ``rows_per_unit × call.units``.
+    """
+    flow_codes = tuple(flow_codes)
+    queue = deque()
+    for reporters in _batches(reporter_codes, max_reporters):
+        for codes in _batches(map(str, cmd_codes), max_codes):
+            for period_group in _batches(map(str, periods), max_periods):
+                call = PlannedCall(reporters, flow_codes, codes, period_group)
+                rows = estimate(call) if estimate is not None else call.units * rows_per_unit
+                queue.append(replace(call, estimated_rows=int(rows)))
+
+    planned = []
+    while queue:
+        call = queue.popleft()
+        parts = call.split() if call.estimated_rows >= max_records else [call]
+        if len(parts) > 1:
+            queue.extendleft(reversed(parts))
+        else:
+            planned.append(call)
+    return planned
+
+
+def plan_summary(calls):
+    """Size of a plan compared with fetching every (reporter, flow, commodity, period) separately."""
+    return {
+        'calls': len(calls),
+        'naive_calls': sum(call.units for call in calls),
+        'estimated_rows': sum(call.estimated_rows for call in calls),
+    }
+
+
+def size_plan(api, subscription_key, calls, max_records=MAX_RECORDS, max_workers=DEFAULT_MAX_WORKERS,
+              scheduler=None, probes=None, **query):
+    """
+    Probe planned calls with ``countOnly`` requests and split the ones that reach the
+    record limit (see ``tariffline.sizing``), through ``scheduler`` when given and
+    reusing counts from the ``ProbeCache`` ``probes``. Returns a ``SizingPlan`` whose
+    units are the calls to make; ``sized_calls`` gives them with their counts.
+    """
+    def count(call):
+        key = (call.label, tuple(sorted(query.items())))
+        rows = probes.get(key) if probes is not None else None
+        if rows is None:
+            args = (api, subscription_key, list(call.periods), ",".join(call.cmd_codes))
+            kwargs = {**query, **call.query()}
+            if scheduler is not None:
+                rows = scheduler.call(",".join(call.cmd_codes), count_chunk, *args, **kwargs)
+            else:
+                rows = count_chunk(*args, **kwargs)
+            if probes is not None:
+                probes.put(key, rows)
+        return rows
+
+    if scheduler is not None:
+        scheduler.ledger.ensure_available(len(calls))
+    rate = scheduler.limiter.rate if scheduler is not None else None
+    return probe_parts(calls, count, PlannedCall.split, max_records, max_workers=max_workers, rate=rate)
+
+
+def sized_calls(plan):
+    """Calls of a ``SizingPlan`` with their probed row counts as ``estimated_rows``."""
+    return [replace(part.unit, estimated_rows=part.rows if part.rows is not None else part.unit.estimated_rows)
+            for part in plan.parts]
+
+
+def _run_call(api, subscription_key, call, scheduler, max_records, query):
+    start_time = time.time()
+    try:
+        df = scheduler.call(",".join(call.cmd_codes), fetch_chunk, api, subscription_key, list(call.periods),
+                            ",".join(call.cmd_codes), **{**query, **call.query(), 'maxRecords': max_records})
+        return CallResult(call, data=df, elapsed=time.time() - start_time, truncated=len(df) >= max_records)
+    except Exception as e:
+        return CallResult(call, error=str(e), elapsed=time.time() - start_time)
+
+
+def run_plan(api, subscription_key, calls, max_records=MAX_RECORDS, max_workers=DEFAULT_MAX_WORKERS,
+             rate=DEFAULT_RATE, scheduler=None, on_progress=None, sink=None, **query):
+    """
+    Execute planned calls concurrently through a shared ``RequestScheduler``
+    (a plain one limited to ``rate`` calls per second unless given). Failed calls are
+    retried individually, and the plan is refused with ``QuotaExceeded`` if it needs
+    more calls than remain in today's quota.
+
+    A response that reaches ``max_records`` rows is assumed truncated: the call is
+    split and both halves are requested again. A call that can not be split any
+    further is kept with ``truncated`` set, as its rows beyond the limit are missing.
+    ``on_progress(done, total, result)`` is called from the calling thread; ``total``
+    grows when calls are split.
+
+    Returns the combined DataFrame sorted by its natural key, and the list of
+    ``CallResult`` objects for the calls that were kept. With a ``sink``, each
+    successful result is passed to ``sink(call_result)`` in completion order and its
+    rows are released right after; the returned DataFrame is then empty.
+    """
+    scheduler = scheduler or RequestScheduler(rate=rate)
+    scheduler.ledger.ensure_available(len(calls))
+    results = []
+    total = len(calls)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        pending = {submit_in_context(pool, _run_call, api, subscription_key, call, scheduler, max_records, query)
+                   for call in calls}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                parts = result.call.split() if result.truncated else [result.call]
+                if len(parts) > 1:
+                    total += len(parts) - 1
+                    pending |= {submit_in_context(pool, _run_call, api, subscription_key, part, scheduler,
+                                                  max_records, query)
+                                for part in parts}
+                    continue
+                results.append(result)
+                if sink is not None:
+                    if result.ok:
+                        sink(result)
+                    result.data = None
+                if on_progress is not None:
+                    on_progress(len(results), total, result)
+
+    return combine_results(results), results
+
+
+def combine_results(results):
+    combined = concat_frames(r.data for r in results if r.ok)
+    key = [c for c in ('reporterCode', 'flowCode', 'cmdCode', 'period') if c in combined.columns]
+    return combined.sort_values(key, kind='stable', ignore_index=True) if key else combined
+
+
+def run_batch(api, subscription_key, reporter_codes, flow_codes, cmd_codes, periods, **kwargs):
+    """Plan and execute a batch query; keyword arguments go to ``plan_batch`` or ``run_plan``."""
+    plan_keys = {'max_periods', 'max_codes', 'max_reporters', 'rows_per_unit', 'estimate'}
+    plan_kwargs = {k: kwargs.pop(k) for k in list(kwargs) if k in plan_keys}
+    if 'max_records' in kwargs:
+        plan_kwargs['max_records'] = kwargs['max_records']
+    calls = plan_batch(reporter_codes, flow_codes, cmd_codes, periods, **plan_kwargs)
+    return run_plan(api, subscription_key, calls, **kwargs)
@@ -0,0 +1,165 @@
+"""
+Timing spans and memory high-water marks for the hot paths.
+
+Library code wraps its work in ``span(name)``; the spans are recorded only while
+a ``Profiler`` is active in the current context (see ``profiling``), so the
+instrumentation costs a context-variable lookup when nobody is listening.
+Worker threads inherit the profiler when their task is submitted through
+``submit_in_context``.
+"""
+import contextvars
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+_active = contextvars.ContextVar('tariffline_profiler', default=None)
+
+
+def peak_rss_bytes():
+    """High-water mark of the process resident set size, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Profiler:
+    """
+    Collects finished spans from any thread. With ``trace_memory`` the peak of
+    Python allocations is tracked as well (via ``tracemalloc``, which slows
+    allocation-heavy code noticeably).
+    """
+
+    def __init__(self, trace_memory=False):
+        self.spans = []
+        self.trace_memory = trace_memory
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, name, start, duration, attrs):
+        entry = {
+            'name': name,
+            'start_s': start - self._start,
+            'duration_s': duration,
+            'thread': threading.current_thread().name,
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            entry['python_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        if attrs:
+            entry['attrs'] = attrs
+        with self._lock:
+            self.spans.append(entry)
+
+    def summary(self):
+        """Count, total, mean and max duration per span name, in first-seen order."""
+        summary = {}
+        with self._lock:
+            spans = list(self.spans)
+        for entry in spans:
+            stats = summary.setdefault(entry['name'], {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+            stats['count'] += 1
+            stats['total_s'] += entry['duration_s']
+            stats['max_s'] = max(stats['max_s'], entry['duration_s'])
+        for stats in summary.values():
+            stats['mean_s'] = stats['total_s'] / stats['count']
+        return summary
+
+    def memory(self):
+        memory = {'peak_rss_bytes': peak_rss_bytes()}
+        if self.trace_memory and tracemalloc.is_tracing():
+            memory['python_current_bytes'], memory['python_peak_bytes'] = tracemalloc.get_traced_memory()
+        return memory
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            'started_at': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            'wall_s': time.perf_counter() - self._start,
+            'summary': self.summary(),
+            'memory': self.memory(),
+            'spans': spans,
+        }
+
+    def to_json(self, indent=4):
+        return json.dumps(self.to_dict(), indent=indent, default=str)
+
+    def to_openmetrics(self, prefix='tariffline'):
+        """Span durations as an OpenMetrics summary, plus memory gauges."""
+        lines = [
+            f"# TYPE {prefix}_span_seconds summary",
+            f"# UNIT {prefix}_span_seconds seconds",
+            f"# HELP {prefix}_span_seconds Time spent in instrumented spans.",
+        ]
+        for name, stats in self.summary().items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{prefix}_span_seconds_count{{span="{label}"}} {stats["count"]}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{label}"}} {stats["total_s"]:.6f}')
+        for key, value in self.memory().items():
+            if value is None:
+                continue
+            metric = f"{prefix}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"# UNIT {metric} bytes")
+            lines.append(f"{metric} {value}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Write the profile as OpenMetrics text for ``.prom``/``.txt`` paths, JSON otherwise."""
+        text = self.to_openmetrics() if path.endswith(('.prom', '.txt')) else self.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def current_profiler():
+    return _active.get()
+
+
+def activate(profiler):
+    """Make ``profiler`` (or None) the active one for the current context."""
+    return _active.set(profiler)
+
+
+@contextmanager
+def profiling(profiler=None):
+    """Activate ``profiler`` (a new one by default) for the duration of the block."""
+    profiler = profiler or Profiler()
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the block as ``name`` if a profiler is active."""
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, start, time.perf_counter() - start, attrs)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """``executor.submit`` that runs ``fn`` with the caller's context, so spans reach its profiler."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
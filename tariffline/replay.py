@@ -0,0 +1,168 @@
+"""
+Record and replay of tariff-line API responses, for working without the network.
+
+``RecordingClient`` wraps the live API (``comtradeapicall`` or a ``ComtradeClient``)
+and writes every successful response to a ``ResponseArchive``: a directory of
+gzip-compressed JSON files, one per distinct request. ``ReplayClient`` answers the
+same requests from archives instantly, without network access or API quota,
+optionally with simulated latency and throttling. Requests that were never
+recorded can be answered from seed datasets, such as the bundled
+``tariff_data_*.json`` files, whose rows are filtered like the real endpoint does.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from tariffline.client import ApiError, request_fields, response_frame
+from tariffline.fakeapi import FixtureRows
+from tariffline.profiling import span
+from tariffline.ratelimit import TokenBucket
+from tariffline.scheduler import RequestScheduler
+from tariffline.schema import concat_frames
+from tariffline.storage import load_dataset
+
+
+DEFAULT_ARCHIVE_DIR = os.path.join('.cache', 'recordings')
+ARCHIVE_SUFFIX = '.json.gz'
+
+API_MODES = ('live', 'record', 'replay')
+
+# Replayed requests are only limited by the simulated rate, not by a subscription tier
+UNLIMITED_RATE = 1000.0
+
+
+def _describe(typeCode, freqCode, clCode, proxy_url=None, **query):
+    # Endpoint path and query fields of a request made with ``getTarifflineData`` keyword arguments
+    return f"{typeCode}/{freqCode}/{clCode}", request_fields(**query)
+
+
+def response_key(path, fields):
+    """Stable name of the request for ``path`` with query ``fields`` in an archive."""
+    payload = json.dumps({'path': path, **fields}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+
+class ResponseArchive:
+    """Recorded response bodies, one gzip-compressed JSON file per request under ``directory``."""
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR):
+        self.directory = directory
+
+    def __len__(self):
+        return len(glob.glob(os.path.join(self.directory, '*' + ARCHIVE_SUFFIX)))
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ARCHIVE_SUFFIX)
+
+    def get(self, path, fields):
+        """Recorded body of the response to the request, or None."""
+        try:
+            with gzip.open(self.path(response_key(path, fields)), 'rt', encoding='utf-8') as f:
+                return json.load(f)['body']
+        except FileNotFoundError:
+            return None
+
+    def put(self, path, fields, body):
+        """Record ``body`` as the response to the request, replacing an earlier recording."""
+        os.makedirs(self.directory, exist_ok=True)
+        target = self.path(response_key(path, fields))
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        entry = {'path': path, 'request': fields, 'recorded_at': time.time(), 'body': body}
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f, separators=(',', ':'))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, target)
+
+
+class RecordingClient:
+    """
+    The API ``api`` with every successful response also recorded in ``archive``.
+
+    ``getTarifflineData`` takes the keyword arguments of ``comtradeapicall.getTarifflineData``
+    and returns (or raises) whatever ``api`` does.
+    """
+
+    mode = 'record'
+
+    def __init__(self, api, archive):
+        self.api = api
+        self.archive = archive
+
+    def getTarifflineData(self, subscription_key, **request):
+        df = self.api.getTarifflineData(subscription_key, **request)
+        if df is None:
+            return df
+        if request.get('countOnly'):
+            if 'count' not in df.columns or df.empty:
+                return df
+            body = {'count': int(df['count'].iloc[0])}
+        else:
+            data = json.loads(df.to_json(orient='records', double_precision=15))
+            body = {'elements': len(data), 'count': len(data), 'data': data, 'error': ''}
+        path, fields = _describe(**request)
+        self.archive.put(path, fields, body)
+        return df
+
+
+class ReplayClient:
+    """
+    Drop-in replacement for the API that answers from recorded responses.
+
+    Requests are looked up in ``archives`` in order, then answered by filtering the
+    rows of the ``seeds`` DataFrames; anything else fails with a ``404`` ``ApiError``.
+    ``latency`` seconds are added to every response, and with ``rate`` set, requests
+    over that many per second fail with ``429`` and ``Retry-After`` like the real API.
+    """
+
+    mode = 'replay'
+
+    def __init__(self, archives=(), seeds=(), latency=0.0, rate=None):
+        self.archives = list(archives)
+        self.seed = FixtureRows(concat_frames(seeds)) if seeds else None
+        self.latency = latency
+        self.limiter = TokenBucket(rate, capacity=max(1, int(rate))) if rate else None
+
+    @classmethod
+    def open(cls, sources, **kwargs):
+        """Replay from ``sources``: archive directories, and dataset files (Parquet or JSON) used as seeds."""
+        archives, seeds = [], []
+        for source in sources:
+            if os.path.isdir(source):
+                archives.append(ResponseArchive(source))
+            else:
+                seeds.append(load_dataset(source)[0])
+        return cls(archives, seeds, **kwargs)
+
+    def lookup(self, path, fields):
+        """Body of the response to the request, or None if it can not be replayed."""
+        for archive in self.archives:
+            body = archive.get(path, fields)
+            if body is not None:
+                return body
+        return self.seed.body(fields) if self.seed is not None else None
+
+    def getTarifflineData(self, subscription_key, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.limiter is not None and not self.limiter.try_acquire():
+            raise ApiError("HTTP 429: Rate limit is exceeded (replay)", status=429, retry_after=1.0)
+        path, fields = _describe(**request)
+        with span('api.replay', period=fields.get('period'), cmd=fields.get('cmdCode')):
+            body = self.lookup(path, fields)
+        if body is None:
+            raise ApiError(f"No recorded response for period {fields.get('period')} "
+                           f"and commodity {fields.get('cmdCode')}", status=404)
+        return response_frame(body, count_only=request.get('countOnly'))
+
+
+def replay_scheduler(**kwargs):
+    """A ``RequestScheduler`` for replayed requests: no tier rate limit and no persistent quota."""
+    return RequestScheduler(rate=UNLIMITED_RATE, capacity=int(UNLIMITED_RATE), **kwargs)
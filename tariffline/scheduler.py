@@ -0,0 +1,153 @@
+"""Request scheduling around API calls: rate limiting, retries with backoff, and quota accounting."""
+import json
+import os
+import random
+import threading
+import time
+from datetime import date
+
+from tariffline.client import ApiError
+from tariffline.defaults import DEFAULT_TIER, SUBSCRIPTION_TIERS
+from tariffline.profiling import span
+from tariffline.ratelimit import TokenBucket
+
+
+DEFAULT_QUOTA_PATH = os.path.join('.cache', 'quota.json')
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaLedger:
+    """
+    Daily count of requests and records, in total and per key, persisted to a JSON file.
+
+    Counts reset when the date changes. ``path=None`` keeps the ledger in memory only.
+    """
+
+    def __init__(self, daily_calls, path=DEFAULT_QUOTA_PATH, today=date.today):
+        self.daily_calls = daily_calls
+        self.path = path
+        self._today = today
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.path)
+
+    def _day(self):
+        today = self._today().isoformat()
+        if self._state.get('date') != today:
+            self._state = {'date': today, 'requests': 0, 'records': 0, 'keys': {}}
+        return self._state
+
+    def record(self, key, requests=0, records=0):
+        with self._lock:
+            day = self._day()
+            day['requests'] += requests
+            day['records'] += records
+            counts = day['keys'].setdefault(str(key), {'requests': 0, 'records': 0})
+            counts['requests'] += requests
+            counts['records'] += records
+            self._save()
+
+    def used(self):
+        with self._lock:
+            return self._day()['requests']
+
+    def remaining(self):
+        return max(0, self.daily_calls - self.used())
+
+    def usage(self):
+        with self._lock:
+            return json.loads(json.dumps(self._day()))
+
+    def ensure_available(self, calls):
+        """Raise ``QuotaExceeded`` if ``calls`` more requests would exceed today's quota."""
+        remaining = self.remaining()
+        if calls > remaining:
+            raise QuotaExceeded(f"Plan needs {calls} API calls but only {remaining} of "
+                                f"{self.daily_calls} remain in today's quota")
+
+
+class RequestScheduler:
+    """
+    Runs API calls under a token-bucket rate limit, retrying throttled and transient
+    failures with exponential backoff and full jitter, and counting every attempt in
+    a ``QuotaLedger``. Safe to share between threads.
+    """
+
+    def __init__(self, rate=1.0, capacity=1, ledger=None, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 sleep=time.sleep, jitter=random.random):
+        self.limiter = TokenBucket(rate, capacity, sleep=sleep)
+        self.ledger = ledger or QuotaLedger(daily_calls=float('inf'), path=None)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._jitter = jitter
+
+    @classmethod
+    def for_tier(cls, tier=DEFAULT_TIER, quota_path=DEFAULT_QUOTA_PATH, **kwargs):
+        settings = SUBSCRIPTION_TIERS[tier]
+        ledger = QuotaLedger(settings['daily_calls'], path=quota_path)
+        return cls(rate=settings['rate'], capacity=settings['capacity'], ledger=ledger, **kwargs)
+
+    def backoff(self, attempt, retry_after=None):
+        """Delay before retry number ``attempt`` (0-based)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * self._jitter()
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, key, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)``, retrying on ``ApiError`` that is retryable.
+
+        Every attempt uses a rate-limit token and a request from the quota; the
+        number of rows of a successful DataFrame result is counted as records.
+        """
+        attempt = 0
+        while True:
+            if self.ledger.remaining() < 1:
+                raise QuotaExceeded(f"Daily quota of {self.ledger.daily_calls} API calls is used up")
+            with span('api.rate_limit_wait'):
+                self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except ApiError as e:
+                self.ledger.record(key, requests=1)
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                with span('api.backoff', status=e.status, attempt=attempt):
+                    self._sleep(self.backoff(attempt, e.retry_after))
+                attempt += 1
+                continue
+            except Exception:
+                self.ledger.record(key, requests=1)
+                raise
+            # Row counts of ``countOnly`` probes are not records
+            self.ledger.record(key, requests=1, records=len(result) if hasattr(result, '__len__') else 0)
+            return result
@@ -0,0 +1,120 @@
+"""
+Declared column types of tariff-line data, applied once when rows enter the library.
+
+API responses and legacy JSON files arrive with strings as objects and codes as
+int64 (or float64 when a value is missing). ``normalize`` turns descriptor
+columns into categoricals, codes and periods into the smallest integer type that
+holds them, and ``refPeriodId`` into a datetime, so later code never parses
+periods again. ``to_wire`` restores the API representation for JSON output.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Descriptor columns repeat the same handful of strings in every row
+CATEGORICAL_COLUMNS = [
+    'typeCode', 'freqCode', 'reporterDesc', 'reporterISO', 'flowCode', 'flowDesc',
+    'partnerDesc', 'partnerISO', 'partner2Desc', 'partner2ISO', 'classificationCode',
+    'cmdCode', 'cmdDesc', 'customsCode', 'customsDesc', 'mosCode', 'motDesc',
+    'qtyUnitAbbr', 'altQtyUnitAbbr',
+]
+
+# Integer columns and the narrowest type expected to hold them. A column with a
+# value outside that range is widened instead of wrapped around.
+INTEGER_COLUMNS = {
+    'reporterCode': 'int16',
+    'partnerCode': 'int16',
+    'partner2Code': 'int16',
+    'motCode': 'int16',
+    'qtyUnitCode': 'int16',
+    'altQtyUnitCode': 'int16',
+    'period': 'int32',
+}
+
+FLOAT_COLUMNS = ['qty', 'altQty', 'netWgt', 'grossWgt', 'cifvalue', 'fobvalue', 'primaryValue']
+
+# First day of the reference period; sent by the API as a YYYYMMDD integer
+PERIOD_DATE = 'refPeriodId'
+
+_WIDER = {'int8': 'int16', 'int16': 'int32', 'int32': 'int64'}
+
+
+def _integer(column, dtype):
+    column = pd.to_numeric(column, errors='coerce')
+    while dtype in _WIDER and len(column) and not column.isna().all():
+        info = np.iinfo(dtype)
+        if info.min <= column.min() and column.max() <= info.max:
+            break
+        dtype = _WIDER[dtype]
+    if column.isna().any():
+        # Missing codes would otherwise turn the whole column into floats
+        return column.astype(dtype.capitalize())
+    return column.astype(dtype)
+
+
+def _dates_from_ids(ids):
+    ids = pd.to_numeric(ids, errors='coerce')
+    parts = pd.DataFrame({'year': ids // 10000, 'month': ids // 100 % 100, 'day': ids % 100})
+    return pd.to_datetime(parts, errors='coerce')
+
+
+def _dates_from_periods(periods):
+    periods = pd.to_numeric(periods, errors='coerce')
+    return pd.to_datetime(pd.DataFrame({'year': periods // 100, 'month': periods % 100, 'day': 1}), errors='coerce')
+
+
+def period_dates(periods):
+    """First day of each YYYYMM period, as a DatetimeIndex."""
+    return pd.DatetimeIndex(_dates_from_periods(pd.Series(np.asarray(periods))))
+
+
+def normalize(data_df):
+    """
+    Return ``data_df`` with the declared column types. Columns that already have
+    them are left alone, so normalizing a normalized frame is cheap.
+    """
+    if data_df is None:
+        return data_df
+    columns = {}
+    for column in CATEGORICAL_COLUMNS:
+        if column in data_df.columns and not isinstance(data_df[column].dtype, pd.CategoricalDtype):
+            columns[column] = data_df[column].astype('category')
+    for column, dtype in INTEGER_COLUMNS.items():
+        if column not in data_df.columns:
+            continue
+        current = data_df[column].dtype
+        if not pd.api.types.is_integer_dtype(current) or current.itemsize > np.dtype(dtype).itemsize:
+            columns[column] = _integer(data_df[column], dtype)
+    for column in FLOAT_COLUMNS:
+        if column in data_df.columns and data_df[column].dtype != np.float64:
+            columns[column] = pd.to_numeric(data_df[column], errors='coerce').astype(np.float64)
+    if PERIOD_DATE in data_df.columns:
+        if not pd.api.types.is_datetime64_any_dtype(data_df[PERIOD_DATE].dtype):
+            columns[PERIOD_DATE] = _dates_from_ids(data_df[PERIOD_DATE])
+    elif 'period' in data_df.columns:
+        columns[PERIOD_DATE] = _dates_from_periods(data_df['period'])
+    if not columns:
+        return data_df
+    return data_df.assign(**columns)
+
+
+def to_wire(data_df):
+    """Copy of ``data_df`` with ``refPeriodId`` back in its YYYYMMDD integer form, for JSON output."""
+    if PERIOD_DATE not in data_df.columns or not pd.api.types.is_datetime64_any_dtype(data_df[PERIOD_DATE].dtype):
+        return data_df
+    dates = data_df[PERIOD_DATE].dt
+    ids = dates.year * 10000 + dates.month * 100 + dates.day
+    return data_df.assign(**{PERIOD_DATE: ids.astype('Int64') if ids.isna().any() else ids.astype(np.int64)})
+
+
+def concat_frames(frames):
+    """Concatenate normalized frames, restoring categoricals whose categories differed between frames."""
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return normalize(pd.concat(frames, ignore_index=True))
+
+
+def memory_per_row(data_df):
+    """Average in-memory bytes per row, counting the contents of object columns."""
+    return data_df.memory_usage(index=False, deep=True).sum() / max(len(data_df), 1)
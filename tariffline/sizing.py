@@ -0,0 +1,181 @@
+"""
+Pre-flight sizing of queries from cheap ``countOnly`` probes.
+
+Before any rows are requested, the parts of a query are probed for their row
+counts. Parts at or over the row limit are halved and probed again, so no request
+reaches the server's record cap and comes back truncated; parts without rows are
+dropped. While there are fewer parts than parallel workers, the largest ones are
+halved further (without probing) as long as that shortens the estimated download
+under the request rate. The counts also give the download size and time shown
+before a fetch starts.
+"""
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from tariffline.profiling import submit_in_context
+
+
+# Parts are kept under this share of the record limit, leaving headroom for rows
+# published between the probe and the fetch
+FILL = 0.8
+
+# Parts smaller than this are not split only to keep workers busy
+MIN_PARALLEL_ROWS = 2000
+
+# Compact JSON size of one tariff-line row on the wire (the bundled data averages ~770 bytes)
+WIRE_BYTES_PER_ROW = 800
+
+# Rows a single request transfers and parses per second, on top of its latency
+ROWS_PER_SECOND = 20000
+
+# Probe counts are reused for this long, e.g. by a fetch right after its estimate
+PROBE_TTL = 3600
+
+
+class ProbeCache:
+    """Row counts of recent probes by query key, shared by threads and sessions."""
+
+    def __init__(self, ttl=PROBE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._counts.get(key)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, key, count):
+        with self._lock:
+            self._counts[key] = (count, time.time())
+
+
+@dataclass
+class Part:
+    unit: object
+    rows: int = None
+    error: str = None
+
+
+@dataclass
+class SizingPlan:
+    """
+    Parts of a query with their row counts (None where a probe failed), the units
+    found to have no rows at all, and what probing cost.
+    """
+    parts: list
+    max_rows: int
+    empty: list = field(default_factory=list)
+    probes: int = 0
+    probe_seconds: list = field(default_factory=list, repr=False)
+
+    @property
+    def units(self):
+        return [part.unit for part in self.parts]
+
+    @property
+    def rows(self):
+        return sum(part.rows or 0 for part in self.parts)
+
+    @property
+    def unknown(self):
+        """Parts whose probe failed; they are fetched without a known size."""
+        return [part for part in self.parts if part.rows is None]
+
+    @property
+    def oversized(self):
+        """Parts that cannot be split further and still reach the row limit."""
+        return [part for part in self.parts if part.rows is not None and part.rows >= self.max_rows]
+
+    @property
+    def latency(self):
+        """Mean probe round trip, used as the fixed cost of every request."""
+        return sum(self.probe_seconds) / len(self.probe_seconds) if self.probe_seconds else 0.0
+
+    def estimate(self, rate=None, max_workers=1):
+        """Expected number of calls, rows, bytes on the wire and seconds for fetching the parts."""
+        return {
+            'calls': len(self.parts),
+            'rows': self.rows,
+            'bytes': self.rows * WIRE_BYTES_PER_ROW,
+            'seconds': estimate_seconds([part.rows or 0 for part in self.parts], self.latency, rate, max_workers),
+            'probes': self.probes,
+            'unknown_parts': len(self.unknown),
+        }
+
+
+def estimate_seconds(part_rows, latency, rate=None, max_workers=1):
+    """Download time of parts with ``part_rows`` rows: bound by the workers or by the request rate."""
+    if not part_rows:
+        return 0.0
+    durations = [latency + rows / ROWS_PER_SECOND for rows in part_rows]
+    seconds = max(max(durations), sum(durations) / max(1, max_workers))
+    if rate:
+        seconds = max(seconds, (len(part_rows) - 1) / rate + durations[-1])
+    return seconds
+
+
+def _probe(count, part):
+    start_time = time.time()
+    try:
+        return Part(part.unit, rows=int(count(part.unit))), time.time() - start_time
+    except Exception as e:
+        return Part(part.unit, error=str(e)), time.time() - start_time
+
+
+def probe_parts(units, count, split, max_records, max_workers=1, rate=None):
+    """
+    Probe ``units`` with ``count(unit)`` and split them until every part fits.
+
+    ``split(unit)`` returns the halves of a unit, or ``[unit]`` when it cannot be
+    split. Returns a ``SizingPlan`` with the parts in their original order; units
+    without rows are listed in ``empty`` instead, as they need no request.
+    """
+    max_rows = int(max_records * FILL)
+    plan = SizingPlan([], max_rows)
+    finished = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        pending = {submit_in_context(pool, _probe, count, Part(unit)): (i,) for i, unit in enumerate(units)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                order = pending.pop(future)
+                part, elapsed = future.result()
+                plan.probes += 1
+                plan.probe_seconds.append(elapsed)
+                halves = split(part.unit) if part.rows is not None and part.rows >= max_rows else [part.unit]
+                if len(halves) > 1:
+                    for j, half in enumerate(halves):
+                        pending[submit_in_context(pool, _probe, count, Part(half))] = order + (j,)
+                else:
+                    finished[order] = part
+    ordered = [finished[order] for order in sorted(finished)]
+    plan.parts = [part for part in ordered if part.rows != 0]
+    plan.empty = [part.unit for part in ordered if part.rows == 0]
+    spread(plan, split, rate, max_workers)
+    return plan
+
+
+def spread(plan, split, rate=None, max_workers=1):
+    """Halve the largest parts while there are idle workers and it makes the estimated download shorter."""
+    while len(plan.parts) < max_workers:
+        index = max(range(len(plan.parts)), key=lambda i: plan.parts[i].rows or 0, default=None)
+        if index is None or (plan.parts[index].rows or 0) < 2 * MIN_PARALLEL_ROWS:
+            return plan
+        halves = split(plan.parts[index].unit)
+        if len(halves) < 2:
+            return plan
+        rows = plan.parts[index].rows
+        parts = [Part(half, rows=math.ceil(rows / len(halves))) for half in halves]
+        candidate = plan.parts[:index] + parts + plan.parts[index + 1:]
+        before = estimate_seconds([part.rows or 0 for part in plan.parts], plan.latency, rate, max_workers)
+        after = estimate_seconds([part.rows or 0 for part in candidate], plan.latency, rate, max_workers)
+        if after >= before:
+            return plan
+        plan.parts = candidate
+    return plan
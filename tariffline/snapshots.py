@@ -0,0 +1,183 @@
+"""
+Content-addressed store of immutable dataset snapshots shared by all users.
+
+Every fetch result is kept as its own Parquet file, named after a hash of the
+query and of the data, so identical results are stored once and a snapshot is
+never rewritten after it has been published. Files are written under a
+temporary name and moved into place; the index of what exists is a SQLite
+table, so concurrent writers and readers never see a partial snapshot.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+
+from tariffline.aggregations import dataset_fingerprint
+from tariffline.cube import cube_path
+from tariffline.fetch import DEFAULT_QUERY
+from tariffline.storage import load_dataset, load_mapped, save_parquet
+
+
+DEFAULT_SNAPSHOT_DIR = os.path.join('.cache', 'snapshots')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    query TEXT NOT NULL,
+    query_key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    metadata TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+_COLUMNS = "id, kind, query, query_key, fingerprint, rows, size, metadata, created_at"
+
+
+def query_key(kind, query):
+    """Hash of a query, identical for requests that ask for the same data."""
+    payload = json.dumps({'kind': kind, 'query': query}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def fetch_query(commodity_code, periods, **query):
+    """Canonical description of a single-commodity fetch, so the app and the CLI describe it alike."""
+    query = {**DEFAULT_QUERY, **{k: v for k, v in query.items() if k in DEFAULT_QUERY}}
+    query['reporterCode'] = int(query['reporterCode'])
+    return {**query, 'commodity_code': commodity_code, 'periods': [str(p) for p in periods]}
+
+
+def make_snapshot_id(key, fingerprint):
+    return hashlib.sha256(f"{key}:{fingerprint}".encode('utf-8')).hexdigest()[:24]
+
+
+@dataclass
+class Snapshot:
+    id: str
+    kind: str
+    query: dict
+    query_key: str
+    fingerprint: str
+    rows: int
+    size: int
+    metadata: dict = field(repr=False)
+    created_at: float
+    path: str = None
+
+    @property
+    def label(self):
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.created_at))
+        codes = self.query.get('commodity_code') or ",".join(self.query.get('commodity_codes', []))
+        periods = self.query.get('periods') or []
+        covered = f" {periods[0]}-{periods[-1]}" if periods else ""
+        return f"{created} · {self.kind} {codes}{covered} · {self.rows} rows"
+
+
+class SnapshotStore:
+    """
+    Snapshots live in ``objects/<id[:2]>/<id>.parquet`` under ``root`` (with their
+    aggregation cube next to them) and are listed in ``index.sqlite``.
+    """
+
+    def __init__(self, root=DEFAULT_SNAPSHOT_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS snapshots_query ON snapshots (query_key, created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=30)
+
+    def object_path(self, snapshot_id):
+        return os.path.join(self.root, 'objects', snapshot_id[:2], f'{snapshot_id}.parquet')
+
+    def _snapshot(self, row):
+        snapshot = Snapshot(*row[:2], json.loads(row[2]), *row[3:7], json.loads(row[7]), row[8])
+        snapshot.path = self.object_path(snapshot.id)
+        return snapshot
+
+    def add(self, path, kind, query, metadata=None):
+        """
+        Store the dataset at ``path`` (Parquet or legacy JSON) as a snapshot of ``query``.
+
+        Returns the ``Snapshot``. If the same query already produced the same data,
+        the existing snapshot is returned and nothing is written.
+        """
+        data_df, stored_metadata = load_dataset(path)
+        metadata = metadata if metadata is not None else stored_metadata
+        key = query_key(kind, query)
+        fingerprint = dataset_fingerprint(data_df)
+        snapshot_id = make_snapshot_id(key, fingerprint)
+
+        existing = self.get(snapshot_id)
+        if existing is not None and os.path.exists(existing.path):
+            return existing
+
+        target = self.object_path(snapshot_id)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if path.endswith('.json'):
+            save_parquet(data_df, tmp_path, metadata)
+        else:
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+        if not path.endswith('.json') and os.path.exists(cube_path(path)):
+            shutil.copyfile(cube_path(path), f"{tmp_path}.npz")
+            os.replace(f"{tmp_path}.npz", cube_path(target))
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"INSERT OR IGNORE INTO snapshots ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (snapshot_id, kind, json.dumps(query, sort_keys=True, default=str), key, fingerprint,
+                 len(data_df), os.path.getsize(target), json.dumps(metadata, ensure_ascii=False, default=str),
+                 time.time())
+            )
+        return self.get(snapshot_id)
+
+    def get(self, snapshot_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+        return self._snapshot(row) if row else None
+
+    def list(self, kind=None, limit=None):
+        """Snapshots in the index, newest first."""
+        sql = f"SELECT {_COLUMNS} FROM snapshots"
+        params = []
+        if kind is not None:
+            sql += " WHERE kind = ?"
+            params.append(kind)
+        sql += " ORDER BY created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with closing(self._connect()) as conn:
+            return [self._snapshot(row) for row in conn.execute(sql, params).fetchall()]
+
+    def latest(self, kind, query, max_age=None):
+        """Newest snapshot produced by exactly this query, or None; only if at most ``max_age`` seconds old."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM snapshots WHERE query_key = ? AND created_at >= ? "
+                f"ORDER BY created_at DESC LIMIT 1",
+                (query_key(kind, query), time.time() - max_age if max_age is not None else 0)
+            ).fetchone()
+        snapshot = self._snapshot(row) if row else None
+        return snapshot if snapshot is not None and os.path.exists(snapshot.path) else None
+
+    def load(self, snapshot_id, columns=None):
+        """Rows and metadata of a snapshot, read through its memory-mapped Arrow copy."""
+        return load_mapped(self.object_path(snapshot_id), columns=columns)
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM snapshots").fetchone()
+        return {'snapshots': count, 'bytes': size}
@@ -0,0 +1,246 @@
+"""
+Columnar (Parquet) storage for tariff-line datasets, with JSON kept as an export format.
+
+Readers that keep a dataset open (the app) go through an uncompressed Arrow IPC
+copy stored next to it, which is memory-mapped instead of read: see ``load_mapped``.
+"""
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from tariffline.profiling import span
+from tariffline.schema import CATEGORICAL_COLUMNS, normalize, to_wire
+
+
+METADATA_KEY = b'tariffline.metadata'
+
+ARROW_SUFFIX = '.arrow'
+
+def save_parquet(data_df, path, metadata=None, compression='zstd'):
+    """Write ``data_df`` to a Parquet file, keeping ``metadata`` in the file's schema metadata."""
+    with span('persist.parquet', rows=len(data_df)):
+        table = pa.Table.from_pandas(normalize(data_df), preserve_index=False)
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[METADATA_KEY] = json.dumps(metadata or {}, ensure_ascii=False).encode('utf-8')
+        table = table.replace_schema_metadata(schema_metadata)
+
+        # Write next to the target first so readers never see a half-written file
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression=compression)
+        os.replace(tmp_path, path)
+
+
+def _arrow_field(field):
+    # Categoricals are written as plain values, since every chunk has its own dictionary;
+    # columns that are entirely null in the first chunk (even as categoricals) are assumed to hold strings
+    if pa.types.is_dictionary(field.type):
+        field = field.with_type(field.type.value_type)
+    if pa.types.is_null(field.type):
+        return field.with_type(pa.string())
+    return field
+
+
+def _arrow_schema(table):
+    return pa.schema([_arrow_field(field) for field in table.schema])
+
+
+def _conform(table, schema):
+    columns = [
+        table.column(field.name).cast(field.type) if field.name in table.column_names
+        else pa.nulls(len(table), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class ParquetAppender:
+    """
+    Append DataFrame chunks to a Parquet file, one row group per chunk.
+
+    The schema is taken from the first chunk; later chunks are cast to it, with
+    missing columns filled with nulls. Strings are written plain and dictionary
+    encoded by Parquet itself, and loaded back as categoricals. The file is
+    written under a temporary name and moved into place on ``close``, so readers
+    never see a partial dataset. Use as a context manager; the file is discarded
+    if the block raises.
+    """
+
+    def __init__(self, path, compression='zstd'):
+        self.path = path
+        self.compression = compression
+        self.rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+
+    def write(self, data_df):
+        if data_df is None or data_df.empty:
+            return
+        with span('persist.append', rows=len(data_df)):
+            table = pa.Table.from_pandas(data_df, preserve_index=False)
+            if self._writer is None:
+                schema = _arrow_schema(table).remove_metadata()
+                self._writer = pq.ParquetWriter(self._tmp_path, schema, compression=self.compression)
+            self._writer.write_table(_conform(table, self._writer.schema))
+        self.rows += len(table)
+
+    def close(self, metadata=None):
+        """Finish the file with ``metadata`` and move it into place. Returns the number of rows written."""
+        if self._writer is None:
+            # Nothing was written: store an empty dataset so the metadata is still kept
+            save_parquet(pd.DataFrame(), self.path, metadata)
+            return 0
+        self._writer.add_key_value_metadata({METADATA_KEY: json.dumps(metadata or {}, ensure_ascii=False)})
+        self._writer.close()
+        self._writer = None
+        os.replace(self._tmp_path, self.path)
+        return self.rows
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif self._writer is not None:
+            self.close()
+
+
+def load_parquet(path, columns=None, filters=None):
+    """
+    Load a stored dataset, reading only ``columns`` and the row groups matching ``filters``.
+
+    ``filters`` uses the pyarrow syntax, e.g. ``[('period', '>=', 202101)]``.
+    Descriptor columns are always returned as categoricals.
+    """
+    available = pq.read_schema(path).names
+    if columns is not None:
+        columns = [c for c in columns if c in available]
+    read_dictionary = [c for c in CATEGORICAL_COLUMNS if c in available and (columns is None or c in columns)]
+    with span('load.parquet', path=path):
+        table = pq.read_table(path, columns=columns, filters=filters, read_dictionary=read_dictionary)
+        # Files written before the declared schema are brought up to it here
+        return normalize(table.to_pandas())
+
+
+def read_metadata(path):
+    """Return the metadata block stored with a dataset without reading any rows."""
+    if path.endswith('.json'):
+        return load_json(path, columns=[])[1]
+    key_value_metadata = pq.read_metadata(path).metadata or {}
+    raw = key_value_metadata.get(METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def export_json(data_df, path, metadata=None):
+    """Write the legacy ``{'metadata': ..., 'data': [...]}`` JSON file."""
+    with span('persist.json', rows=len(data_df)), open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'metadata': metadata or {},
+            'data': to_wire(data_df).to_dict(orient='records')
+        }, f, ensure_ascii=False, indent=4)
+
+
+def load_json(path, columns=None):
+    """Load a legacy JSON dataset and its metadata."""
+    with span('load.json', path=path):
+        with open(path, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+        data_df = pd.DataFrame(json_data.get('data', []))
+        if columns is not None:
+            data_df = data_df[[c for c in columns if c in data_df.columns]]
+        data_df = normalize(data_df)
+    return data_df, json_data.get('metadata', {})
+
+
+def load_dataset(path, columns=None, filters=None):
+    """Load a dataset and its metadata from either a Parquet or a legacy JSON file."""
+    if path.endswith('.json'):
+        return load_json(path, columns=columns)
+    return load_parquet(path, columns=columns, filters=filters), read_metadata(path)
+
+
+def arrow_path(data_path):
+    """Location of the memory-mappable Arrow copy of the dataset at ``data_path``."""
+    return data_path + ARROW_SUFFIX
+
+
+def _arrow_is_fresh(data_path):
+    path = arrow_path(data_path)
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(data_path)
+
+
+def build_arrow_file(data_path):
+    """
+    Write the Arrow IPC copy of the dataset at ``data_path`` (Parquet or legacy JSON).
+
+    The copy is uncompressed, so its buffers can be used straight from the mapped
+    file; it trades disk space for opening without parsing or decompressing.
+    """
+    data_df, metadata = load_dataset(data_path)
+    table = pa.Table.from_pandas(data_df, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[METADATA_KEY] = json.dumps(metadata or {}, ensure_ascii=False).encode('utf-8')
+    table = table.replace_schema_metadata(schema_metadata)
+
+    path = arrow_path(data_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with span('persist.arrow', rows=len(data_df)):
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+    return path
+
+
+def open_arrow(data_path):
+    """Memory-mapped Arrow table of a dataset; the Arrow copy is (re)built if missing or older than the dataset."""
+    if not _arrow_is_fresh(data_path):
+        build_arrow_file(data_path)
+    with span('load.arrow', path=data_path):
+        return pa.ipc.open_file(pa.memory_map(arrow_path(data_path), 'r')).read_all()
+
+
+def load_mapped(data_path, columns=None):
+    """
+    Dataset and metadata read through its memory-mapped Arrow copy.
+
+    Numeric columns without nulls reference the mapped pages instead of being
+    copied onto the heap, so every reader of the same file in the process shares
+    them with the OS page cache. String and categorical columns, and numeric
+    columns with nulls, are still converted into heap copies. The returned frame
+    must be treated as read-only.
+    """
+    table = open_arrow(data_path)
+    raw = (table.schema.metadata or {}).get(METADATA_KEY)
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+    with span('load.to_pandas', path=data_path):
+        data_df = table.to_pandas(split_blocks=True)
+    return data_df, json.loads(raw) if raw else {}
+
+
+def dataset_head(path, n=10):
+    """
+    First ``n`` rows of a dataset, reading only what holds them: a slice of the
+    mapped Arrow copy if there is one, otherwise the first Parquet row group.
+    A legacy JSON file still has to be parsed in full.
+    """
+    if _arrow_is_fresh(path):
+        return open_arrow(path).slice(0, n).to_pandas()
+    if path.endswith('.json'):
+        return load_json(path)[0].head(n)
+    with span('load.head', path=path):
+        batch = next(pq.ParquetFile(path).iter_batches(batch_size=n), None)
+        if batch is None:
+            return pd.DataFrame()
+        return normalize(batch.to_pandas())
@@ -0,0 +1,148 @@
+"""Incremental refresh of a stored dataset: fetch only new periods plus a revision window."""
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from tariffline.cube import TariffCube, cube_path
+from tariffline.defaults import DEFAULT_REVISION_MONTHS
+from tariffline.fetch import DEFAULT_QUERY, fetch_tariff_lines
+from tariffline.periods import current_period, period_range, shift_period
+from tariffline.schema import concat_frames, to_wire
+from tariffline.storage import load_dataset, read_metadata, save_parquet
+
+
+# Natural key of a sync unit. Tariff lines themselves are not unique on any published
+# column (national sub-codes are not exposed), so a refetched unit replaces all its rows.
+NATURAL_KEY = ['reporterCode', 'flowCode', 'cmdCode', 'period']
+
+WATERMARKS_KEY = 'sync_watermarks'
+
+# Metadata fields describing what a dataset holds, kept when a sync rewrites it; the
+# rest (timings, chunk counts) described the run that wrote it before
+QUERY_FIELDS = ('commodity_code', 'commodity_codes', 'reporter_codes', 'flow_codes')
+
+
+def watermark_key(reporter_code, flow_code, cmd_code):
+    return f"{reporter_code}/{flow_code}/{cmd_code}"
+
+
+def synced_periods(metadata):
+    """Every period requested by the last sync recorded in ``metadata``."""
+    requested = metadata['last_sync']['requested_periods']
+    return period_range(*requested) if requested else []
+
+
+class WatermarkTracker:
+    """Tracks the latest ``period`` and ``refPeriodId`` per (reporter, flow, commodity) of the rows it sees."""
+
+    def __init__(self, watermarks=None):
+        self.watermarks = dict(watermarks or {})
+
+    def update(self, data_df):
+        if data_df is None or data_df.empty or 'period' not in data_df.columns:
+            return
+        columns = ['reporterCode', 'flowCode', 'cmdCode']
+        ref = 'refPeriodId' if 'refPeriodId' in data_df.columns else 'period'
+        data_df = to_wire(data_df[columns + ['period'] + ([ref] if ref != 'period' else [])])
+        latest = data_df.groupby(columns, observed=True).agg(period=('period', 'max'), refPeriodId=(ref, 'max'))
+        for (reporter_code, flow_code, cmd_code), row in latest.iterrows():
+            key = watermark_key(reporter_code, flow_code, cmd_code)
+            previous = self.watermarks.get(key, {})
+            self.watermarks[key] = {
+                'period': max(int(row['period']), previous.get('period', 0)),
+                'refPeriodId': max(int(row['refPeriodId']), previous.get('refPeriodId', 0)),
+            }
+
+    def get(self, reporter_code, flow_code, cmd_code):
+        return self.watermarks.get(watermark_key(reporter_code, flow_code, cmd_code))
+
+
+def stored_watermarks(path):
+    """
+    Watermarks of a stored dataset. They are read from its metadata when present;
+    otherwise only the key and period columns are scanned.
+    """
+    if not os.path.exists(path):
+        return WatermarkTracker()
+    watermarks = read_metadata(path).get(WATERMARKS_KEY)
+    if watermarks:
+        return WatermarkTracker(watermarks)
+    tracker = WatermarkTracker()
+    tracker.update(load_dataset(path, columns=['reporterCode', 'flowCode', 'cmdCode', 'period', 'refPeriodId'])[0])
+    return tracker
+
+
+def upsert(existing_df, new_df, refetched_units):
+    """
+    Merge ``new_df`` into ``existing_df`` by natural key.
+
+    Every (reporter, flow, commodity, period) in ``refetched_units`` is replaced as a
+    whole by the rows of ``new_df``, so lines dropped in a revision disappear too.
+    """
+    if existing_df.empty:
+        return new_df.reset_index(drop=True)
+    if new_df.empty and not refetched_units:
+        return existing_df
+
+    refetched = {tuple(map(str, unit)) for unit in refetched_units}
+    existing_units = zip(*(existing_df[c].astype(str) for c in NATURAL_KEY))
+    keep = [unit not in refetched for unit in existing_units]
+
+    merged = concat_frames([existing_df[keep], new_df])
+    return merged.sort_values(NATURAL_KEY, kind='stable', ignore_index=True)
+
+
+def incremental_sync(api, subscription_key, path, commodity_code, start_period=None, until_period=None,
+                     revision_months=DEFAULT_REVISION_MONTHS, metadata=None, **fetch_kwargs):
+    """
+    Bring the dataset at ``path`` up to ``until_period`` (default: the current month).
+
+    Periods after the stored watermark of (reporter, flow, commodity) are requested,
+    plus the last ``revision_months`` already stored. Without a watermark the sync
+    starts at ``start_period``. The results are upserted into the stored dataset and
+    the new watermark is saved in its metadata, which is rebuilt from the sync: only
+    the ``QUERY_FIELDS`` of the stored metadata are kept.
+
+    Returns the merged DataFrame, its metadata and the ``ChunkResult`` list.
+    """
+    query = {**DEFAULT_QUERY, **{k: v for k, v in fetch_kwargs.items() if k in DEFAULT_QUERY}}
+    reporter_code, flow_code = query['reporterCode'], query['flowCode']
+    until_period = until_period or current_period()
+
+    tracker = stored_watermarks(path)
+    watermark = tracker.get(reporter_code, flow_code, commodity_code)
+    if watermark:
+        first_period = shift_period(watermark['period'], 1 - revision_months)
+    elif start_period:
+        first_period = int(start_period)
+    else:
+        raise ValueError(f"No stored data for {watermark_key(reporter_code, flow_code, commodity_code)}; "
+                         f"a start period is required for the first sync")
+
+    periods = period_range(first_period, until_period)
+    new_df, results = fetch_tariff_lines(api, subscription_key, periods, commodity_code, **fetch_kwargs)
+    tracker.update(new_df)
+
+    refetched_units = [(reporter_code, flow_code, commodity_code, period)
+                       for result in results if result.ok for period in result.periods]
+    existing_df, existing_metadata = load_dataset(path) if os.path.exists(path) else (pd.DataFrame(), {})
+    merged = upsert(existing_df, new_df, refetched_units)
+
+    sync_metadata = {
+        **{k: existing_metadata[k] for k in QUERY_FIELDS if k in existing_metadata},
+        **(metadata or {}),
+        'total_rows': len(merged),
+        WATERMARKS_KEY: tracker.watermarks,
+        'last_sync': {
+            'key': watermark_key(reporter_code, flow_code, commodity_code),
+            'requested_periods': [periods[0], periods[-1]] if periods else [],
+            'revision_months': revision_months,
+            'new_rows': len(new_df),
+            'failed_periods': [p for r in results if not r.ok for p in r.periods],
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        },
+    }
+    save_parquet(merged, path, sync_metadata)
+    TariffCube.build(merged).save(cube_path(path))
+    return merged, sync_metadata, results
@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+from tariffline.storage import load_dataset
+
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), '..', 'tariff_data_310520_20250402_171559.json')
+
+
+@pytest.fixture(scope='session')
+def tariff_data():
+    """The bundled Ukraine NPK (310520) imports, 2019-2023."""
+    return load_dataset(FIXTURE_PATH)[0]
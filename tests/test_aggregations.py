@@ -0,0 +1,46 @@
+import numpy as np
+
+from tariffline.aggregations import commodity_rollup, partner_yearly_weight, yearly_value
+from tariffline.cube import TariffCube
+from tariffline.schema import normalize, to_wire
+
+
+def with_years(data_df):
+    return data_df.assign(year=data_df['period'].astype(int) // 100)
+
+
+def test_partner_yearly_weight_matches_groupby(tariff_data):
+    table = partner_yearly_weight(TariffCube.build(tariff_data), n=3)
+
+    data_df = with_years(tariff_data)
+    partners = data_df.groupby('partnerDesc', observed=True)['primaryValue'].sum().nlargest(3).index
+    expected = (data_df[data_df['partnerDesc'].isin(partners)]
+                .groupby(['year', data_df['partnerDesc'].astype(str)])['netWgt'].sum()
+                .unstack().reindex(index=sorted(data_df['year'].unique()), columns=list(partners))
+                .fillna(0) / 1000)
+    assert list(table.columns) == list(partners)
+    np.testing.assert_allclose(table.to_numpy(), expected.to_numpy())
+
+
+def test_yearly_value_matches_groupby(tariff_data):
+    table = yearly_value(TariffCube.build(tariff_data))
+
+    expected = with_years(tariff_data).groupby('year')['primaryValue'].sum()
+    assert table['year'].tolist() == expected.index.tolist()
+    np.testing.assert_allclose(table['primaryValue'], expected.to_numpy())
+
+
+def test_commodity_rollup_matches_groupby(tariff_data):
+    # Spread the fixture over several subheadings of two headings
+    data_df = to_wire(tariff_data)
+    data_df['cmdCode'] = np.array(['310520', '310530', '310420', '310540'])[np.arange(len(data_df)) % 4]
+    data_df = normalize(data_df)
+    cube = TariffCube.build(data_df)
+
+    for level, width in [('heading', 4), ('subheading', 6)]:
+        table = commodity_rollup(cube, level=level)
+        grouped = with_years(data_df).assign(cmd=data_df['cmdCode'].astype(str).str[:width])
+        expected = grouped.groupby(['cmd', 'year'])[['primaryValue', 'netWgt']].sum()
+        assert table.index.tolist() == expected.index.tolist()
+        np.testing.assert_allclose(table.to_numpy(), expected.to_numpy())
+    assert commodity_rollup(cube, level='chapter', by=None).index.tolist() == ['31']
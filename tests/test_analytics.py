@@ -0,0 +1,43 @@
+import numpy as np
+
+from tariffline.analytics import PartnerAnalytics
+from tariffline.cube import TariffCube
+
+
+def grouped(tariff_data, *keys):
+    data_df = tariff_data.assign(period=tariff_data['period'].astype(int),
+                                 year=tariff_data['period'].astype(int) // 100,
+                                 partner=tariff_data['partnerDesc'].astype(str))
+    return data_df.groupby(list(keys))[['primaryValue', 'netWgt']].sum()
+
+
+def test_partner_summary_matches_groupby(tariff_data):
+    summary = PartnerAnalytics.build(TariffCube.build(tariff_data)).partner_summary(n=5)
+
+    totals = grouped(tariff_data, 'partner')
+    top = totals['primaryValue'].nlargest(5)
+    assert summary.index.tolist() == top.index.tolist()
+    np.testing.assert_allclose(summary['primaryValue'], top)
+    np.testing.assert_allclose(summary['netWgt'], totals.loc[top.index, 'netWgt'])
+    np.testing.assert_allclose(summary['share'], top / totals['primaryValue'].sum())
+    np.testing.assert_allclose(summary['unitValue'], top / totals.loc[top.index, 'netWgt'])
+
+    yearly = grouped(tariff_data, 'partner', 'year')['primaryValue'].unstack(fill_value=0)
+    last, previous = yearly.columns[-1], yearly.columns[-2]
+    expected_growth = (yearly[last] / yearly[previous].where(yearly[previous] > 0)) - 1
+    np.testing.assert_allclose(summary['growthLastYear'], expected_growth.loc[top.index])
+
+
+def test_concentration_matches_groupby(tariff_data):
+    analytics = PartnerAnalytics.build(TariffCube.build(tariff_data))
+
+    for grain in ('year', 'period'):
+        by_partner = grouped(tariff_data, grain, 'partner')['primaryValue']
+        shares = by_partner / by_partner.groupby(level=grain).transform('sum')
+        expected = (shares ** 2).groupby(level=grain).sum() * 10000
+
+        hhi = analytics.concentration(grain=grain)
+        # Months without any rows are present in the analytics, without an index
+        assert hhi.drop(expected.index).isna().all()
+        np.testing.assert_allclose(hhi.loc[expected.index], expected)
+        assert hhi.dropna().between(0, 10000).all()
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pandas as pd
+
+from tariffline.cache import PeriodCache
+from tariffline.schema import normalize
+
+
+KEY = (804, 'M', '310520')
+
+
+def rows(period, n=3):
+    return normalize(pd.DataFrame({'period': [int(period)] * n, 'partnerCode': list(range(n)),
+                                   'primaryValue': [1.5] * n}))
+
+
+def test_missing_lists_uncached_periods_in_order(tmp_path):
+    cache = PeriodCache(str(tmp_path / 'cache.sqlite'))
+    cache.put(*KEY, '201901', rows('201901'))
+    # A period without rows is cached too, so it is not requested again
+    cache.put_many(*KEY, ['201902'], pd.DataFrame())
+
+    assert cache.missing(*KEY, ['201903', '201901', '201902', '201904']) == ['201903', '201904']
+    assert cache.missing(804, 'X', '310520', ['201901']) == ['201901']
+    cached, missing = cache.get(*KEY, ['201901', '201902', '201903'])
+    assert len(cached) == 3 and missing == ['201903']
+
+
+def test_recent_periods_expire_before_final_ones(tmp_path):
+    cache = PeriodCache(str(tmp_path / 'cache.sqlite'), recent_ttl=-1, final_ttl=3600)
+    recent = datetime.now().strftime('%Y%m')
+    cache.put(*KEY, recent, rows(recent))
+    cache.put(*KEY, '201901', rows('201901'))
+
+    assert cache.ttl_for(recent) == -1
+    assert cache.ttl_for('201901') == 3600
+    assert cache.missing(*KEY, [recent, '201901']) == [recent]
+    assert cache.evict() == 1
+    assert cache.stats()['periods'] == 1
+
+
+def test_evict_drops_least_recently_used_beyond_max_bytes(tmp_path):
+    cache = PeriodCache(str(tmp_path / 'cache.sqlite'))
+    for period in ['201901', '201902', '201903']:
+        cache.put(*KEY, period, rows(period))
+    size = cache.stats()['bytes'] // 3
+    # Reading 201901 makes 201902 the least recently used period
+    cache.get(*KEY, ['201901'])
+
+    cache.max_bytes = 2 * size
+    assert cache.evict() == 1
+    assert cache.missing(*KEY, ['201901', '201902', '201903']) == ['201902']
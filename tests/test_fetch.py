@@ -0,0 +1,55 @@
+import time
+
+import pandas as pd
+import pytest
+
+from tariffline.client import ApiError
+from tariffline.fetch import fetch_tariff_lines, split_periods
+from tariffline.replay import ReplayClient
+
+
+PERIODS = ['202301', '202302', '202303', '202304', '202305', '202306']
+
+
+class SlowEarlyPeriods:
+    """Replay API whose earlier periods answer later, so chunks complete out of order."""
+
+    def __init__(self, api, failing=()):
+        self.api = api
+        self.failing = set(failing)
+
+    def getTarifflineData(self, subscription_key, **request):
+        if request['period'] in self.failing:
+            raise ApiError(f"HTTP 400: bad period {request['period']}", status=400)
+        time.sleep(0.01 * (len(PERIODS) - PERIODS.index(request['period'].split(',')[0])))
+        return self.api.getTarifflineData(subscription_key, **request)
+
+
+@pytest.fixture
+def api(tariff_data):
+    return ReplayClient(seeds=[tariff_data])
+
+
+@pytest.mark.parametrize('max_workers', [1, 3, 6])
+def test_results_come_back_in_period_order(api, max_workers):
+    data_df, results = fetch_tariff_lines(SlowEarlyPeriods(api), 'key', PERIODS, '310520',
+                                          max_workers=max_workers)
+    assert [r.periods for r in results] == split_periods(PERIODS)
+    assert data_df['period'].is_monotonic_increasing
+
+
+def test_failed_chunk_is_reported_without_dropping_others(api, tariff_data):
+    data_df, results = fetch_tariff_lines(SlowEarlyPeriods(api, failing=['202302']), 'key', PERIODS, '310520',
+                                          max_workers=3)
+    assert [r.periods for r in results if not r.ok] == [['202302']]
+    assert 'HTTP 400' in results[1].error
+    expected = tariff_data['period'].isin([int(p) for p in PERIODS if p != '202302']).sum()
+    assert len(data_df) == expected
+
+
+@pytest.mark.parametrize('chunk', ['month', 'quarter'])
+def test_concurrent_fetch_matches_sequential(api, tariff_data, chunk):
+    sequential, _ = fetch_tariff_lines(api, 'key', PERIODS, '310520', chunk=chunk, max_workers=1)
+    concurrent, _ = fetch_tariff_lines(api, 'key', PERIODS, '310520', chunk=chunk, max_workers=4)
+    assert len(concurrent) == len(sequential) == tariff_data['period'].isin([int(p) for p in PERIODS]).sum()
+    pd.testing.assert_frame_equal(concurrent, sequential)
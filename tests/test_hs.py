@@ -0,0 +1,14 @@
+import pytest
+
+from tariffline.hs import HSIndex
+
+
+def test_expand_lists_every_subheading_of_complete_chapter():
+    codes = HSIndex.load().expand(['31', '870321'])
+    assert len(codes) == 25
+    assert codes[-1] == '870321'
+
+
+def test_expand_refuses_partly_listed_chapter():
+    with pytest.raises(ValueError, match='28'):
+        HSIndex.load().expand(['28'])
@@ -0,0 +1,39 @@
+import itertools
+
+from tariffline.pipeline import run_plan_to_file
+from tariffline.planner import plan_batch, run_plan
+from tariffline.replay import ReplayClient
+from tariffline.scheduler import RequestScheduler
+
+
+def test_plan_covers_matrix_once_with_calls_under_record_limit():
+    reporters = list(range(1, 8))
+    codes = [f"31{i:04d}" for i in range(25)]
+    periods = [f"2023{m:02d}" for m in range(1, 13)] + [f"2024{m:02d}" for m in range(1, 13)]
+    calls = plan_batch(reporters, ['M', 'X'], codes, periods, max_records=5000, rows_per_unit=10)
+
+    assert all(call.estimated_rows < 5000 for call in calls)
+    assert all(len(call.cmd_codes) <= 20 and len(call.reporter_codes) <= 5 and len(call.periods) <= 12
+               for call in calls)
+    covered = [unit for call in calls for unit in itertools.product(call.reporter_codes, call.flow_codes,
+                                                                      call.cmd_codes, call.periods)]
+    assert sorted(covered) == sorted(itertools.product(reporters, ['M', 'X'], codes, periods))
+
+
+def test_calls_at_record_limit_are_split_and_atomic_ones_reported(tmp_path, tariff_data):
+    api = ReplayClient(seeds=[tariff_data])
+    periods = [f"2023{m:02d}" for m in range(1, 13)]
+    counts = tariff_data[tariff_data['period'].between(202301, 202312)].groupby('period').size()
+    limit = 40
+    calls = plan_batch([804], ['M'], ['310520'], periods)
+
+    data_df, results = run_plan(api, 'key', calls, max_records=limit, scheduler=RequestScheduler(rate=1000.0))
+    # Any two months reach the limit, so calls are split down to single months; those still at
+    # the limit can not be split further and are kept truncated
+    assert sorted(r.call.periods for r in results) == [(p,) for p in periods]
+    assert sorted(r.call.periods[0] for r in results if r.truncated) == [str(p) for p in counts.index[counts >= limit]]
+    assert len(data_df) == counts.clip(upper=limit).sum()
+
+    metadata, _ = run_plan_to_file(api, 'key', calls, str(tmp_path / 'batch.parquet'), build_cube=False,
+                                   max_records=limit, scheduler=RequestScheduler(rate=1000.0))
+    assert sorted(metadata['truncated_calls']) == [f"804/M/310520/{p}-{p}" for p in counts.index[counts >= limit]]
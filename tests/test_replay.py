@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from tariffline.client import ApiError, ComtradeClient
+from tariffline.fakeapi import FakeComtradeServer
+from tariffline.fetch import fetch_tariff_lines
+from tariffline.periods import period_range
+from tariffline.replay import RecordingClient, ReplayClient, ResponseArchive
+
+
+PERIODS = period_range(201901, 202312)
+
+
+def test_replayed_fetch_matches_recorded_fetch(tariff_data, tmp_path):
+    archive = ResponseArchive(tmp_path)
+    with FakeComtradeServer(tariff_data) as server:
+        recording = RecordingClient(ComtradeClient(base_url=server.url), archive)
+        recorded_df, _ = fetch_tariff_lines(recording, 'key', PERIODS, '310520', chunk='quarter')
+    assert len(archive) == 20 and len(recorded_df) == len(tariff_data)
+
+    replay = ReplayClient(archives=[ResponseArchive(tmp_path)])
+    replayed_df, results = fetch_tariff_lines(replay, 'key', PERIODS, '310520', chunk='quarter')
+
+    assert all(result.ok for result in results)
+    pd.testing.assert_frame_equal(replayed_df, recorded_df)
+
+
+def test_unrecorded_request_is_not_found(tariff_data, tmp_path):
+    archive = ResponseArchive(tmp_path)
+    recording = RecordingClient(ReplayClient(seeds=[tariff_data]), archive)
+    fetch_tariff_lines(recording, 'key', period_range(201901, 201906), '310520', chunk='quarter')
+
+    replay = ReplayClient(archives=[archive])
+    with pytest.raises(ApiError) as excinfo:
+        replay.getTarifflineData('key', typeCode='C', freqCode='M', clCode='HS', period='202001',
+                                 reporterCode='804', partnerCode=None, partner2Code=None,
+                                 cmdCode='310520', flowCode='M', customsCode=None, motCode=None)
+    assert excinfo.value.status == 404
@@ -0,0 +1,26 @@
+import time
+
+from tariffline.client import ComtradeClient
+from tariffline.fakeapi import FakeComtradeServer
+from tariffline.fetch import fetch_tariff_lines
+from tariffline.scheduler import RequestScheduler
+
+
+def test_throttled_chunks_succeed_after_backoff(tariff_data):
+    backoffs = []
+
+    def sleep(seconds):
+        backoffs.append(seconds)
+        time.sleep(seconds)
+
+    periods = ['202301', '202302', '202303', '202304']
+    with FakeComtradeServer(tariff_data, rate=2.0) as server:
+        scheduler = RequestScheduler(rate=100.0, capacity=100, sleep=sleep)
+        data_df, results = fetch_tariff_lines(ComtradeClient(base_url=server.url), 'key', periods, '310520',
+                                              max_workers=4, scheduler=scheduler)
+        status_counts = dict(server.status_counts)
+
+    assert [r.error for r in results] == [None] * 4
+    assert len(data_df) == tariff_data['period'].isin([int(p) for p in periods]).sum()
+    assert status_counts.get(429, 0) > 0
+    assert any(seconds >= 1.0 for seconds in backoffs)
@@ -0,0 +1,40 @@
+from tariffline.client import ComtradeClient
+from tariffline.fakeapi import FakeComtradeServer
+from tariffline.fetch import AUTO_CHUNK, fetch_tariff_lines, size_periods
+from tariffline.periods import period_range
+from tariffline.sizing import FILL
+
+
+PERIODS = period_range(201901, 202312)
+
+
+def test_probed_parts_stay_under_record_limit(tariff_data):
+    counts = tariff_data.groupby(tariff_data['period'].astype(str)).size()
+    with FakeComtradeServer(tariff_data, max_records=200) as server:
+        plan = size_periods(ComtradeClient(base_url=server.url), 'key', PERIODS, '310520', max_records=200)
+
+    assert plan.parts and all(part.rows < 200 * FILL for part in plan.parts)
+    assert all(part.rows == counts.reindex(part.unit, fill_value=0).sum() for part in plan.parts)
+    # Every period is in exactly one part, or listed as empty
+    assert sorted(p for unit in plan.units + plan.empty for p in unit) == PERIODS
+    assert all(counts.reindex(unit, fill_value=0).sum() == 0 for unit in plan.empty)
+    assert plan.rows == len(tariff_data)
+    assert not plan.oversized and not plan.unknown
+
+
+def test_single_periods_over_the_limit_are_reported_oversized(tariff_data):
+    counts = tariff_data.groupby(tariff_data['period'].astype(str)).size()
+    with FakeComtradeServer(tariff_data) as server:
+        plan = size_periods(ComtradeClient(base_url=server.url), 'key', PERIODS, '310520', max_records=50)
+
+    assert sorted(part.unit[0] for part in plan.oversized) == counts.index[counts >= 50 * FILL].tolist()
+    assert all(len(part.unit) == 1 for part in plan.oversized)
+    assert all(part.rows < 50 * FILL for part in plan.parts if part not in plan.oversized)
+
+
+def test_auto_chunks_fetch_every_row_from_capped_server(tariff_data):
+    with FakeComtradeServer(tariff_data, max_records=200) as server:
+        data_df, results = fetch_tariff_lines(ComtradeClient(base_url=server.url), 'key', PERIODS, '310520',
+                                              chunk=AUTO_CHUNK, max_records=200)
+    assert all(result.ok for result in results)
+    assert len(data_df) == len(tariff_data)
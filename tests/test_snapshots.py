@@ -0,0 +1,16 @@
+from tariffline.snapshots import SnapshotStore, fetch_query
+from tariffline.storage import save_parquet
+
+
+def test_latest_finds_recent_snapshot_of_same_query(tmp_path, tariff_data):
+    path = str(tmp_path / 'data.parquet')
+    save_parquet(tariff_data, path, {'commodity_code': '310520'})
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    query = fetch_query('310520', ['202301', '202302'])
+    snapshot = store.add(path, 'fetch', query)
+
+    assert store.latest('fetch', fetch_query('310520', ['202301', '202302'])).id == snapshot.id
+    assert store.latest('fetch', query, max_age=3600).id == snapshot.id
+    assert store.latest('fetch', query, max_age=-1) is None
+    assert store.latest('sync', query) is None
+    assert store.latest('fetch', fetch_query('310520', ['202301'])) is None
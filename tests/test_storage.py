@@ -0,0 +1,19 @@
+import pandas as pd
+
+from tariffline.schema import normalize
+from tariffline.storage import ParquetAppender, load_parquet
+
+
+def test_append_keeps_values_of_column_null_in_first_chunk(tmp_path):
+    path = str(tmp_path / 'data.parquet')
+    first = normalize(pd.DataFrame({'period': [202301, 202302], 'cmdDesc': [None, None],
+                                    'primaryValue': [1.0, 2.0]}))
+    second = normalize(pd.DataFrame({'period': [202303, 202304], 'cmdDesc': ['x', 'y'],
+                                     'primaryValue': [3.0, 4.0]}))
+    with ParquetAppender(path) as appender:
+        appender.write(first)
+        appender.write(second)
+
+    loaded = load_parquet(path)
+    assert loaded['cmdDesc'].isna().tolist() == [True, True, False, False]
+    assert loaded['cmdDesc'].astype(object).tolist()[2:] == ['x', 'y']
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from tariffline.pipeline import fetch_to_file
+from tariffline.replay import ReplayClient
+from tariffline.schema import normalize
+from tariffline.storage import load_dataset
+from tariffline.sync import NATURAL_KEY, WATERMARKS_KEY, incremental_sync, synced_periods, upsert
+
+
+def units(period, n, value):
+    return normalize(pd.DataFrame({'reporterCode': [804] * n, 'flowCode': ['M'] * n, 'cmdCode': ['310520'] * n,
+                                   'period': [period] * n, 'partnerCode': list(range(n)),
+                                   'primaryValue': [value] * n}))
+
+
+def test_upsert_replaces_refetched_units_as_a_whole():
+    existing = pd.concat([units(202301, 3, 1.0), units(202302, 2, 1.0)], ignore_index=True)
+    new = pd.concat([units(202302, 1, 2.0), units(202303, 2, 2.0)], ignore_index=True)
+    refetched = [(804, 'M', '310520', '202302'), (804, 'M', '310520', '202303')]
+
+    merged = upsert(existing, new, refetched)
+    assert merged.groupby('period')['partnerCode'].count().to_dict() == {202301: 3, 202302: 1, 202303: 2}
+    assert not merged.duplicated(NATURAL_KEY + ['partnerCode']).any()
+    assert merged.loc[merged['period'] == 202302, 'primaryValue'].tolist() == [2.0]
+
+
+def test_sync_advances_watermark_and_rebuilds_metadata(tmp_path, tariff_data):
+    path = str(tmp_path / 'data.parquet')
+    first_half = tariff_data[tariff_data['period'].between(202301, 202306)]
+    fetch_to_file(ReplayClient(seeds=[first_half]), 'key', [str(p) for p in range(202301, 202307)], '310520',
+                  path, metadata={'commodity_code': '310520'})
+
+    # The reporter revised May 2023 since the first fetch
+    revised = tariff_data[tariff_data['period'].between(202301, 202312)].copy()
+    revised['primaryValue'] = revised['primaryValue'].where(revised['period'] != 202305, 1.0)
+    merged, metadata, _ = incremental_sync(ReplayClient(seeds=[revised]), 'key', path, '310520',
+                                           until_period=202312, revision_months=2)
+
+    assert synced_periods(metadata) == [str(p) for p in range(202305, 202313)]
+    assert metadata[WATERMARKS_KEY]['804/M/310520']['period'] == 202312
+    assert metadata['commodity_code'] == '310520'
+    assert 'execution_time' not in metadata and 'chunks' not in metadata
+    stored, stored_metadata = load_dataset(path)
+    assert stored_metadata == metadata
+    assert len(stored) == len(revised)
+    assert (stored.loc[stored['period'] == 202305, 'primaryValue'] == 1.0).all()